@@ -91,6 +91,22 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+        # wait for locks instead of failing, e.g. when syncing users in parallel
+        "OPTIONS": {"timeout": 20},
+    }
+}
+
+
+# Cache, e.g. of dashboards
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Shared between processes, so commands like sync_google invalidate dashboards
+# cached by the web server. Create the table with ./manage.py createcachetable.
+# Dashboards are not cached with a cache local to a process like LocMemCache.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "networking_cache",
     }
 }
 
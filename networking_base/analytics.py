@@ -0,0 +1,175 @@
+import typing
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+from networking_base.models import (
+    CONTACT_CHUNK_SIZE,
+    Contact,
+    ContactInteractionWeek,
+    Interaction,
+    InteractionSource,
+    InteractionWeek,
+    add_interaction_counts,
+    get_week,
+)
+
+ANALYTICS_WEEKS_DEFAULT = 12
+ANALYTICS_CONTACTS_LIMIT = 20
+
+
+def get_interaction_analytics(
+    user, weeks=ANALYTICS_WEEKS_DEFAULT, contacts_limit=ANALYTICS_CONTACTS_LIMIT
+) -> typing.Dict[str, list]:
+    """
+    Get the interaction volume of a user per week and per contact by source.
+    Served from the weekly rollups, so the cost does not depend on the number
+    of interactions.
+    :param user: user
+    :param weeks: number of weeks up to and including the current one
+    :param contacts_limit: number of contacts, most interactions first
+    :return: weeks (oldest first) and contacts with total and count per source
+    """
+    week_current = get_week(timezone.now())
+    week_first = week_current - timedelta(weeks=weeks - 1)
+
+    counts_by_week = {
+        week_first + timedelta(weeks=i): _get_source_counts() for i in range(weeks)
+    }
+    interaction_weeks = InteractionWeek.objects.filter(
+        user=user, week__gte=week_first, week__lte=week_current
+    ).values_list("week", "source", "interaction_count")
+    for week, source, count in interaction_weeks:
+        counts_by_week[week][source] += count
+
+    counts_by_contact = defaultdict(_get_source_counts)
+    contact_weeks = (
+        ContactInteractionWeek.objects.filter(
+            user=user, week__gte=week_first, week__lte=week_current
+        )
+        .values("contact_id", "source")
+        .annotate(count=Sum("interaction_count"))
+        .values_list("contact_id", "source", "count")
+    )
+    for contact_id, source, count in contact_weeks:
+        counts_by_contact[contact_id][source] += count
+
+    contact_ids_top = sorted(
+        counts_by_contact, key=lambda c: (-sum(counts_by_contact[c].values()), c)
+    )[:contacts_limit]
+    contact_names = dict(
+        Contact.objects.filter(id__in=contact_ids_top).values_list("id", "name")
+    )
+
+    return {
+        "weeks": [
+            {"week": week.isoformat(), **_get_totals(counts)}
+            for week, counts in counts_by_week.items()
+        ],
+        "contacts": [
+            {
+                "id": contact_id,
+                "name": contact_names[contact_id],
+                **_get_totals(counts_by_contact[contact_id]),
+            }
+            for contact_id in contact_ids_top
+        ],
+    }
+
+
+def update_interaction_weeks(changes):
+    """
+    Apply changed interactions to the weekly interaction counts of their users.
+    Only the affected weeks are touched and counts are adjusted in place,
+    see rebuild_interaction_weeks to re-compute them from all interactions.
+    :param changes: tuples of user id, date and source of an interaction
+        and 1 if it was added or -1 if it was removed
+    """
+    weeks = Counter()
+    for user_id, was_at, source, count in changes:
+        weeks[user_id, get_week(was_at), source] += count
+
+    with transaction.atomic():
+        add_interaction_counts(InteractionWeek, ["user_id", "week", "source"], weeks)
+        user_ids_removed = {key[0] for key, count in weeks.items() if count < 0}
+        if user_ids_removed:
+            InteractionWeek.objects.filter(
+                user_id__in=user_ids_removed, interaction_count=0
+            ).delete()
+
+
+def update_contact_interaction_weeks(contact_ids):
+    """
+    Re-compute the weekly interaction counts of the given contacts from all their
+    interactions, see update_contact_interaction_counts for single changes.
+    :param contact_ids: ids of the contacts to update
+    """
+    contact_ids = list(contact_ids)
+    counts = (
+        Interaction.contacts.through.objects.filter(contact_id__in=contact_ids)
+        .annotate(week=_truncate_week("interaction__was_at"))
+        .values("contact_id", "contact__user_id", "week", "interaction__source")
+        .annotate(count=Count("id"))
+    )
+    contact_weeks = [
+        ContactInteractionWeek(
+            contact_id=row["contact_id"],
+            user_id=row["contact__user_id"],
+            week=row["week"],
+            source=row["interaction__source"],
+            interaction_count=row["count"],
+        )
+        for row in counts
+    ]
+
+    with transaction.atomic():
+        ContactInteractionWeek.objects.filter(contact_id__in=contact_ids).delete()
+        ContactInteractionWeek.objects.bulk_create(contact_weeks, batch_size=500)
+
+
+def rebuild_interaction_weeks(user):
+    """
+    Re-compute all weekly interaction counts of a user and their contacts,
+    e.g. after interactions were inserted in bulk.
+    :param user: user
+    """
+    counts = (
+        Interaction.objects.filter(user=user)
+        .annotate(week=_truncate_week("was_at"))
+        .values("week", "source")
+        .annotate(count=Count("id"))
+    )
+    interaction_weeks = [
+        InteractionWeek(
+            user=user,
+            week=row["week"],
+            source=row["source"],
+            interaction_count=row["count"],
+        )
+        for row in counts
+    ]
+
+    with transaction.atomic():
+        InteractionWeek.objects.filter(user=user).delete()
+        InteractionWeek.objects.bulk_create(interaction_weeks, batch_size=500)
+
+        contact_ids = Contact.objects.filter(user=user).values_list("id", flat=True)
+        contact_ids = list(contact_ids)
+        for i in range(0, len(contact_ids), CONTACT_CHUNK_SIZE):
+            update_contact_interaction_weeks(contact_ids[i : i + CONTACT_CHUNK_SIZE])
+
+
+def _truncate_week(field):
+    return TruncWeek(field, output_field=DateField(), tzinfo=timezone.utc)
+
+
+def _get_source_counts() -> typing.Dict[str, int]:
+    return {source: 0 for source in InteractionSource.values}
+
+
+def _get_totals(counts) -> dict:
+    return {"total": sum(counts.values()), "sources": counts}
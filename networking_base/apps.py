@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class NetworkingBaseConfig(AppConfig):
     name = "networking_base"
+
+    def ready(self):
+        # register signal handlers
+        from networking_base import signals  # noqa: F401
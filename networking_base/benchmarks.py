@@ -0,0 +1,155 @@
+import statistics
+import time
+import tracemalloc
+import typing
+
+from allauth.socialaccount.models import SocialAccount
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+
+from networking_base.duplicates import rebuild_duplicates
+from networking_base.management.commands.sync_google import GoogleUserSync
+from networking_base.models import ContactInteractionStats, ContactStatus
+from networking_base.seed import insert_seed_data
+from networking_base.signals import defer_contact_updates
+
+BENCHMARK_USERNAME = "benchmark"
+
+# metrics compared against a baseline, see get_regressions
+BENCHMARK_METRICS = ["seconds", "queries", "peak_memory_mb"]
+
+
+def run_benchmarks(
+    contacts=1000, interactions=20000, google=0.2, repeat=3, seed=0, progress=None
+) -> typing.Dict[str, dict]:
+    """
+    Seed a benchmark user and measure the hot paths of the app: pages, updating
+    interactions of stored google items and computing duplicates.
+    Uses the current database, run it on a test database.
+    :param contacts: number of contacts to seed
+    :param interactions: number of interactions to seed
+    :param google: share of interactions with google items, see insert_seed_data
+    :param repeat: runs per benchmark, the median time is reported
+    :param seed: seed of the data
+    :param progress: called with the name and results of each benchmark
+    :return: results by benchmark name, see measure
+    """
+    user = User.objects.create_user(BENCHMARK_USERNAME)
+    insert_seed_data(
+        user,
+        contacts=contacts,
+        interactions=interactions,
+        google=google,
+        seed=seed,
+    )
+
+    client = Client()
+    client.force_login(user)
+    contact_id = (
+        ContactInteractionStats.objects.filter(user=user)
+        .order_by("-interaction_count")
+        .values_list("contact_id", flat=True)
+        .first()
+    )
+    pages = {
+        "dashboard": "/app/",
+        "contacts": "/app/contacts",
+        **{
+            f"contacts_{status.name.lower()}": f"/app/contacts?status={status.value}"
+            for status in ContactStatus
+        },
+        "contact_detail": f"/app/contacts/{contact_id}",
+        "interactions": "/app/interactions",
+        "interaction_analytics": "/app/interactions/analytics",
+    }
+
+    benchmarks = {name: _get_page_benchmark(client, url) for name, url in pages.items()}
+    benchmarks["update_interactions"] = lambda: _update_interactions(user)
+    benchmarks["compute_duplicates"] = lambda: rebuild_duplicates(user)
+
+    results = {}
+    for name, function in benchmarks.items():
+        results[name] = measure(function, repeat)
+        if progress:
+            progress(name, results[name])
+    return results
+
+
+def measure(function, repeat=3) -> typing.Dict[str, float]:
+    """
+    Measure a function.
+    :param function: function without arguments
+    :param repeat: number of timed runs
+    :return: median seconds, queries and peak memory (MB) of a run
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+
+    # separate run, tracing slows down the function
+    queries = 0
+
+    def count_query(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    tracemalloc.start()
+    try:
+        with connection.execute_wrapper(count_query):
+            function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": statistics.median(durations),
+        "queries": queries,
+        "peak_memory_mb": peak / 2**20,
+    }
+
+
+def get_regressions(results, baseline, threshold=0.2) -> typing.List[str]:
+    """
+    Compare results to a baseline.
+    :param results: results, see run_benchmarks
+    :param baseline: earlier results
+    :param threshold: allowed relative increase of each metric
+    :return: descriptions of the metrics exceeding the threshold
+    """
+    regressions = []
+    for name, metrics in results.items():
+        metrics_baseline = baseline.get(name)
+        if not metrics_baseline:
+            continue
+
+        for metric in BENCHMARK_METRICS:
+            value, value_baseline = metrics[metric], metrics_baseline.get(metric)
+            if value_baseline is None or value <= value_baseline * (1 + threshold):
+                continue
+            regressions.append(
+                f"{name}: {metric} {value:.4g} exceeds baseline {value_baseline:.4g}"
+            )
+    return regressions
+
+
+def _get_page_benchmark(client, url):
+    def get_page():
+        # measure the page, not the dashboard cache
+        cache.clear()
+        response = client.get(url)
+        assert response.status_code == 200, f"{url}: {response.status_code}"
+
+    return get_page
+
+
+def _update_interactions(user):
+    # items are stored already, so no api is called
+    gus = GoogleUserSync(user, full=True)
+    gus.social_account = SocialAccount.objects.get(user=user, provider="google")
+    with defer_contact_updates():
+        gus.update_interactions()
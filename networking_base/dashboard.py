@@ -0,0 +1,125 @@
+import typing
+import uuid
+from datetime import datetime
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from networking_base.models import (
+    Contact,
+    get_due_contacts,
+    get_frequent_contacts,
+    get_recent_contacts,
+)
+
+# urgency depends on the current date, so cached lists expire daily
+DASHBOARD_CACHE_TIMEOUT = 24 * 60 * 60
+DASHBOARD_CACHE_PREFIX = "dashboard"
+
+
+def get_dashboard_contacts(user, page=1, per_page=20) -> typing.Dict[str, object]:
+    """
+    Fetch the contact lists of a user's dashboard, cached until the user's
+    contacts or interactions change or the day ends. Not cached if the cache is
+    local to the process, see is_dashboard_cache_shared.
+    :param user: user
+    :param page: page of due contacts, starting at 1
+    :param per_page: due contacts per page
+    :return: contacts (due), has_next_page, contacts_frequent, contacts_recent
+    """
+    if not is_dashboard_cache_shared():
+        return _get_dashboard_contacts(user, page, per_page)
+
+    key = _get_cache_key(user.id, page, per_page)
+    dashboard = cache.get(key)
+    if dashboard is not None:
+        _count("hits")
+        return dashboard
+    _count("misses")
+
+    dashboard = _get_dashboard_contacts(user, page, per_page)
+    cache.set(key, dashboard, DASHBOARD_CACHE_TIMEOUT)
+    return dashboard
+
+
+def invalidate_dashboard(user_ids):
+    """
+    Invalidate the cached dashboards of users, e.g. after their contacts changed.
+    :param user_ids: ids of the users
+    """
+    # cached pages are keyed by a version, so all of them are dropped at once
+    cache.set_many(
+        {_get_version_key(user_id): uuid.uuid4().hex for user_id in set(user_ids)},
+        timeout=None,
+    )
+
+
+def invalidate_dashboard_of_contacts(contact_ids):
+    """
+    Invalidate the cached dashboards of the users owning the given contacts.
+    :param contact_ids: ids of the contacts
+    """
+    contact_ids = set(contact_ids)
+    if not contact_ids:
+        return
+
+    user_ids = Contact.objects.filter(id__in=contact_ids).values_list(
+        "user_id", flat=True
+    )
+    invalidate_dashboard(user_ids.distinct())
+
+
+def get_dashboard_cache_stats() -> typing.Dict[str, int]:
+    """
+    Get the number of dashboard cache hits and misses since the cache was cleared,
+    counted by all processes sharing the cache.
+    :return: hits and misses
+    """
+    keys = {name: f"{DASHBOARD_CACHE_PREFIX}:{name}" for name in ["hits", "misses"]}
+    values = cache.get_many(keys.values())
+    return {name: values.get(key, 0) for name, key in keys.items()}
+
+
+def is_dashboard_cache_shared() -> bool:
+    """
+    Whether the cache is shared between processes, otherwise invalidations of
+    other processes, e.g. sync_google, would not reach the web server.
+    :return: whether the cache is shared
+    """
+    return not isinstance(caches["default"], LocMemCache)
+
+
+def _get_dashboard_contacts(user, page, per_page) -> typing.Dict[str, object]:
+    # fetch one more to know if there is a next page
+    contacts = get_due_contacts(user, limit=per_page + 1, offset=(page - 1) * per_page)
+    return {
+        "contacts": contacts[:per_page],
+        "has_next_page": len(contacts) > per_page,
+        "contacts_frequent": get_frequent_contacts(user),
+        "contacts_recent": get_recent_contacts(user),
+    }
+
+
+def _get_cache_key(user_id, page, per_page) -> str:
+    version_key = _get_version_key(user_id)
+    version = cache.get(version_key)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(version_key, version, timeout=None)
+
+    today = datetime.now().astimezone().date().isoformat()
+    return f"{DASHBOARD_CACHE_PREFIX}:{user_id}:{version}:{today}:{page}:{per_page}"
+
+
+def _get_version_key(user_id) -> str:
+    return f"{DASHBOARD_CACHE_PREFIX}:{user_id}:version"
+
+
+def _count(name):
+    key = f"{DASHBOARD_CACHE_PREFIX}:{name}"
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # evicted in between, losing a count is fine
+        pass
@@ -0,0 +1,684 @@
+import heapq
+import random
+import re
+import typing
+import zlib
+from bisect import bisect_right
+from collections import defaultdict
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    as_completed,
+    wait,
+)
+from difflib import SequenceMatcher
+
+import django
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Q
+
+try:
+    from rapidfuzz.distance import Indel
+    from rapidfuzz.process import cpdist
+except ImportError:  # optional, compiled edit distance
+    cpdist = None
+
+from networking_base.models import Contact, ContactBlockingKey, ContactDuplicate
+
+# contacts with most similar ones are suggested as duplicates
+DUPLICATES_PER_CONTACT = 10
+
+# minhash over character n-grams, pairs sharing any band become candidates
+NGRAM_SIZE = 3
+MINHASH_PERMUTATIONS = 16
+MINHASH_BAND_SIZE = 2
+
+# blocks larger than this (e.g. very common first names) are not paired up
+BLOCK_SIZE_MAX = 500
+
+# fixed seed, so signatures are stable across runs and processes
+_MINHASH_PRIME = (1 << 61) - 1
+_minhash_random = random.Random(42)
+_MINHASH_COEFFICIENTS = [
+    (
+        _minhash_random.randrange(1, _MINHASH_PRIME),
+        _minhash_random.randrange(0, _MINHASH_PRIME),
+    )
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+REGEX_TOKEN_SEPARATOR = re.compile(r"[\W_]+")
+
+# n-gram counts are hashed into vectors of this size to score pairs in bulk
+NGRAM_VECTOR_SIZE = 512
+SCORE_CHUNK_SIZE = 4096
+
+# contact ids or keys per query, stays below the sqlite variable limit
+QUERY_CHUNK_SIZE = 500
+
+# candidate pairs scored at once and rows per insert
+PAIRS_BATCH_SIZE = 20000
+WRITE_BATCH_SIZE = 5000
+
+# users with fewer contacts are scored by a single process
+SHARD_CONTACTS_MIN = 2000
+
+
+def get_contact_similarity(c1, c2):
+    return get_name_similarity(c1.name, c2.name)
+
+
+def get_name_similarity(name1: str, name2: str) -> float:
+    similarity_email = SequenceMatcher(
+        None, name1.split("@")[0], name2.split("@")[0]
+    ).ratio()
+    similarity_name = SequenceMatcher(None, name1, name2).ratio()
+    return max(similarity_email, similarity_name)
+
+
+def get_blocking_keys(name: str) -> typing.Set[str]:
+    """
+    Get the keys of all blocks a contact name belongs to.
+    Only contacts sharing at least one block are compared.
+    :param name: contact name (can be an email)
+    :return: blocking keys
+    """
+    name_clean = " ".join(name.lower().split())
+
+    # tokens, e.g. first and last name, or parts of an email's local part
+    local_part = name_clean.split("@")[0]
+    keys = {
+        f"t:{token}"
+        for token in REGEX_TOKEN_SEPARATOR.split(local_part)
+        if len(token) > 1
+    }
+
+    # bands of a minhash signature to catch typos and similar spellings
+    signature = get_minhash_signature(name_clean)
+    for i in range(0, MINHASH_PERMUTATIONS, MINHASH_BAND_SIZE):
+        band = signature[i : i + MINHASH_BAND_SIZE]
+        keys.add(f"b{i}:" + "-".join(str(h) for h in band))
+
+    return keys
+
+
+def get_minhash_signature(text: str) -> typing.List[int]:
+    """
+    Compute the minhash signature of the character n-grams of a text.
+    :param text: text
+    :return: signature with one hash per permutation
+    """
+    text_padded = f" {text} "
+    ngrams = {
+        text_padded[i : i + NGRAM_SIZE]
+        for i in range(max(len(text_padded) - NGRAM_SIZE + 1, 1))
+    }
+    hashes = [zlib.crc32(ngram.encode()) for ngram in ngrams]
+    return [
+        min((a * h + b) % _MINHASH_PRIME for h in hashes)
+        for a, b in _MINHASH_COEFFICIENTS
+    ]
+
+
+def get_candidate_pairs(contacts) -> typing.Set[typing.Tuple[int, int]]:
+    """
+    Find pairs of contacts that might be duplicates.
+    :param contacts: (id, name) of contacts
+    :return: pairs of contact ids, lower id first
+    """
+    blocks = defaultdict(list)
+    for contact_id, name in contacts:
+        for key in get_blocking_keys(name):
+            blocks[key].append(contact_id)
+    return get_block_pairs(blocks.values())
+
+
+def get_block_pairs(blocks, contact_ids=None) -> typing.Set[typing.Tuple[int, int]]:
+    """
+    Pair up the contacts within each block.
+    :param blocks: lists of contact ids
+    :param contact_ids: only pairs with at least one of these contacts, all if None
+    :return: pairs of contact ids, lower id first
+    """
+    pairs = set()
+    for block in blocks:
+        if len(block) < 2 or len(block) > BLOCK_SIZE_MAX:
+            continue
+        block = sorted(block)
+        for i, contact_id in enumerate(block):
+            for other_contact_id in block[i + 1 :]:
+                if contact_ids is None or (
+                    contact_id in contact_ids or other_contact_id in contact_ids
+                ):
+                    pairs.add((contact_id, other_contact_id))
+    return pairs
+
+
+def score_pairs_difflib(names: typing.List[str], pairs: np.ndarray) -> np.ndarray:
+    """
+    Score pairs one by one with difflib, the reference for the other scorers.
+    :param names: contact names
+    :param pairs: array of shape (n, 2) with indices into names
+    :return: similarity of each pair
+    """
+    return np.array(
+        [get_name_similarity(names[i], names[j]) for i, j in pairs], dtype=float
+    )
+
+
+def score_pairs_ngram(names: typing.List[str], pairs: np.ndarray) -> np.ndarray:
+    """
+    Score pairs in bulk by comparing hashed character n-gram counts.
+    Similarity is the mean of the dice coefficients of characters and bigrams,
+    which is close to difflib's ratio but does not need to align the strings.
+    :param names: contact names
+    :param pairs: array of shape (n, 2) with indices into names
+    :return: similarity of each pair
+    """
+    local_parts = [name.split("@")[0] for name in names]
+    vectors = [
+        get_ngram_vectors(strings, n)
+        for strings in (names, local_parts)
+        for n in (1, 2)
+    ]
+
+    similarities = np.empty(len(pairs), dtype=float)
+    for start in range(0, len(pairs), SCORE_CHUNK_SIZE):
+        chunk = pairs[start : start + SCORE_CHUNK_SIZE]
+        name_1, name_2, local_part_1, local_part_2 = (
+            get_dice_coefficients(vectors_n, chunk) for vectors_n in vectors
+        )
+        similarities[start : start + SCORE_CHUNK_SIZE] = np.maximum(
+            (local_part_1 + local_part_2) / 2, (name_1 + name_2) / 2
+        )
+    return similarities
+
+
+def score_pairs_rapidfuzz(names: typing.List[str], pairs: np.ndarray) -> np.ndarray:
+    """
+    Score pairs in bulk with rapidfuzz's normalized Indel similarity, which is
+    based on the longest common subsequence. Close to difflib's ratio, which is
+    based on matching blocks, but not the same.
+    :param names: contact names
+    :param pairs: array of shape (n, 2) with indices into names
+    :return: similarity of each pair
+    """
+    if cpdist is None:
+        raise ImportError("rapidfuzz is not installed")
+
+    names_1 = [names[i] for i in pairs[:, 0]]
+    names_2 = [names[j] for j in pairs[:, 1]]
+    similarity_name = cpdist(names_1, names_2, scorer=Indel.normalized_similarity)
+    similarity_email = cpdist(
+        [name.split("@")[0] for name in names_1],
+        [name.split("@")[0] for name in names_2],
+        scorer=Indel.normalized_similarity,
+    )
+    return np.maximum(similarity_email, similarity_name)
+
+
+SCORERS = {
+    "difflib": score_pairs_difflib,
+    "ngram": score_pairs_ngram,
+    "rapidfuzz": score_pairs_rapidfuzz,
+}
+# stored similarities stay the same as with get_name_similarity, the faster
+# scorers approximate it and are opt-in
+SCORER_DEFAULT = "difflib"
+
+
+def get_scorer(name: str = SCORER_DEFAULT):
+    """
+    Get a function scoring pairs of contact names.
+    :param name: name of the scorer, see SCORERS
+    :return: scorer taking names and an array of index pairs
+    """
+    if name not in SCORERS:
+        raise ValueError(f"unknown scorer {name}, use one of {', '.join(SCORERS)}")
+    return SCORERS[name]
+
+
+def get_ngram_vectors(strings: typing.List[str], n: int) -> np.ndarray:
+    """
+    Count the character n-grams of each string, hashed into a fixed size vector.
+    :param strings: strings
+    :param n: n-gram size
+    :return: array of shape (len(strings), NGRAM_VECTOR_SIZE)
+    """
+    vectors = np.zeros((len(strings), NGRAM_VECTOR_SIZE), dtype=np.uint8)
+    for i, string in enumerate(strings):
+        string_padded = f" {string} " if n > 1 else string
+        buckets = [
+            zlib.crc32(string_padded[j : j + n].encode()) % NGRAM_VECTOR_SIZE
+            for j in range(len(string_padded) - n + 1)
+        ]
+        np.add.at(vectors[i], buckets, 1)
+    return vectors
+
+
+def get_dice_coefficients(vectors: np.ndarray, pairs: np.ndarray) -> np.ndarray:
+    """
+    Compute the dice coefficient of the n-gram counts of each pair.
+    :param vectors: n-gram counts, see get_ngram_vectors
+    :param pairs: array of shape (n, 2) with indices into vectors
+    :return: dice coefficient of each pair
+    """
+    totals = vectors.sum(axis=1, dtype=np.int32)
+    vectors_1, vectors_2 = vectors[pairs[:, 0]], vectors[pairs[:, 1]]
+    common = np.minimum(vectors_1, vectors_2).sum(axis=1, dtype=np.int32)
+    return 2 * common / np.maximum(totals[pairs[:, 0]] + totals[pairs[:, 1]], 1)
+
+
+def compute_duplicates(
+    contacts, scorer=None, on_indexed=None, progress=None
+) -> typing.List[typing.Tuple[int, int, float]]:
+    """
+    Compute the most similar contacts of each contact.
+    Contacts are read once and candidate pairs are scored in batches of
+    PAIRS_BATCH_SIZE, so memory grows with the number of contacts only.
+    :param contacts: (id, name) of contacts, e.g. a queryset iterator
+    :param scorer: function to score pairs, see get_scorer
+    :param on_indexed: called with id, name and blocking keys of each contact
+    :param progress: called with the number of contacts and pairs done after each batch
+    :return: (contact id, other contact id, similarity) of pairs among the most similar
+        of either contact, lower id first
+    """
+    names, contact_blocks = index_contacts(contacts, on_indexed)
+
+    most_similar = defaultdict(list)
+    pairs_scored = 0
+    for contacts_done, pairs in get_pair_batches(names, contact_blocks):
+        _push_most_similar(most_similar, score_contact_pairs(names, pairs, scorer))
+        pairs_scored += len(pairs)
+        if progress:
+            progress(contacts_done, pairs_scored)
+
+    return get_duplicate_pairs(most_similar)
+
+
+def index_contacts(contacts, on_indexed=None):
+    """
+    Compute the blocking keys of contacts and group them into blocks.
+    :param contacts: (id, name) of contacts, e.g. a queryset iterator
+    :param on_indexed: called with id, name and blocking keys of each contact
+    :return: names by contact id and blocks (sorted contact ids) by contact id
+    """
+    names = {}
+    blocks = defaultdict(list)
+    for contact_id, name in contacts:
+        keys = get_blocking_keys(name)
+        if on_indexed:
+            on_indexed(contact_id, name, keys)
+        names[contact_id] = name
+        for key in keys:
+            blocks[key].append(contact_id)
+
+    # blocks of each contact, to collect the candidates of one contact at a time
+    contact_blocks = defaultdict(list)
+    for block in blocks.values():
+        if 2 <= len(block) <= BLOCK_SIZE_MAX:
+            block.sort()
+            for contact_id in block:
+                contact_blocks[contact_id].append(block)
+    return names, contact_blocks
+
+
+def get_pair_batches(names, contact_blocks):
+    """
+    Collect the candidate pairs of contacts in batches of about PAIRS_BATCH_SIZE.
+    :param names: names by contact id, see index_contacts
+    :param contact_blocks: blocks by contact id, see index_contacts, consumed
+    :return: iterator of the number of contacts done and pairs of contact ids,
+        lower id first, each pair once
+    """
+    pairs = []
+    for contacts_done, contact_id in enumerate(sorted(names), start=1):
+        # pair with contacts of higher id only, so each pair is collected once
+        other_contact_ids = set()
+        for block in contact_blocks.pop(contact_id, []):
+            other_contact_ids.update(block[bisect_right(block, contact_id) :])
+        pairs.extend((contact_id, other_id) for other_id in sorted(other_contact_ids))
+
+        if len(pairs) >= PAIRS_BATCH_SIZE or contacts_done == len(names):
+            yield contacts_done, pairs
+            pairs = []
+
+
+def score_contact_pairs(
+    names: typing.Dict[int, str], pairs, scorer=None
+) -> typing.List[typing.Tuple[int, int, float]]:
+    """
+    Score pairs of contacts.
+    :param names: names by contact id
+    :param pairs: pairs of contact ids
+    :param scorer: function to score pairs, see get_scorer
+    :return: (contact id, other contact id, similarity) of each pair
+    """
+    scorer = scorer or get_scorer()
+    pairs = list(pairs)
+    if not pairs:
+        return []
+
+    # only pass the names of these pairs, scorers prepare every name they get
+    contact_ids = sorted({contact_id for pair in pairs for contact_id in pair})
+    indices = {contact_id: i for i, contact_id in enumerate(contact_ids)}
+    pairs_indices = np.array(
+        [(indices[id1], indices[id2]) for id1, id2 in pairs], dtype=np.int64
+    )
+    similarities = scorer(
+        [names[contact_id] for contact_id in contact_ids], pairs_indices
+    ).tolist()
+    return [(id1, id2, s) for (id1, id2), s in zip(pairs, similarities)]
+
+
+def get_most_similar(
+    scored_pairs, similarities=None
+) -> typing.Dict[int, typing.List[typing.Tuple[float, int]]]:
+    """
+    Select the most similar contacts of each contact.
+    :param scored_pairs: (contact id, other contact id, similarity), one direction
+    :param similarities: known (similarity, other contact id) by contact id to merge
+    :return: at most DUPLICATES_PER_CONTACT (similarity, other contact id), by contact id
+    """
+    most_similar = defaultdict(list)
+    for contact_id, contact_similarities in (similarities or {}).items():
+        for similarity, other_contact_id in contact_similarities:
+            _push_similar(most_similar[contact_id], (similarity, other_contact_id))
+    _push_most_similar(most_similar, scored_pairs)
+
+    return {
+        contact_id: sorted(heap, reverse=True)
+        for contact_id, heap in most_similar.items()
+    }
+
+
+def get_duplicate_pairs(most_similar) -> typing.List[typing.Tuple[int, int, float]]:
+    """
+    Get the pairs to store as duplicates, each pair once with the lower id first.
+    The most similar contacts of a contact are the pairs with it on either side.
+    :param most_similar: (similarity, other contact id) by contact id
+    :return: (contact id, other contact id, similarity)
+    """
+    pairs = {}
+    for contact_id, contact_similarities in most_similar.items():
+        for similarity, other_contact_id in contact_similarities:
+            pair = (
+                min(contact_id, other_contact_id),
+                max(contact_id, other_contact_id),
+            )
+            pairs[pair] = similarity
+    return [(id1, id2, similarity) for (id1, id2), similarity in sorted(pairs.items())]
+
+
+def _push_most_similar(most_similar, scored_pairs):
+    for contact_id, other_contact_id, similarity in scored_pairs:
+        if similarity > 0:
+            _push_similar(most_similar[contact_id], (similarity, other_contact_id))
+            _push_similar(most_similar[other_contact_id], (similarity, contact_id))
+
+
+def _push_similar(heap, item):
+    # min-heap of the most similar, the least similar is replaced first
+    if len(heap) < DUPLICATES_PER_CONTACT:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+
+def rebuild_duplicates(user, scorer=None, progress=None) -> int:
+    """
+    Recompute the duplicate suggestions and blocking keys of all contacts of a user.
+    :param user: user
+    :param scorer: function to score pairs, see get_scorer
+    :param progress: called with the number of contacts and pairs done, see compute_duplicates
+    :return: number of duplicate suggestions
+    """
+    contacts = (
+        Contact.objects.filter(user=user)
+        .values_list("id", "name")
+        .iterator(chunk_size=QUERY_CHUNK_SIZE)
+    )
+    contacts_indexed = []
+    blocking_keys = {}
+
+    def on_indexed(contact_id, name, keys):
+        contacts_indexed.append((contact_id, name))
+        blocking_keys[contact_id] = keys
+
+    duplicates = compute_duplicates(
+        contacts, scorer, on_indexed=on_indexed, progress=progress
+    )
+
+    # scoring happens outside, so the database is only locked while writing
+    with transaction.atomic():
+        ContactBlockingKey.objects.filter(user=user).delete()
+        _save_blocking_keys(user, blocking_keys)
+        _replace_duplicates(user, duplicates)
+        _mark_indexed(contacts_indexed)
+    return len(duplicates)
+
+
+def rebuild_duplicates_parallel(users, processes: int, scorer_name=SCORER_DEFAULT):
+    """
+    Recompute the duplicate suggestions of several users in worker processes.
+    Users with many contacts are split into shards, so a single large user can use
+    all processes. Blocking keys and candidate pairs are computed once by this
+    process, workers only get the pairs of their shard and the names in them.
+    The database is read before and written after scoring by this process.
+    :param users: users
+    :param processes: number of worker processes
+    :param scorer_name: name of the scorer, see SCORERS
+    :return: iterator of (user, number of duplicate suggestions, pairs scored)
+    """
+    get_scorer(scorer_name)
+    users = list(users)
+    contacts = {}
+    blocking_keys = {}
+    results = defaultdict(list)
+
+    def collect(futures_done):
+        for future in futures_done:
+            results[futures.pop(future)].append(future.result())
+
+    with ProcessPoolExecutor(processes, initializer=django.setup) as executor:
+        futures = {}
+        for user in users:
+            contacts[user.id] = list(
+                Contact.objects.filter(user=user).values_list("id", "name")
+            )
+            shards = min(processes, len(contacts[user.id]) // SHARD_CONTACTS_MIN)
+            shards = max(shards, 1)
+            user_blocking_keys = blocking_keys[user.id] = {}
+
+            def on_indexed(contact_id, name, keys):
+                user_blocking_keys[contact_id] = keys
+
+            names, contact_blocks = index_contacts(contacts[user.id], on_indexed)
+            pairs = [
+                np.array(pairs, dtype=np.int64).reshape(-1, 2)
+                for _, pairs in get_pair_batches(names, contact_blocks)
+            ]
+            pairs = np.concatenate(pairs) if pairs else np.empty((0, 2), np.int64)
+            for shard_pairs in np.array_split(pairs, shards):
+                shard_names = {
+                    contact_id: names[contact_id]
+                    for contact_id in np.unique(shard_pairs).tolist()
+                }
+                future = executor.submit(
+                    compute_duplicates_shard, shard_names, shard_pairs, scorer_name
+                )
+                futures[future] = user.id
+            del pairs
+
+            # bound the pairs waiting for a worker
+            while len(futures) >= 2 * processes:
+                collect(wait(futures, return_when=FIRST_COMPLETED).done)
+        collect(as_completed(list(futures)))
+
+    for user in users:
+        pairs = []
+        pairs_scored = 0
+        for shard_pairs, shard_pairs_scored in results[user.id]:
+            pairs.extend(shard_pairs)
+            pairs_scored += shard_pairs_scored
+
+        # pairs of a shard are the most similar within it, select across shards
+        duplicates = get_duplicate_pairs(get_most_similar(pairs))
+        with transaction.atomic():
+            ContactBlockingKey.objects.filter(user=user).delete()
+            _save_blocking_keys(user, blocking_keys.pop(user.id))
+            _replace_duplicates(user, duplicates)
+            _mark_indexed(contacts.pop(user.id))
+        yield user, len(duplicates), pairs_scored
+
+
+def compute_duplicates_shard(names, pairs: np.ndarray, scorer_name: str):
+    """
+    Score the candidate pairs of one shard of a user's contacts in a worker process.
+    :param names: names by contact id of the contacts in pairs
+    :param pairs: array of shape (n, 2) with contact ids, see get_pair_batches
+    :param scorer_name: name of the scorer, see SCORERS
+    :return: duplicates within the shard (see compute_duplicates), pairs scored
+    """
+    scorer = get_scorer(scorer_name)
+    most_similar = defaultdict(list)
+    for start in range(0, len(pairs), PAIRS_BATCH_SIZE):
+        batch = pairs[start : start + PAIRS_BATCH_SIZE].tolist()
+        _push_most_similar(most_similar, score_contact_pairs(names, batch, scorer))
+    return get_duplicate_pairs(most_similar), len(pairs)
+
+
+def update_duplicates(user, scorer=None) -> int:
+    """
+    Update the duplicate suggestions of contacts created or renamed since the last
+    update. Only pairs with these contacts are scored, so this scales with the number
+    of changed contacts instead of the size of the address book.
+    Contacts that lose a suggestion to a renamed contact keep the others and
+    suggestions pushed out by new ones are kept, rebuild_duplicates cleans up both.
+    :param user: user
+    :param scorer: function to score pairs, see get_scorer
+    :return: number of changed contacts
+    """
+    contacts_changed = list(
+        Contact.objects.filter(user=user)
+        .exclude(duplicates_indexed_name=F("name"))
+        .values_list("id", "name")
+    )
+    if not contacts_changed:
+        return 0
+
+    contact_ids_changed = {contact_id for contact_id, _ in contacts_changed}
+    blocking_keys = {
+        contact_id: get_blocking_keys(name) for contact_id, name in contacts_changed
+    }
+
+    with transaction.atomic():
+        ContactBlockingKey.objects.filter(contact_id__in=contact_ids_changed).delete()
+        _save_blocking_keys(user, blocking_keys)
+
+        # all contacts sharing a block with a changed contact
+        blocks = defaultdict(list)
+        keys = sorted(set().union(*blocking_keys.values()))
+        for keys_chunk in _chunks(keys):
+            for key, contact_id in ContactBlockingKey.objects.filter(
+                user=user, key__in=keys_chunk
+            ).values_list("key", "contact_id"):
+                blocks[key].append(contact_id)
+        pairs = get_block_pairs(blocks.values(), contact_ids_changed)
+
+        contact_ids = {contact_id for pair in pairs for contact_id in pair}
+        contact_ids_other = contact_ids - contact_ids_changed
+        names = dict(contacts_changed)
+        for contact_ids_chunk in _chunks(sorted(contact_ids_other)):
+            names.update(
+                Contact.objects.filter(id__in=contact_ids_chunk).values_list(
+                    "id", "name"
+                )
+            )
+
+        # suggestions of changed contacts are replaced
+        for contact_ids_chunk in _chunks(sorted(contact_ids_changed)):
+            ContactDuplicate.objects.filter(
+                Q(contact_id__in=contact_ids_chunk)
+                | Q(other_contact_id__in=contact_ids_chunk)
+            ).delete()
+
+        # other contacts keep theirs, new pairs are added if among their most similar
+        duplicates_known = {}
+        for contact_ids_chunk in _chunks(sorted(contact_ids_other)):
+            for (
+                contact_id,
+                other_contact_id,
+                similarity,
+            ) in ContactDuplicate.objects.filter(
+                Q(contact_id__in=contact_ids_chunk)
+                | Q(other_contact_id__in=contact_ids_chunk)
+            ).values_list(
+                "contact_id", "other_contact_id", "similarity"
+            ):
+                duplicates_known[contact_id, other_contact_id] = similarity
+        similarities_known = defaultdict(list)
+        for (contact_id, other_contact_id), similarity in duplicates_known.items():
+            similarities_known[contact_id].append((similarity, other_contact_id))
+            similarities_known[other_contact_id].append((similarity, contact_id))
+
+        scored_pairs = score_contact_pairs(names, pairs, scorer)
+        most_similar = get_most_similar(scored_pairs, similarities_known)
+        ContactDuplicate.objects.bulk_create(
+            ContactDuplicate(
+                contact_id=contact_id,
+                other_contact_id=other_contact_id,
+                similarity=similarity,
+            )
+            for contact_id, other_contact_id, similarity in get_duplicate_pairs(
+                most_similar
+            )
+            if (contact_id, other_contact_id) in pairs
+        )
+        _mark_indexed(contacts_changed)
+    return len(contacts_changed)
+
+
+def _save_blocking_keys(user, blocking_keys):
+    ContactBlockingKey.objects.bulk_create(
+        (
+            ContactBlockingKey(user=user, contact_id=contact_id, key=key)
+            for contact_id, keys in blocking_keys.items()
+            for key in keys
+        ),
+        batch_size=WRITE_BATCH_SIZE,
+    )
+
+
+def _replace_duplicates(user, duplicates):
+    ContactDuplicate.objects.filter(contact__user=user).delete()
+    ContactDuplicate.objects.bulk_create(
+        (
+            ContactDuplicate(
+                contact_id=contact_id,
+                other_contact_id=other_contact_id,
+                similarity=similarity,
+            )
+            for contact_id, other_contact_id, similarity in duplicates
+        ),
+        batch_size=WRITE_BATCH_SIZE,
+    )
+
+
+def _mark_indexed(contacts):
+    # store the name that was indexed, renames in the meantime are picked up next time
+    Contact.objects.bulk_update(
+        [
+            Contact(id=contact_id, duplicates_indexed_name=name)
+            for contact_id, name in contacts
+        ],
+        ["duplicates_indexed_name"],
+        batch_size=WRITE_BATCH_SIZE,
+    )
+
+
+def _chunks(items, size=None):
+    size = size or QUERY_CHUNK_SIZE
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
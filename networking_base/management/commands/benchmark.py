@@ -0,0 +1,80 @@
+import json
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from networking_base.benchmarks import get_regressions, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure time, queries and memory of pages, syncing and duplicates "
+        "on seeded data in a test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--contacts", type=int, default=1000)
+        parser.add_argument("--interactions", type=int, default=20000)
+        parser.add_argument(
+            "--google",
+            type=float,
+            default=0.2,
+            help="share of interactions with a gmail message or calendar event",
+        )
+        parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark")
+        parser.add_argument("--seed", type=int, default=0, help="seed of the data")
+        parser.add_argument("--output", help="file to write the results to as json")
+        parser.add_argument(
+            "--baseline", help="json file of earlier results to compare with"
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="allowed relative increase compared to the baseline",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)["results"]
+
+        def progress(name, metrics):
+            self.stdout.write(
+                f"{name}: {metrics['seconds'] * 1000:.1f}ms, "
+                f"{metrics['queries']} queries, "
+                f"{metrics['peak_memory_mb']:.1f}MB"
+            )
+
+        # never touch the real data
+        setup_test_environment()
+        database_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = run_benchmarks(
+                contacts=options["contacts"],
+                interactions=options["interactions"],
+                google=options["google"],
+                repeat=options["repeat"],
+                seed=options["seed"],
+                progress=progress,
+            )
+        finally:
+            connection.creation.destroy_test_db(database_name, verbosity=0)
+            teardown_test_environment()
+
+        if options["output"]:
+            scale = {
+                key: options[key]
+                for key in ["contacts", "interactions", "google", "repeat", "seed"]
+            }
+            with open(options["output"], "w") as f:
+                json.dump({"scale": scale, "results": results}, f, indent=2)
+
+        if baseline is not None:
+            regressions = get_regressions(results, baseline, options["threshold"])
+            if regressions:
+                raise CommandError("regressions:\n" + "\n".join(regressions))
+            self.stdout.write("no regressions")
@@ -0,0 +1,66 @@
+import time
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand
+
+from networking_base.duplicates import SCORERS, get_candidate_pairs, get_scorer
+from networking_base.models import Contact
+
+
+class Command(BaseCommand):
+    help = "Compare the speed of the duplicate scorers on the candidate pairs of all users."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pairs",
+            type=int,
+            default=20000,
+            help="maximum number of pairs to score",
+        )
+        parser.add_argument(
+            "--scorers",
+            nargs="+",
+            choices=list(SCORERS),
+            default=list(SCORERS),
+        )
+
+    def handle(self, *args, **options):
+        # candidate pairs of all users, as indices into one list of names
+        names = []
+        pairs = []
+        for user in User.objects.all():
+            contacts = list(Contact.objects.filter(user=user).values_list("id", "name"))
+            indices = {
+                contact_id: len(names) + i for i, (contact_id, _) in enumerate(contacts)
+            }
+            names.extend(name for _, name in contacts)
+            pairs.extend(
+                (indices[contact_id], indices[other_contact_id])
+                for contact_id, other_contact_id in get_candidate_pairs(contacts)
+            )
+        pairs = np.array(sorted(pairs)[: options["pairs"]], dtype=np.int64).reshape(
+            -1, 2
+        )
+        if not len(pairs):
+            self.stderr.write("no candidate pairs, add some contacts first")
+            return
+
+        similarities_baseline = None
+        for name in options["scorers"]:
+            try:
+                scorer = get_scorer(name)
+                start = time.perf_counter()
+                similarities = scorer(names, pairs)
+                duration = time.perf_counter() - start
+            except ImportError as e:
+                self.stdout.write(f"{name}: skipped, {e}")
+                continue
+
+            if similarities_baseline is None:
+                similarities_baseline = similarities
+            deviation = np.abs(similarities - similarities_baseline).mean()
+            self.stdout.write(
+                f"{name}: {len(pairs) / duration:.0f} pairs/s, "
+                f"mean deviation {deviation:.3f} from {options['scorers'][0]}"
+            )
@@ -1,51 +1,72 @@
-from difflib import SequenceMatcher
+import time
 
 from django.contrib.auth.models import User
 from django.core.management import BaseCommand
 
-from networking_base.models import Contact, ContactDuplicate
+from networking_base.duplicates import (
+    SCORER_DEFAULT,
+    SCORERS,
+    get_scorer,
+    rebuild_duplicates,
+    rebuild_duplicates_parallel,
+    update_duplicates,
+)
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scorer",
+            choices=list(SCORERS),
+            default=SCORER_DEFAULT,
+            help="how to score pairs of contacts",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="only update contacts created or renamed since the last run",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="number of processes to score contacts with",
+        )
+
     def handle(self, *args, **options):
+        scorer = get_scorer(options["scorer"])
+
+        if options["processes"] > 1 and not options["incremental"]:
+            start = time.perf_counter()
+            results = rebuild_duplicates_parallel(
+                User.objects.all(), options["processes"], options["scorer"]
+            )
+            for user, count, pairs_scored in results:
+                self.stdout.write(f"{user}: {count} duplicates, {pairs_scored} pairs")
+            duration = time.perf_counter() - start
+            self.stdout.write(f"done in {duration:.1f}s")
+            return
+
         for user in User.objects.all():
-            contacts = Contact.objects.filter(user=user).all()
-
-            # delete old
-            ContactDuplicate.objects.filter(contact__in=contacts).delete()
-            ContactDuplicate.objects.filter(other_contact__in=contacts).delete()
-
-            for contact in contacts:
-                print(contact)
-
-                similarities = {}
-                other_contacts = filter(lambda c: c.id != contact.id, contacts)
-                for other_contact in other_contacts:
-                    similarity = get_contact_similarity(contact, other_contact)
-                    if similarity > 0:
-                        similarities[other_contact] = similarity
-
-                # sort by similarity
-                most_similar = sorted(
-                    similarities.items(), key=lambda item: item[1], reverse=True
-                )[:10]
-
-                # create contact duplicate suggestions
-                contact_duplicates = []
-                for similar_contact, similarity in most_similar:
-                    contact_duplicates.append(
-                        ContactDuplicate(
-                            contact=contact,
-                            other_contact=similar_contact,
-                            similarity=similarity,
-                        )
-                    )
-                ContactDuplicate.objects.bulk_create(contact_duplicates)
+            if options["incremental"]:
+                count = update_duplicates(user, scorer)
+                self.stdout.write(f"{user}: {count} contacts changed")
+                continue
+
+            start = time.perf_counter()
+            stats = {"contacts": 0, "pairs": 0}
 
+            def progress(contacts_done, pairs_scored):
+                stats.update(contacts=contacts_done, pairs=pairs_scored)
+                if options["verbosity"] > 1:
+                    self.stdout.write(
+                        f"{user}: {contacts_done} contacts, {pairs_scored} pairs, "
+                        f"{pairs_scored / (time.perf_counter() - start):.0f} pairs/s"
+                    )
 
-def get_contact_similarity(c1, c2):
-    similarity_email = SequenceMatcher(
-        None, c1.name.split("@")[0], c2.name.split("@")[0]
-    ).ratio()
-    similarity_name = SequenceMatcher(None, c1.name, c2.name).ratio()
-    return max(similarity_email, similarity_name)
+            count = rebuild_duplicates(user, scorer, progress)
+            duration = time.perf_counter() - start
+            self.stdout.write(
+                f"{user}: {count} duplicates, {stats['contacts']} contacts, "
+                f"{stats['pairs']} pairs in {duration:.1f}s"
+            )
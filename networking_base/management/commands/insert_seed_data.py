@@ -1,38 +1,56 @@
-import random
-from datetime import datetime, timedelta
+import time
 
 from django.contrib.auth.models import User
 from django.core.management import BaseCommand
-from pytz import UTC
 
-from networking_base.models import Contact, Interaction
+from networking_base.seed import insert_seed_data
 
 
 class Command(BaseCommand):
-    def handle(self, *args, **options):
-        firstnames = ["Peter", "Barbara", "Klaus", "Karl", "Ferdinand", "Otto"]
-        lastnames = ["Müller", "Meyer", "Merkel", "Duck", "Gamma"]
-        lastnames_double = [
-            "-".join([l1, l2]) for l1 in lastnames for l2 in lastnames if l1 != l2
-        ]
-        lastnames_full = lastnames + lastnames_double
+    help = "Insert random but reproducible contacts and interactions for users."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="username, all users if omitted")
+        parser.add_argument(
+            "--contacts", type=int, default=100, help="number of contacts per user"
+        )
+        parser.add_argument(
+            "--interactions",
+            type=int,
+            default=10000,
+            help="number of interactions per user",
+        )
+        parser.add_argument(
+            "--duplicates",
+            type=float,
+            default=0.05,
+            help="share of contacts named like another contact",
+        )
+        parser.add_argument(
+            "--google",
+            type=float,
+            default=0.0,
+            help="share of interactions with a gmail message or calendar event",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="seed of the random data"
+        )
 
-        for u in User.objects.all():
-            for i in range(100):
-                name = " ".join(
-                    [random.choice(firstnames), random.choice(lastnames_full)]
-                )
-                contact = Contact.objects.create(
-                    name=name, frequency_in_days=random.randrange(7, 30), user=u
-                )
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options["user"]:
+            users = users.filter(username=options["user"])
 
-                for j in range(0, 100):
-                    date_random = datetime.now(tz=UTC) - timedelta(
-                        days=random.randrange(1, 365)
-                    )
-                    Interaction.objects.create(
-                        was_at=date_random,
-                        contact=contact,
-                        title="Interaction",
-                        description="Talked",
-                    )
+        for user in users:
+            start = time.perf_counter()
+            counts = insert_seed_data(
+                user,
+                contacts=options["contacts"],
+                interactions=options["interactions"],
+                duplicates=options["duplicates"],
+                google=options["google"],
+                seed=options["seed"],
+            )
+            duration = time.perf_counter() - start
+            rows = ", ".join(f"{count} {name}" for name, count in counts.items())
+            self.stdout.write(f"{user}: {rows} in {duration:.1f}s")
@@ -0,0 +1,24 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand
+
+from networking_base.analytics import rebuild_interaction_weeks
+
+
+class Command(BaseCommand):
+    help = "Rebuild the weekly interaction counts of all users from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="username, all users if omitted")
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options["user"]:
+            users = users.filter(username=options["user"])
+
+        for user in users:
+            start = time.perf_counter()
+            rebuild_interaction_weeks(user)
+            duration = time.perf_counter() - start
+            self.stdout.write(f"{user}: done in {duration:.1f}s")
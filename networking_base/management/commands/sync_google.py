@@ -1,6 +1,9 @@
 import logging
+import random
 import re
+import time
 import typing
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date, datetime
 from enum import Enum
 
@@ -10,26 +13,46 @@ from allauth.account.models import EmailAddress
 from allauth.socialaccount.models import SocialAccount, SocialApp, SocialToken
 from django.contrib.auth.models import User
 from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
 
 from networking_base.models import (
+    ContactEmailResolver,
     GoogleCalendarEvent,
     GoogleEmail,
+    GoogleSyncState,
     Interaction,
+    InteractionSource,
     clean_email,
     get_or_create_contact_email,
 )
+from networking_base.signals import defer_contact_updates
 
 # todo map emails to names in order to create contacts
 
 REGEX_EMAIL = r"[A-z0-9_.+-]+@[A-z0-9_.-]+\.[A-z]+"
 EMAIL_TITLE_DEFAULT = "Email without subject"
 
+# gmail allows 100 requests per batch, but recommends 50 to avoid rate limiting
+GMAIL_BATCH_SIZE = 50
+GMAIL_BATCH_RETRIES = 5
+HTTP_STATUS_RETRY = {429, 500, 502, 503, 504}
+
 
 class HeaderParsingException(Exception):
     pass
 
 
+class GoogleSyncException(Exception):
+    pass
+
+
 def extract_emails(header_str):
     matches = re.findall(REGEX_EMAIL, header_str)
     if not matches:
@@ -158,77 +181,273 @@ class GoogleCalendarEventAdapter:
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="re-create interactions of all google items, not only changed ones",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="number of users to sync in parallel",
+        )
+        parser.add_argument(
+            "--users", nargs="+", metavar="USERNAME", help="only sync these users"
+        )
+        parser.add_argument(
+            "--logged-in-since",
+            type=date.fromisoformat,
+            metavar="YYYY-MM-DD",
+            help="only sync users who logged in since this date, "
+            "users syncing without logging in are left out",
+        )
+
     def handle(self, *args, **options):
+        users = User.objects.order_by("id")
+        if options["users"]:
+            users = users.filter(username__in=options["users"])
+        if options["logged_in_since"]:
+            users = users.filter(last_login__date__gte=options["logged_in_since"])
+
         # fetch calendar and gmail for all users
-        for user in User.objects.all():
-            self.stdout.write(f"syncing {user}")
-            gus = GoogleUserSync(user)
-            gus.sync()
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            futures = {
+                executor.submit(sync_user, user, options["full"]): user
+                for user in users
+            }
+            for future in as_completed(futures):
+                user = futures[future]
+                try:
+                    gus = future.result()
+                except SocialAccount.DoesNotExist:
+                    self.stdout.write(f"{user}: skipped, no google account")
+                except Exception as e:
+                    # do not let one user stop the sync of the others
+                    logging.error(f"syncing {user} failed", exc_info=e)
+                    self.stderr.write(f"{user}: failed, {e!r}")
+                else:
+                    self.stdout.write(
+                        f"{user}: {gus.emails_fetched} emails, "
+                        f"{gus.events_stored} events, "
+                        f"{gus.items_updated} interactions updated, "
+                        f"{gus.api_calls} api calls in {gus.duration:.1f}s"
+                    )
+
+
+def sync_user(user, full=False) -> "GoogleUserSync":
+    """
+    Sync a single user, meant to run in a worker thread.
+    :param user: user to sync
+    :param full: re-create all interactions
+    :return: finished sync
+    """
+    try:
+        gus = GoogleUserSync(user, full=full)
+        gus.sync()
+        return gus
+    finally:
+        # each thread has its own connection, close it when done
+        connection.close()
 
 
 class GoogleUserSync:
-    def __init__(self, user):
+    def __init__(self, user, http=None, full=False):
         self.user = user
+
+        # update all interactions, not only the ones of changed items
+        self.full = full
         self.social_account = None
+        self.social_token = None
+        self.credentials = None
+
+        # transport to use for api requests, defaults to a new httplib2.Http
+        self.http = http
 
         self.user_emails = {
             clean_email(sa_email_address.email)
             for sa_email_address in EmailAddress.objects.filter(user=self.user).all()
         }
 
+        # statistics
+        self.api_calls = 0
+        self.emails_fetched = 0
+        self.events_stored = 0
+        self.items_updated = 0
+        self.duration = 0.0
+
     def sync(self):
-        # get social account
+        start = time.perf_counter()
+        try:
+            self.connect()
+
+            self.sync_calendar()
+            self.sync_gmail()
+
+            # update each contact once instead of once per interaction
+            with defer_contact_updates():
+                self.items_updated = self.update_interactions()
+        finally:
+            self.duration = time.perf_counter() - start
+
+    def connect(self):
+        """
+        Load the google account and its credentials.
+        """
         self.social_account = SocialAccount.objects.get(
             user=self.user, provider="google"
         )
+        self.social_token = SocialToken.objects.get(account=self.social_account)
+        self.credentials = self._make_credentials(self.social_token)
 
-        self.sync_calendar()
-        self.sync_gmail()
-        self.update_interactions()
-
-    def update_interactions(self):
-        # updates need to be performed each time as mapped contacts could have changed
+    def update_interactions(self) -> int:
+        """
+        Update interactions of new and changed google items.
+        :return: number of updated items
+        """
+        synced_at = timezone.now()
 
         # update emails
-        google_emails = GoogleEmail.objects.filter(
-            social_account=self.social_account
-        ).all()
-        for google_email in google_emails:
-            try:
-                update_email_interaction(google_email, self.user_emails)
-            except HeaderParsingException:
-                logging.exception("parsing email failed")
+        google_email_ids = self._get_item_ids_to_update(GoogleEmail)
+        for google_emails in self._iterate_items(GoogleEmail, google_email_ids):
+            # create missing contacts of the whole chunk at once
+            emails = set()
+            for google_email in google_emails:
+                try:
+                    emails |= get_email_addresses(google_email)
+                except HeaderParsingException:
+                    pass
+            self.resolver.resolve(emails - self.user_emails)
+
+            for google_email in google_emails:
+                try:
+                    update_email_interaction(
+                        google_email, self.user_emails, self.resolver
+                    )
+                except HeaderParsingException:
+                    logging.exception("parsing email failed")
+            GoogleEmail.objects.filter(id__in=[ge.id for ge in google_emails]).update(
+                interaction_synced_at=synced_at
+            )
 
         # update interactions for all calendar events
-        google_events = GoogleCalendarEvent.objects.filter(
-            social_account=self.social_account
-        ).all()
-        for google_event in google_events:
-            update_calendar_interaction(google_event, self.user_emails)
+        google_event_ids = self._get_item_ids_to_update(GoogleCalendarEvent)
+        for google_events in self._iterate_items(GoogleCalendarEvent, google_event_ids):
+            emails = set()
+            for google_event in google_events:
+                if (
+                    google_event.data["status"]
+                    == GoogleCalendarEventStatus.CONFIRMED.value
+                ):
+                    emails |= get_calendar_event_addresses(google_event)
+            self.resolver.resolve(emails - self.user_emails)
+
+            for google_event in google_events:
+                update_calendar_interaction(
+                    google_event, self.user_emails, self.resolver
+                )
+            GoogleCalendarEvent.objects.filter(
+                id__in=[ge.id for ge in google_events]
+            ).update(interaction_synced_at=synced_at)
+
+        return len(google_email_ids) + len(google_event_ids)
+
+    @cached_property
+    def resolver(self) -> ContactEmailResolver:
+        return ContactEmailResolver(self.user)
+
+    def _get_item_ids_to_update(self, model) -> typing.List[int]:
+        items = model.objects.filter(social_account=self.social_account)
+        if not self.full:
+            # new, changed, or marked as changed, see mark_google_items_changed
+            items = items.filter(
+                Q(interaction_synced_at__isnull=True)
+                | Q(updated_at__gt=F("interaction_synced_at"))
+            )
+        return list(items.values_list("id", flat=True))
+
+    def _iterate_items(self, model, item_ids, chunk_size=500):
+        for i in range(0, len(item_ids), chunk_size):
+            yield list(
+                model.objects.filter(id__in=item_ids[i : i + chunk_size])
+                .select_related("social_account__user", "interaction")
+                .order_by("id")
+            )
 
     def sync_calendar(self):
-        social_token = SocialToken.objects.get(account=self.social_account)
-        credentials = self._make_credentials(social_token)
-        service = build("calendar", "v3", credentials=credentials)
+        service = self._build_service("calendar", "v3")
+        sync_state = self._get_sync_state()
 
-        request = service.events().list(calendarId="primary", maxResults=2500)
+        try:
+            sync_token = self._sync_calendar_events(
+                service, sync_state.calendar_sync_token
+            )
+        except HttpError as e:
+            if e.resp.status != 410 or not sync_state.calendar_sync_token:
+                raise
+            logging.warning("calendar sync token expired, doing full sync")
+            sync_token = self._sync_calendar_events(service, None)
+
+        sync_state.calendar_sync_token = sync_token
+        sync_state.save(update_fields=["calendar_sync_token"])
+
+    def _sync_calendar_events(self, service, sync_token) -> str:
+        """
+        Fetch and store calendar events changed since the sync token.
+        :param sync_token: sync token of the last sync, full sync if None
+        :return: sync token to continue from
+        """
+        # a full listing has all events, e.g. after the sync token expired
+        listing_full = not sync_token
+        if sync_token:
+            request = service.events().list(
+                calendarId="primary", syncToken=sync_token, maxResults=2500
+            )
+        else:
+            request = service.events().list(calendarId="primary", maxResults=2500)
+
+        google_calendar_ids = set()
         while request:
-            response = request.execute()
-            for item in response["items"]:
-                gcal_event, was_created = GoogleCalendarEvent.objects.get_or_create(
-                    google_calendar_id=item["id"],
-                    defaults={"data": item, "social_account": self.social_account},
-                )
-                if not was_created:
-                    # calendar events can change, so needs to be updated
-                    gcal_event.data = item
-                    gcal_event.save()
+            response = self._execute(request)
+            self.events_stored += store_google_calendar_events(
+                self.social_account, response["items"]
+            )
+            google_calendar_ids.update(item["id"] for item in response["items"])
+            sync_token = response.get("nextSyncToken", sync_token)
 
             # define next request
             request = service.events().list_next(
                 previous_request=request, previous_response=response
             )
 
+        if listing_full:
+            self._delete_calendar_events_missing(google_calendar_ids)
+        return sync_token
+
+    def _delete_calendar_events_missing(self, google_calendar_ids):
+        """
+        Delete stored calendar events and their interactions missing from a full
+        listing, i.e. deleted in the calendar without us seeing the cancellation.
+        :param google_calendar_ids: ids of all events in the calendar
+        """
+        events_missing = [
+            (event_id, interaction_id)
+            for event_id, google_calendar_id, interaction_id in (
+                GoogleCalendarEvent.objects.filter(
+                    social_account=self.social_account
+                ).values_list("id", "google_calendar_id", "interaction_id")
+            )
+            if google_calendar_id not in google_calendar_ids
+        ]
+
+        # update each contact once instead of once per interaction
+        with transaction.atomic(), defer_contact_updates():
+            for i in range(0, len(events_missing), 500):
+                event_ids, interaction_ids = zip(*events_missing[i : i + 500])
+                Interaction.objects.filter(id__in=interaction_ids).delete()
+                GoogleCalendarEvent.objects.filter(id__in=event_ids).delete()
+
     def _make_credentials(self, social_token: SocialToken):
         social_app = SocialApp.objects.get(provider="google")
         if not social_token.token_secret:
@@ -244,40 +463,65 @@ class GoogleUserSync:
         )
         return credentials
 
+    def _build_service(self, service_name, version):
+        http = AuthorizedHttp(self.credentials, http=self.http or build_http())
+        return build(service_name, version, http=http)
+
+    def _execute(self, request):
+        self.api_calls += 1
+        token_old = self.credentials.token
+        response = request.execute()
+        token_new = self.credentials.token
+
+        # update social token
+        if token_old != token_new:
+            self.social_token.token = self.credentials.token
+            self.social_token.expires_at = pytz.utc.localize(self.credentials.expiry)
+            self.social_token.save()
+            logging.warning("credentials changed: updated")
+
+        return response
+
+    def _get_sync_state(self) -> GoogleSyncState:
+        sync_state, _ = GoogleSyncState.objects.get_or_create(
+            social_account=self.social_account
+        )
+        return sync_state
+
     def sync_gmail(self):
-        social_token = SocialToken.objects.get(account=self.social_account)
-        credentials = self._make_credentials(social_token)
-        service = build("gmail", "v1", credentials=credentials)
+        service = self._build_service("gmail", "v1")
+        sync_state = self._get_sync_state()
 
-        request = service.users().messages().list(userId="me", maxResults=5000)
+        history_id = None
+        if sync_state.gmail_history_id:
+            try:
+                history_id = self._sync_gmail_history(
+                    service, sync_state.gmail_history_id
+                )
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                logging.warning("gmail history id expired, doing full sync")
+
+        if not history_id:
+            history_id = self._sync_gmail_full(service)
+
+        sync_state.gmail_history_id = history_id
+        sync_state.save(update_fields=["gmail_history_id"])
+
+    def _sync_gmail_full(self, service) -> str:
+        """
+        Fetch all messages not stored yet.
+        :return: history id to continue from
+        """
+        # fetch history id first so changes during the sync are caught next time
+        profile = self._execute(service.users().getProfile(userId="me"))
+
+        request = service.users().messages().list(userId="me", maxResults=500)
         while request:
-            token_old = credentials.token
-            response = request.execute()
-            token_new = credentials.token
-
-            # update social token
-            if token_old != token_new:
-                social_token.token = credentials.token
-                social_token.expires_at = pytz.utc.localize(credentials.expiry)
-                social_token.save()
-                logging.warning("credentials changed: updated")
-
-            for result in response["messages"]:
-                if (
-                    GoogleEmail.objects.filter(gmail_message_id=result["id"]).count()
-                    == 0
-                ):
-                    msg = (
-                        service.users()
-                        .messages()
-                        .get(userId="me", id=result["id"], format="metadata")
-                        .execute()
-                    )
-
-                    GoogleEmail.objects.get_or_create(
-                        gmail_message_id=msg["id"],
-                        defaults={"data": msg, "social_account": self.social_account},
-                    )
+            response = self._execute(request)
+            message_ids = [result["id"] for result in response.get("messages", [])]
+            self._fetch_gmail_messages(service, message_ids)
 
             # define next request
             request = (
@@ -286,9 +530,197 @@ class GoogleUserSync:
                 .list_next(previous_request=request, previous_response=response)
             )
 
+        return profile["historyId"]
+
+    def _sync_gmail_history(self, service, start_history_id) -> str:
+        """
+        Fetch messages added since the given history id.
+        :return: history id to continue from
+        """
+        request = (
+            service.users()
+            .history()
+            .list(
+                userId="me",
+                startHistoryId=start_history_id,
+                historyTypes="messageAdded",
+                maxResults=500,
+            )
+        )
+        history_id = start_history_id
+        while request:
+            response = self._execute(request)
+            history_id = response["historyId"]
+            message_ids = [
+                message_added["message"]["id"]
+                for history in response.get("history", [])
+                for message_added in history.get("messagesAdded", [])
+            ]
+            self._fetch_gmail_messages(service, message_ids)
+
+            # define next request
+            request = (
+                service.users()
+                .history()
+                .list_next(previous_request=request, previous_response=response)
+            )
+
+        return history_id
+
+    def _fetch_gmail_messages(self, service, message_ids):
+        """
+        Fetch and store the given messages, skipping the ones already stored.
+        :param message_ids: gmail message ids
+        """
+        message_ids_existing = set(
+            GoogleEmail.objects.filter(
+                social_account=self.social_account, gmail_message_id__in=message_ids
+            ).values_list("gmail_message_id", flat=True)
+        )
+        message_ids_new = [
+            message_id
+            for message_id in dict.fromkeys(message_ids)
+            if message_id not in message_ids_existing
+        ]
+
+        for i in range(0, len(message_ids_new), GMAIL_BATCH_SIZE):
+            messages = self._fetch_gmail_messages_batch(
+                service, message_ids_new[i : i + GMAIL_BATCH_SIZE]
+            )
+            store_google_emails(self.social_account, messages)
+            self.emails_fetched += len(messages)
+
+    def _fetch_gmail_messages_batch(self, service, message_ids) -> list:
+        """
+        Fetch message metadata with batch requests, retrying failed messages.
+        :param message_ids: gmail message ids, at most GMAIL_BATCH_SIZE
+        :return: fetched messages
+        """
+        messages = []
+        message_ids_failed = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                messages.append(response)
+            elif exception.resp.status in HTTP_STATUS_RETRY:
+                message_ids_failed.append(request_id)
+            elif exception.resp.status == 404:
+                # message has been deleted in the meantime
+                pass
+            else:
+                raise exception
+
+        for attempt in range(GMAIL_BATCH_RETRIES + 1):
+            if attempt > 0:
+                # exponential backoff with jitter
+                time.sleep(2**attempt + random.random())
+
+            batch = service.new_batch_http_request(callback=callback)
+            for message_id in message_ids:
+                batch.add(
+                    service.users()
+                    .messages()
+                    .get(userId="me", id=message_id, format="metadata"),
+                    request_id=message_id,
+                )
+            self._execute(batch)
+
+            if not message_ids_failed:
+                return messages
+
+            message_ids = message_ids_failed
+            message_ids_failed = []
+
+        raise GoogleSyncException(f"fetching messages failed: {message_ids}")
+
+
+def store_google_emails(social_account, messages):
+    """
+    Store a page of gmail messages, ignoring the ones stored already.
+    :param social_account: owning social account
+    :param messages: gmail messages (metadata)
+    """
+    # messages do not change, so existing ones can be skipped
+    GoogleEmail.objects.bulk_create(
+        [
+            GoogleEmail(
+                social_account=social_account, gmail_message_id=msg["id"], data=msg
+            )
+            for msg in messages
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def store_google_calendar_events(social_account, items) -> int:
+    """
+    Store a page of calendar events, creating new and updating changed ones.
+    :param social_account: owning social account
+    :param items: calendar events
+    :return: number of new and changed events
+    """
+    with transaction.atomic():
+        events_existing = {
+            event.google_calendar_id: event
+            for event in GoogleCalendarEvent.objects.filter(
+                social_account=social_account,
+                google_calendar_id__in=[item["id"] for item in items],
+            ).only("id", "google_calendar_id", "data")
+        }
+
+        events_new = []
+        events_changed = []
+        for item in items:
+            gcal_event = events_existing.get(item["id"])
+            if not gcal_event:
+                if item.get("status") == GoogleCalendarEventStatus.CANCELLED.value:
+                    # deleted before we have seen it
+                    continue
+                events_new.append(
+                    GoogleCalendarEvent(
+                        social_account=social_account,
+                        google_calendar_id=item["id"],
+                        data=item,
+                    )
+                )
+            elif gcal_event.data != item:
+                # calendar events can change, so needs to be updated
+                gcal_event.data = item
+                gcal_event.updated_at = timezone.now()
+                events_changed.append(gcal_event)
+
+        GoogleCalendarEvent.objects.bulk_create(events_new, ignore_conflicts=True)
+        GoogleCalendarEvent.objects.bulk_update(events_changed, ["data", "updated_at"])
+
+    return len(events_new) + len(events_changed)
+
+
+def get_email_addresses(google_email: GoogleEmail) -> typing.Set[str]:
+    """
+    Get all addresses (from and to) of an email.
+    :param google_email: email
+    :return: cleaned addresses
+    """
+    google_email_adapter = GmailEmailAdapter(google_email.data)
+    return set(google_email_adapter.get_to_emails()) | {
+        google_email_adapter.get_from_email()
+    }
+
+
+def get_calendar_event_addresses(event: GoogleCalendarEvent) -> typing.Set[str]:
+    """
+    Get the addresses of all attendees of a calendar event.
+    :param event: calendar event
+    :return: cleaned addresses
+    """
+    event_adapter = GoogleCalendarEventAdapter(event.data)
+    return {
+        clean_email(attendee["email"]) for attendee in event_adapter.get_attendees()
+    }
+
 
 def update_email_interaction(
-    google_email: GoogleEmail, ignore_emails=()
+    google_email: GoogleEmail, ignore_emails=(), resolver: ContactEmailResolver = None
 ) -> Interaction:
     user = google_email.social_account.user
 
@@ -303,35 +735,30 @@ def update_email_interaction(
     interaction.title = google_email_adapter.get_subject() or EMAIL_TITLE_DEFAULT
     interaction.description = google_email_adapter.get_snippet()
     interaction.was_at = google_email_adapter.get_date()
+    interaction.source = InteractionSource.GMAIL
     interaction.type_id = None
     interaction.user = user
     interaction.save()
 
     # remeber created interaction
     google_email.interaction = interaction
-    google_email.save()
+    google_email.save(update_fields=["interaction"])
 
     # connect contacts
-    emails_raw = set(google_email_adapter.get_to_emails()) | {
-        google_email_adapter.get_from_email()
-    }
-    email_addresses = [
-        get_or_create_contact_email(email, user)
-        for email in emails_raw
-        if email not in ignore_emails
-    ]
-    interaction.contacts.set({ea.contact for ea in email_addresses})
+    emails = get_email_addresses(google_email) - set(ignore_emails)
+    interaction.contacts.set(get_contact_ids(emails, user, resolver))
 
     return interaction
 
 
 def update_calendar_interaction(
-    event: GoogleCalendarEvent, ignore_emails=()
+    event: GoogleCalendarEvent, ignore_emails=(), resolver: ContactEmailResolver = None
 ) -> typing.Optional[Interaction]:
     """
     Takes a google calendar event and creates/updates/deletes the corresponding interaction.
     :param ignore_emails: ignored emails
     :param event: calendar event
+    :param resolver: resolver to map emails to contacts, optional
     """
     user = event.social_account.user
 
@@ -363,22 +790,18 @@ def update_calendar_interaction(
         interaction.title = event_adapter.get_summary()
         interaction.description = "Google Calendar Event"
         interaction.was_at = event_end_datetime.astimezone()
+        interaction.source = InteractionSource.CALENDAR
         interaction.type_id = None
         interaction.user = user
         interaction.save()
 
         # remember interaction in event
         event.interaction = interaction
-        event.save()
+        event.save(update_fields=["interaction"])
 
         # connect all invitees
-        emails_raw = {attendee["email"] for attendee in event_adapter.get_attendees()}
-        email_addresses = [
-            get_or_create_contact_email(email, user)
-            for email in emails_raw
-            if email not in ignore_emails
-        ]
-        interaction.contacts.set({ea.contact for ea in email_addresses})
+        emails = get_calendar_event_addresses(event) - set(ignore_emails)
+        interaction.contacts.set(get_contact_ids(emails, user, resolver))
 
         return interaction
     else:
@@ -387,3 +810,16 @@ def update_calendar_interaction(
         if event.interaction:
             event.interaction.delete()
         return None
+
+
+def get_contact_ids(emails, user, resolver: ContactEmailResolver = None):
+    """
+    Get or create the contacts of the given emails.
+    :param emails: cleaned emails
+    :param user: owning user
+    :param resolver: resolver to use, falls back to one query per email if None
+    :return: contact ids
+    """
+    if resolver:
+        return set(resolver.resolve(emails).values())
+    return {get_or_create_contact_email(email, user).contact_id for email in emails}
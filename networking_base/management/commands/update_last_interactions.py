@@ -0,0 +1,26 @@
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand
+
+from networking_base.dashboard import invalidate_dashboard
+from networking_base.models import (
+    CONTACT_CHUNK_SIZE,
+    Contact,
+    rebuild_contact_interaction_stats,
+    update_contact_interaction_dates,
+)
+
+
+class Command(BaseCommand):
+    help = "Backfill interaction dates and stats of all contacts."
+
+    def handle(self, *args, **options):
+        for user in User.objects.all():
+            contact_ids = Contact.objects.filter(user=user).values_list("id", flat=True)
+            contact_ids = list(contact_ids)
+            count = 0
+            for i in range(0, len(contact_ids), CONTACT_CHUNK_SIZE):
+                chunk = contact_ids[i : i + CONTACT_CHUNK_SIZE]
+                count += update_contact_interaction_dates(chunk)
+            rebuild_contact_interaction_stats(user)
+            invalidate_dashboard([user.id])
+            self.stdout.write(f"{user}: updated {count} contacts")
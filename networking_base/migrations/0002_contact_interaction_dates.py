@@ -0,0 +1,46 @@
+# Generated by Django 3.2.6 on 2026-10-18 02:44
+
+from datetime import datetime, timedelta
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_interaction_dates(apps, schema_editor):
+    # see networking_base.models.update_contact_interaction_dates
+    Contact = apps.get_model("networking_base", "Contact")
+    last_interaction_default = datetime.now().astimezone() - timedelta(days=365)
+
+    contacts = Contact.objects.annotate(
+        last_interaction_at_actual=Max("interactions__was_at")
+    )
+    for contact in contacts:
+        contact.last_interaction_at = contact.last_interaction_at_actual
+        if contact.frequency_in_days:
+            contact.due_at = (
+                contact.last_interaction_at or last_interaction_default
+            ) + timedelta(days=contact.frequency_in_days)
+    Contact.objects.bulk_update(
+        contacts, ["last_interaction_at", "due_at"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("networking_base", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="contact",
+            name="due_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="contact",
+            name="last_interaction_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_interaction_dates, migrations.RunPython.noop),
+    ]
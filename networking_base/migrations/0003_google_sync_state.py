@@ -0,0 +1,41 @@
+# Generated by Django 3.2.6 on 2026-10-18 02:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("socialaccount", "0003_extra_data_default_dict"),
+        ("networking_base", "0002_contact_interaction_dates"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GoogleSyncState",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "gmail_history_id",
+                    models.CharField(blank=True, max_length=100, null=True),
+                ),
+                (
+                    "social_account",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="google_sync_state",
+                        to="socialaccount.socialaccount",
+                    ),
+                ),
+            ],
+        ),
+    ]
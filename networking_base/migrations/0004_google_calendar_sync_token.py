@@ -0,0 +1,18 @@
+# Generated by Django 3.2.6 on 2026-10-18 02:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("networking_base", "0003_google_sync_state"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="googlesyncstate",
+            name="calendar_sync_token",
+            field=models.CharField(blank=True, max_length=500, null=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.6 on 2026-10-18 02:51
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicates(apps, schema_editor):
+    # the previous existence checks were racy, keep the first of each duplicate
+    Interaction = apps.get_model("networking_base", "Interaction")
+    for model_name, id_field in [
+        ("GoogleEmail", "gmail_message_id"),
+        ("GoogleCalendarEvent", "google_calendar_id"),
+    ]:
+        model = apps.get_model("networking_base", model_name)
+        duplicates = (
+            model.objects.values("social_account", id_field)
+            .annotate(count=Count("id"), id_min=Min("id"))
+            .filter(count__gt=1)
+        )
+        for duplicate in duplicates:
+            rows_duplicate = model.objects.filter(
+                social_account=duplicate["social_account"],
+                **{id_field: duplicate[id_field]},
+            ).exclude(id=duplicate["id_min"])
+            Interaction.objects.filter(
+                id__in=rows_duplicate.values("interaction_id")
+            ).delete()
+            rows_duplicate.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("networking_base", "0004_google_calendar_sync_token"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="googlecalendarevent",
+            constraint=models.UniqueConstraint(
+                fields=("social_account", "google_calendar_id"),
+                name="unique_google_calendar_event_per_account",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="googleemail",
+            constraint=models.UniqueConstraint(
+                fields=("social_account", "gmail_message_id"),
+                name="unique_gmail_message_per_account",
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.6 on 2026-10-18 02:53
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("networking_base", "0005_google_unique_ids"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="googlecalendarevent",
+            name="interaction_synced_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="googlecalendarevent",
+            name="updated_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name="googleemail",
+            name="interaction_synced_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="googleemail",
+            name="updated_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
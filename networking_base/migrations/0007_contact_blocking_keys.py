@@ -0,0 +1,60 @@
+# Generated by Django 3.2.6 on 2026-10-18 03:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("networking_base", "0006_google_interaction_synced_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="contact",
+            name="duplicates_indexed_name",
+            field=models.CharField(
+                blank=True, editable=False, max_length=50, null=True
+            ),
+        ),
+        migrations.CreateModel(
+            name="ContactBlockingKey",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=100)),
+                (
+                    "contact",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="blocking_keys",
+                        to="networking_base.contact",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="contactblockingkey",
+            index=models.Index(
+                fields=["user", "key"], name="networking__user_id_425c97_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.6 on 2026-10-18 03:20
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+def store_pairs_once(apps, schema_editor):
+    # pairs were stored in both directions, keep one row with the lower id first
+    ContactDuplicate = apps.get_model("networking_base", "ContactDuplicate")
+    ContactDuplicate.objects.filter(contact=models.F("other_contact")).delete()
+
+    rows_kept = {}
+    ids_delete = []
+    for row_id, contact_id, other_contact_id, similarity in (
+        ContactDuplicate.objects.order_by("id")
+        .values_list("id", "contact_id", "other_contact_id", "similarity")
+        .iterator()
+    ):
+        pair = (min(contact_id, other_contact_id), max(contact_id, other_contact_id))
+        if pair in rows_kept:
+            ids_delete.append(row_id)
+        else:
+            rows_kept[pair] = (row_id, contact_id, similarity)
+
+    for i in range(0, len(ids_delete), 500):
+        ContactDuplicate.objects.filter(id__in=ids_delete[i : i + 500]).delete()
+    ContactDuplicate.objects.bulk_update(
+        [
+            ContactDuplicate(id=row_id, contact_id=pair[0], other_contact_id=pair[1])
+            for pair, (row_id, contact_id, _) in rows_kept.items()
+            if contact_id != pair[0]
+        ],
+        ["contact", "other_contact"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("networking_base", "0007_contact_blocking_keys"),
+    ]
+
+    operations = [
+        migrations.RunPython(store_pairs_once, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="contactduplicate",
+            index=models.Index(
+                fields=["contact", "-similarity"], name="contact_duplicate_contact"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="contactduplicate",
+            index=models.Index(
+                fields=["other_contact", "-similarity"], name="contact_duplicate_other"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="contactduplicate",
+            constraint=models.UniqueConstraint(
+                fields=("contact", "other_contact"), name="unique_contact_duplicate"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="contactduplicate",
+            constraint=models.CheckConstraint(
+                check=models.Q(
+                    ("contact__lt", django.db.models.expressions.F("other_contact"))
+                ),
+                name="contact_duplicate_ordered",
+            ),
+        ),
+    ]
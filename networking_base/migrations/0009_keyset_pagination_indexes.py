@@ -0,0 +1,23 @@
+# Generated by Django 3.2.6 on 2026-10-18 03:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("networking_base", "0008_contact_duplicate_pairs"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="contact",
+            index=models.Index(fields=["user", "name", "id"], name="contact_user_name"),
+        ),
+        migrations.AddIndex(
+            model_name="interaction",
+            index=models.Index(
+                fields=["user", "-was_at", "-id"], name="interaction_user_was_at"
+            ),
+        ),
+    ]
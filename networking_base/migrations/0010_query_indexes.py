@@ -0,0 +1,33 @@
+# Generated by Django 3.2.6 on 2026-10-18 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("networking_base", "0009_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        # interactions of a contact, the through table only has single column indexes
+        migrations.RunSQL(
+            "CREATE INDEX interaction_contacts_contact "
+            "ON networking_base_interaction_contacts (contact_id, interaction_id)",
+            "DROP INDEX interaction_contacts_contact",
+        ),
+        migrations.AddIndex(
+            model_name="contact",
+            index=models.Index(
+                fields=["user", "due_at", "name"], name="contact_user_due_at"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="emailaddress",
+            index=models.Index(fields=["email"], name="email_address_email"),
+        ),
+        migrations.AddIndex(
+            model_name="interaction",
+            index=models.Index(fields=["was_at"], name="interaction_was_at"),
+        ),
+    ]
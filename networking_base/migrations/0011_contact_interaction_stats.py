@@ -0,0 +1,146 @@
+# Generated by Django 3.2.6 on 2026-10-18 03:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_interaction_stats(apps, schema_editor):
+    # see networking_base.models.update_contact_interaction_stats
+    Interaction = apps.get_model("networking_base", "Interaction")
+    ContactInteractionStats = apps.get_model(
+        "networking_base", "ContactInteractionStats"
+    )
+    ContactInteractionDay = apps.get_model("networking_base", "ContactInteractionDay")
+
+    contact_interactions = Interaction.contacts.through.objects.all()
+    stats = contact_interactions.values("contact_id", "contact__user_id").annotate(
+        count=Count("id"),
+        first=Min("interaction__was_at"),
+        last=Max("interaction__was_at"),
+    )
+    ContactInteractionStats.objects.bulk_create(
+        [
+            ContactInteractionStats(
+                contact_id=row["contact_id"],
+                user_id=row["contact__user_id"],
+                interaction_count=row["count"],
+                first_interaction_at=row["first"],
+                last_interaction_at=row["last"],
+            )
+            for row in stats
+        ],
+        batch_size=500,
+    )
+
+    days = (
+        contact_interactions.annotate(
+            day=TruncDate("interaction__was_at", tzinfo=timezone.utc)
+        )
+        .values("contact_id", "contact__user_id", "day")
+        .annotate(count=Count("id"))
+    )
+    ContactInteractionDay.objects.bulk_create(
+        [
+            ContactInteractionDay(
+                contact_id=row["contact_id"],
+                user_id=row["contact__user_id"],
+                day=row["day"],
+                interaction_count=row["count"],
+            )
+            for row in days
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("networking_base", "0010_query_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ContactInteractionStats",
+            fields=[
+                (
+                    "contact",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="interaction_stats",
+                        serialize=False,
+                        to="networking_base.contact",
+                    ),
+                ),
+                ("interaction_count", models.PositiveIntegerField()),
+                ("first_interaction_at", models.DateTimeField()),
+                ("last_interaction_at", models.DateTimeField()),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ContactInteractionDay",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("interaction_count", models.PositiveIntegerField()),
+                (
+                    "contact",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="interaction_days",
+                        to="networking_base.contact",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="contactinteractionstats",
+            index=models.Index(
+                fields=["user", "-interaction_count"], name="contact_stats_user_count"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="contactinteractionday",
+            index=models.Index(
+                fields=["user", "day", "contact", "interaction_count"],
+                name="contact_day_user_day",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="contactinteractionday",
+            constraint=models.UniqueConstraint(
+                fields=("contact", "day"), name="unique_contact_interaction_day"
+            ),
+        ),
+        migrations.RunPython(backfill_interaction_stats, migrations.RunPython.noop),
+    ]
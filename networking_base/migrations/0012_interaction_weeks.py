@@ -0,0 +1,187 @@
+# Generated by Django 3.2.6 on 2026-10-18 03:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DateField
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+
+def backfill_interaction_weeks(apps, schema_editor):
+    # see networking_base.analytics
+    Interaction = apps.get_model("networking_base", "Interaction")
+    InteractionWeek = apps.get_model("networking_base", "InteractionWeek")
+    ContactInteractionWeek = apps.get_model("networking_base", "ContactInteractionWeek")
+
+    Interaction.objects.filter(google_emails__isnull=False).update(source="gmail")
+    Interaction.objects.filter(google_calendar_events__isnull=False).update(
+        source="calendar"
+    )
+
+    counts = (
+        Interaction.objects.annotate(
+            week=TruncWeek("was_at", output_field=DateField(), tzinfo=timezone.utc)
+        )
+        .values("user_id", "week", "source")
+        .annotate(count=Count("id"))
+    )
+    InteractionWeek.objects.bulk_create(
+        [
+            InteractionWeek(
+                user_id=row["user_id"],
+                week=row["week"],
+                source=row["source"],
+                interaction_count=row["count"],
+            )
+            for row in counts
+        ],
+        batch_size=500,
+    )
+
+    counts = (
+        Interaction.contacts.through.objects.annotate(
+            week=TruncWeek(
+                "interaction__was_at", output_field=DateField(), tzinfo=timezone.utc
+            )
+        )
+        .values("contact_id", "contact__user_id", "week", "interaction__source")
+        .annotate(count=Count("id"))
+    )
+    ContactInteractionWeek.objects.bulk_create(
+        [
+            ContactInteractionWeek(
+                contact_id=row["contact_id"],
+                user_id=row["contact__user_id"],
+                week=row["week"],
+                source=row["interaction__source"],
+                interaction_count=row["count"],
+            )
+            for row in counts
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("networking_base", "0011_contact_interaction_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="interaction",
+            name="source",
+            field=models.CharField(
+                choices=[
+                    ("manual", "Manual"),
+                    ("gmail", "Gmail"),
+                    ("calendar", "Calendar"),
+                ],
+                default="manual",
+                editable=False,
+                max_length=20,
+            ),
+        ),
+        migrations.CreateModel(
+            name="InteractionWeek",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("week", models.DateField()),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[
+                            ("manual", "Manual"),
+                            ("gmail", "Gmail"),
+                            ("calendar", "Calendar"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("interaction_count", models.PositiveIntegerField()),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ContactInteractionWeek",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("week", models.DateField()),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[
+                            ("manual", "Manual"),
+                            ("gmail", "Gmail"),
+                            ("calendar", "Calendar"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("interaction_count", models.PositiveIntegerField()),
+                (
+                    "contact",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="interaction_weeks",
+                        to="networking_base.contact",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="interactionweek",
+            constraint=models.UniqueConstraint(
+                fields=("user", "week", "source"), name="unique_interaction_week"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="contactinteractionweek",
+            index=models.Index(
+                fields=["user", "week", "contact", "source", "interaction_count"],
+                name="contact_week_user_week",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="contactinteractionweek",
+            constraint=models.UniqueConstraint(
+                fields=("contact", "week", "source"),
+                name="unique_contact_interaction_week",
+            ),
+        ),
+        migrations.RunPython(backfill_interaction_weeks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 3.2.6 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("networking_base", "0012_interaction_weeks"),
+    ]
+
+    operations = [
+        # the table and its contact index already exist, see 0010_query_indexes
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name="InteractionContact",
+                    fields=[
+                        (
+                            "id",
+                            models.AutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        (
+                            "contact",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                to="networking_base.contact",
+                            ),
+                        ),
+                        (
+                            "interaction",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                to="networking_base.interaction",
+                            ),
+                        ),
+                    ],
+                    options={
+                        "db_table": "networking_base_interaction_contacts",
+                        "unique_together": {("interaction", "contact")},
+                    },
+                ),
+                migrations.AddIndex(
+                    model_name="interactioncontact",
+                    index=models.Index(
+                        fields=["contact", "interaction"],
+                        name="interaction_contacts_contact",
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="interaction",
+                    name="contacts",
+                    field=models.ManyToManyField(
+                        related_name="interactions",
+                        through="networking_base.InteractionContact",
+                        to="networking_base.Contact",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name="interaction",
+            name="interaction_was_at",
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.6 on 2026-10-18 14:10
+
+from datetime import datetime, timedelta
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def update_due_dates(apps, schema_editor):
+    # see networking_base.models.LAST_INTERACTION_DEFAULT
+    Contact = apps.get_model("networking_base", "Contact")
+    last_interaction_default = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+    contacts = Contact.objects.filter(
+        last_interaction_at__isnull=True, frequency_in_days__isnull=False
+    ).exclude(frequency_in_days=0)
+    contacts = list(contacts)
+    for contact in contacts:
+        contact.due_at = last_interaction_default + timedelta(
+            days=contact.frequency_in_days
+        )
+    Contact.objects.bulk_update(contacts, ["due_at"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("networking_base", "0013_interaction_contact"),
+    ]
+
+    operations = [
+        migrations.RunPython(update_due_dates, migrations.RunPython.noop),
+    ]
@@ -1,17 +1,37 @@
 import typing
-from datetime import datetime, timedelta
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
 from enum import Enum
 
 from allauth.socialaccount.models import SocialAccount
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Count
+from django.db import connection, models, transaction
+from django.db.models import (
+    Count,
+    Exists,
+    F,
+    IntegerField,
+    Max,
+    Min,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+)
+from django.db.models.functions import Coalesce, Greatest, TruncDate
 from django.urls import reverse
+from django.utils import timezone
 
-LAST_INTERACTION_DEFAULT = datetime.now().astimezone() - timedelta(days=365)
+# contacts without interactions are due since long ago, fixed so due dates stored
+# in the database don't depend on when the process started
+LAST_INTERACTION_DEFAULT = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
 CONTACT_FREQUENCY_DEFAULT = None
 
+# contacts updated per query, stays below the query parameter limit of sqlite
+CONTACT_CHUNK_SIZE = 500
+
 
 class ContactStatus(Enum):
     HIDDEN = -1
@@ -33,15 +53,43 @@ class Contact(models.Model):
     linkedin_url = models.URLField(max_length=100, null=True, blank=True)
     twitter_url = models.URLField(max_length=100, null=True, blank=True)
 
+    # denormalized from interactions, see update_contact_interaction_dates
+    last_interaction_at = models.DateTimeField(null=True, blank=True, editable=False)
+    due_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # name duplicates were last computed for, see networking_base.duplicates
+    duplicates_indexed_name = models.CharField(
+        max_length=50, null=True, blank=True, editable=False
+    )
+
+    class Meta:
+        indexes = [
+            # keyset pagination, see networking_web.pagination
+            models.Index(fields=["user", "name", "id"], name="contact_user_name"),
+            # due contacts on the dashboard, see get_due_contacts
+            models.Index(fields=["user", "due_at", "name"], name="contact_user_due_at"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            # interactions might have changed since loading, see signals
+            self.last_interaction_at = (
+                Contact.objects.filter(pk=self.pk)
+                .values_list("last_interaction_at", flat=True)
+                .first()
+            )
+        # due date depends on frequency, so keep it in sync on every save
+        self.due_at = self.get_due_date()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | {"due_at"}
+        super().save(*args, **kwargs)
+
     def get_last_interaction(self) -> "Interaction":
         return self.interactions.order_by("-was_at").first()
 
     def get_last_interaction_date_or_default(self) -> datetime:
-        li = self.get_last_interaction()
-        lid = LAST_INTERACTION_DEFAULT
-        if li:
-            lid = li.was_at
-        return lid
+        return self.last_interaction_at or LAST_INTERACTION_DEFAULT
 
     def get_urgency(self) -> int:
         """
@@ -80,12 +128,47 @@ class Contact(models.Model):
 class ContactDuplicate(models.Model):
     """
     A potential duplicate.
+    Each pair is stored once with the lower id as contact, see get_contact_duplicates.
     """
 
     contact = models.ForeignKey(Contact, models.CASCADE, related_name="+")
     other_contact = models.ForeignKey(Contact, models.CASCADE, related_name="+")
     similarity = models.FloatField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["contact", "other_contact"], name="unique_contact_duplicate"
+            ),
+            models.CheckConstraint(
+                check=Q(contact__lt=F("other_contact")),
+                name="contact_duplicate_ordered",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["contact", "-similarity"], name="contact_duplicate_contact"
+            ),
+            models.Index(
+                fields=["other_contact", "-similarity"],
+                name="contact_duplicate_other",
+            ),
+        ]
+
+
+class ContactBlockingKey(models.Model):
+    """
+    A block a contact belongs to, only contacts sharing a block are compared
+    when looking for duplicates.
+    """
+
+    user = models.ForeignKey(User, models.CASCADE, related_name="+")
+    contact = models.ForeignKey(Contact, models.CASCADE, related_name="blocking_keys")
+    key = models.CharField(max_length=100)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "key"])]
+
 
 class EmailAddress(models.Model):
     """
@@ -97,6 +180,10 @@ class EmailAddress(models.Model):
 
     class Meta:
         unique_together = ("contact", "email")
+        indexes = [
+            # contacts of an email, see get_or_create_contact_email
+            models.Index(fields=["email"], name="email_address_email"),
+        ]
 
 
 class PhoneNumber(models.Model):
@@ -118,6 +205,12 @@ class InteractionType(models.Model):
     description = models.CharField(max_length=250)
 
 
+class InteractionSource(models.TextChoices):
+    MANUAL = "manual"
+    GMAIL = "gmail"
+    CALENDAR = "calendar"
+
+
 class Interaction(models.Model):
     """
     An interaction with a specific contact.
@@ -126,18 +219,155 @@ class Interaction(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="interactions"
     )
-    contacts = models.ManyToManyField(Contact, related_name="interactions")
+    contacts = models.ManyToManyField(
+        Contact, related_name="interactions", through="InteractionContact"
+    )
     type = models.ForeignKey(InteractionType, models.SET_NULL, blank=True, null=True)
 
     title = models.CharField(max_length=100)
     description = models.TextField()
     was_at = models.DateTimeField()
+    source = models.CharField(
+        max_length=20,
+        choices=InteractionSource.choices,
+        default=InteractionSource.MANUAL,
+        editable=False,
+    )
     # is_outgoing = models.BooleanField()
 
+    class Meta:
+        indexes = [
+            # keyset pagination, see networking_web.pagination
+            models.Index(
+                fields=["user", "-was_at", "-id"], name="interaction_user_was_at"
+            ),
+        ]
+
     def __str__(self):
         return f"{self.user}: {self.title} at {self.was_at}"
 
 
+class InteractionContact(models.Model):
+    """
+    A contact taking part in an interaction, see Interaction.contacts.
+    """
+
+    interaction = models.ForeignKey(Interaction, on_delete=models.CASCADE)
+    contact = models.ForeignKey(Contact, on_delete=models.CASCADE)
+
+    class Meta:
+        db_table = "networking_base_interaction_contacts"
+        unique_together = [("interaction", "contact")]
+        indexes = [
+            # interactions of a contact, see ContactDetailView
+            models.Index(
+                fields=["contact", "interaction"], name="interaction_contacts_contact"
+            ),
+        ]
+
+
+class ContactInteractionStats(models.Model):
+    """
+    Interaction counts and dates of a contact, to rank contacts without
+    aggregating their interactions, see update_contact_interaction_stats.
+    Only contacts with interactions have stats.
+    """
+
+    contact = models.OneToOneField(
+        Contact, models.CASCADE, primary_key=True, related_name="interaction_stats"
+    )
+    user = models.ForeignKey(User, models.CASCADE, related_name="+")
+    interaction_count = models.PositiveIntegerField()
+    first_interaction_at = models.DateTimeField()
+    last_interaction_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # most frequent contacts, see get_frequent_contacts
+            models.Index(
+                fields=["user", "-interaction_count"],
+                name="contact_stats_user_count",
+            ),
+        ]
+
+
+class ContactInteractionDay(models.Model):
+    """
+    Number of interactions with a contact on a day (UTC),
+    see update_contact_interaction_stats.
+    """
+
+    contact = models.ForeignKey(
+        Contact, models.CASCADE, related_name="interaction_days"
+    )
+    user = models.ForeignKey(User, models.CASCADE, related_name="+")
+    day = models.DateField()
+    interaction_count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["contact", "day"], name="unique_contact_interaction_day"
+            ),
+        ]
+        indexes = [
+            # recent contacts, see get_recent_contacts
+            models.Index(
+                fields=["user", "day", "contact", "interaction_count"],
+                name="contact_day_user_day",
+            ),
+        ]
+
+
+class InteractionWeek(models.Model):
+    """
+    Number of interactions of a user per week (starting Monday, UTC) and source,
+    see networking_base.analytics.
+    """
+
+    user = models.ForeignKey(User, models.CASCADE, related_name="+")
+    week = models.DateField()
+    source = models.CharField(max_length=20, choices=InteractionSource.choices)
+    interaction_count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "week", "source"], name="unique_interaction_week"
+            ),
+        ]
+
+
+class ContactInteractionWeek(models.Model):
+    """
+    Number of interactions with a contact per week (starting Monday, UTC) and source,
+    see networking_base.analytics.
+    """
+
+    contact = models.ForeignKey(
+        Contact, models.CASCADE, related_name="interaction_weeks"
+    )
+    user = models.ForeignKey(User, models.CASCADE, related_name="+")
+    week = models.DateField()
+    source = models.CharField(max_length=20, choices=InteractionSource.choices)
+    interaction_count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["contact", "week", "source"],
+                name="unique_contact_interaction_week",
+            ),
+        ]
+        indexes = [
+            # interactions per contact, see get_interaction_analytics
+            models.Index(
+                fields=["user", "week", "contact", "source", "interaction_count"],
+                name="contact_week_user_week",
+            ),
+        ]
+
+
 #
 # Google
 #
@@ -155,6 +385,18 @@ class GoogleEmail(models.Model):
     gmail_message_id = models.CharField(max_length=100)
     data = models.JSONField()
 
+    # interaction needs an update if data changed after it has been synced
+    updated_at = models.DateTimeField(default=timezone.now)
+    interaction_synced_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["social_account", "gmail_message_id"],
+                name="unique_gmail_message_per_account",
+            )
+        ]
+
 
 class GoogleCalendarEvent(models.Model):
     # link to social account and delete if social account gets deleted
@@ -171,60 +413,455 @@ class GoogleCalendarEvent(models.Model):
     # data
     data = models.JSONField()
 
+    # interaction needs an update if data changed after it has been synced
+    updated_at = models.DateTimeField(default=timezone.now)
+    interaction_synced_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["social_account", "google_calendar_id"],
+                name="unique_google_calendar_event_per_account",
+            )
+        ]
+
+
+class GoogleSyncState(models.Model):
+    """
+    Sync progress of a google account, used to only fetch changes.
+    """
+
+    social_account = models.OneToOneField(
+        SocialAccount, models.CASCADE, related_name="google_sync_state"
+    )
+
+    # gmail history id of the last sync, see users.history.list
+    gmail_history_id = models.CharField(max_length=100, null=True, blank=True)
+
+    # calendar sync token of the last sync, see events.list
+    calendar_sync_token = models.CharField(max_length=500, null=True, blank=True)
+
 
 #
 # helpers
 #
 
 
+def get_week(was_at: datetime) -> date:
+    """
+    Get the week of a point in time.
+    :param was_at: point in time
+    :return: first day of the week, i.e. Monday (UTC)
+    """
+    day = was_at.astimezone(timezone.utc).date()
+    return day - timedelta(days=day.weekday())
+
+
 def get_recent_contacts(user, limit=5, timespan_days=14) -> typing.List[Contact]:
     """
-    Fetch contacts recently interacted with.
+    Fetch contacts recently interacted with. Interactions are counted per day
+    (UTC), i.e. the whole first day of the timespan is included.
     :param user: user
     :param limit: limit
     :param timespan_days: definition of recent in days
-    :return: recent contacts
+    :return: recent contacts with their recent interaction count set as count
     """
-    timespan_recent = datetime.now().astimezone() - timedelta(days=timespan_days)
+    day_recent = (timezone.now() - timedelta(days=timespan_days)).date()
     contacts_recent = (
-        Contact.objects.filter(interactions__was_at__gt=timespan_recent)
-        .filter(user=user)
-        .annotate(count=Count("interactions"))
-        .order_by("-count")[:limit]
+        with_primary_email(Contact.objects.filter(user=user))
+        .filter(interaction_days__user=user, interaction_days__day__gte=day_recent)
+        .annotate(count=Sum("interaction_days__interaction_count"))
+        .order_by("-count", "id")[:limit]
     )
     return list(contacts_recent)
 
 
 def get_frequent_contacts(user, limit=5) -> typing.List[Contact]:
     """
-    Fetch contacts with frequent interactions.
+    Fetch contacts with frequent interactions. Contacts without interactions
+    are not listed.
     :param user: user
     :param limit: limit
-    :return: frequent contacts
+    :return: frequent contacts with their interaction count set as count
     """
     contacts_frequent = (
-        Contact.objects.filter(user=user)
-        .annotate(count=Count("interactions"))
-        .order_by("-count")[:limit]
+        with_primary_email(Contact.objects.filter(user=user))
+        .filter(interaction_stats__user=user)
+        .annotate(count=F("interaction_stats__interaction_count"))
+        .order_by("-interaction_stats__interaction_count", "id")[:limit]
     )
     return list(contacts_frequent)
 
 
-def get_due_contacts(user) -> typing.List[Contact]:
+def get_due_contacts(user, limit=None, offset=0) -> typing.List[Contact]:
     """
     Fetch due contacts and sort by urgency (desc).
     :param user: user
+    :param limit: limit (all if None)
+    :param offset: number of due contacts to skip
     :return: due contacts
     """
     contacts = (
-        Contact.objects.filter(user=user)
-        .order_by("name")
-        .prefetch_related("interactions")
-        .all()
+        with_primary_email(Contact.objects.filter(user=user)).filter(
+            get_contact_status_filter(ContactStatus.OUT_OF_TOUCH)
+        )
+        # earliest due date is most urgent
+        .order_by("due_at", "name")
+    )
+    if limit is None:
+        return list(contacts[offset:])
+    return list(contacts[offset : offset + limit])
+
+
+def with_primary_email(contacts: models.QuerySet) -> models.QuerySet:
+    """
+    Load the primary, i.e. first, email address of the contacts, so profile
+    pictures can be rendered without a query per contact.
+    :param contacts: contacts
+    :return: contacts with primary_email set (None if they have no email)
+    """
+    primary_email = EmailAddress.objects.filter(contact_id=OuterRef("pk")).order_by(
+        "id"
+    )
+    return contacts.annotate(primary_email=Subquery(primary_email.values("email")[:1]))
+
+
+def get_interactions_of_selected_contacts(user) -> models.QuerySet:
+    """
+    Past interactions of a user with at least one selected contact, latest first.
+    :param user: user
+    :return: interactions, see with_interaction_contacts
+    """
+    contacts_selected = Interaction.contacts.through.objects.filter(
+        interaction_id=OuterRef("pk"), contact__frequency_in_days__isnull=False
+    )
+    interactions = Interaction.objects.filter(
+        user=user, was_at__lt=timezone.now()
+    ).filter(
+        # instead of joining contacts, which repeats interactions with several
+        Exists(contacts_selected)
+    )
+    return with_interaction_contacts(interactions.order_by("-was_at"))
+
+
+def with_interaction_contacts(interactions: models.QuerySet) -> models.QuerySet:
+    """
+    Load names and count of contacts with the interactions, so they can be
+    rendered without a query per interaction.
+    :param interactions: interactions
+    :return: interactions with contacts prefetched and contact_count set
+    """
+    contact_count = (
+        Interaction.contacts.through.objects.filter(interaction_id=OuterRef("pk"))
+        .values("interaction_id")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    return interactions.annotate(
+        contact_count=Coalesce(Subquery(contact_count, output_field=IntegerField()), 0)
+    ).prefetch_related(
+        Prefetch("contacts", queryset=Contact.objects.only("id", "name"))
+    )
+
+
+def get_contact_duplicates(contact: Contact, limit=None) -> typing.List[Contact]:
+    """
+    Fetch the potential duplicates of a contact, most similar first.
+    :param contact: contact
+    :param limit: limit (all if None)
+    :return: other contacts with their similarity set as similarity
+    """
+    duplicates = (
+        ContactDuplicate.objects.filter(Q(contact=contact) | Q(other_contact=contact))
+        .select_related("contact", "other_contact")
+        .order_by("-similarity")
+    )
+    if limit is not None:
+        duplicates = duplicates[:limit]
+
+    contacts = []
+    for duplicate in duplicates:
+        if duplicate.contact_id == contact.id:
+            other_contact = duplicate.other_contact
+        else:
+            other_contact = duplicate.contact
+        other_contact.similarity = duplicate.similarity
+        contacts.append(other_contact)
+    return contacts
+
+
+def get_contact_status_filter(status: ContactStatus) -> Q:
+    """
+    Build a filter for contacts with the given status, see Contact.get_status.
+    :param status: contact status
+    :return: filter for contacts
+    """
+    if status == ContactStatus.HIDDEN:
+        return Q(due_at__isnull=True)
+
+    # urgency is measured in full days after the due date
+    out_of_touch_due_at = datetime.now().astimezone() - timedelta(days=1)
+    if status == ContactStatus.OUT_OF_TOUCH:
+        return Q(due_at__lte=out_of_touch_due_at)
+    return Q(due_at__gt=out_of_touch_due_at)
+
+
+def get_contact_status_counts(user) -> typing.Dict[str, int]:
+    """
+    Count contacts by status with a single query.
+    :param user: user
+    :return: counts of selected, out of touch, in touch, and hidden contacts
+    """
+    return Contact.objects.filter(user=user).aggregate(
+        selected=Count("id", filter=Q(due_at__isnull=False)),
+        out_of_touch=Count(
+            "id", filter=get_contact_status_filter(ContactStatus.OUT_OF_TOUCH)
+        ),
+        in_touch=Count("id", filter=get_contact_status_filter(ContactStatus.IN_TOUCH)),
+        hidden=Count("id", filter=get_contact_status_filter(ContactStatus.HIDDEN)),
+    )
+
+
+def update_contact_interaction_dates(contact_ids, use_stats=False) -> int:
+    """
+    Re-compute last interaction and due date of the given contacts.
+    :param contact_ids: ids of the contacts to update
+    :param use_stats: take the last interaction from the interaction stats
+        instead of aggregating all interactions, stats must be up to date
+    :return: number of changed contacts
+    """
+    if use_stats:
+        last_interaction_at = F("interaction_stats__last_interaction_at")
+    else:
+        last_interaction_at = Max("interactions__was_at")
+    contacts = Contact.objects.filter(id__in=contact_ids).annotate(
+        last_interaction_at_actual=last_interaction_at
+    )
+
+    contacts_changed = []
+    for contact in contacts:
+        dates_old = (contact.last_interaction_at, contact.due_at)
+        contact.last_interaction_at = contact.last_interaction_at_actual
+        contact.due_at = contact.get_due_date()
+        if (contact.last_interaction_at, contact.due_at) != dates_old:
+            contacts_changed.append(contact)
+    Contact.objects.bulk_update(
+        contacts_changed, ["last_interaction_at", "due_at"], batch_size=500
+    )
+    return len(contacts_changed)
+
+
+def update_contact_interaction_stats(contact_ids):
+    """
+    Re-compute interaction stats and days of the given contacts from all their
+    interactions, see update_contact_interaction_counts for single changes.
+    :param contact_ids: ids of the contacts to update
+    """
+    contact_ids = list(contact_ids)
+    contact_interactions = Interaction.contacts.through.objects.filter(
+        contact_id__in=contact_ids
+    )
+    stats = contact_interactions.values("contact_id", "contact__user_id").annotate(
+        count=Count("id"),
+        first=Min("interaction__was_at"),
+        last=Max("interaction__was_at"),
+    )
+    days = (
+        contact_interactions.annotate(
+            day=TruncDate("interaction__was_at", tzinfo=timezone.utc)
+        )
+        .values("contact_id", "contact__user_id", "day")
+        .annotate(count=Count("id"))
     )
-    contacts = filter(lambda c: c.get_urgency() > 0, contacts)
-    contacts = sorted(contacts, key=lambda c: c.get_urgency(), reverse=True)
-    return list(contacts)
+
+    with transaction.atomic():
+        ContactInteractionStats.objects.filter(contact_id__in=contact_ids).delete()
+        ContactInteractionDay.objects.filter(contact_id__in=contact_ids).delete()
+        ContactInteractionStats.objects.bulk_create(
+            [
+                ContactInteractionStats(
+                    contact_id=row["contact_id"],
+                    user_id=row["contact__user_id"],
+                    interaction_count=row["count"],
+                    first_interaction_at=row["first"],
+                    last_interaction_at=row["last"],
+                )
+                for row in stats
+            ],
+            batch_size=500,
+        )
+        ContactInteractionDay.objects.bulk_create(
+            [
+                ContactInteractionDay(
+                    contact_id=row["contact_id"],
+                    user_id=row["contact__user_id"],
+                    day=row["day"],
+                    interaction_count=row["count"],
+                )
+                for row in days
+            ],
+            batch_size=500,
+        )
+
+
+def update_contact_interaction_counts(changes):
+    """
+    Apply changed interactions to the interaction stats, days and weeks of their
+    contacts. Only the affected rows are touched and counts are adjusted in place,
+    first and last interaction are only re-computed if one of them was removed.
+    Expects the interactions to be changed already.
+    :param changes: tuples of contact id, date and source of an interaction
+        and 1 if it was added to the contact or -1 if it was removed
+    """
+    changes_by_contact = defaultdict(list)
+    for change in changes:
+        changes_by_contact[change[0]].append(change)
+
+    contact_ids = list(changes_by_contact)
+    for i in range(0, len(contact_ids), CONTACT_CHUNK_SIZE):
+        _update_contact_interaction_counts(
+            {
+                contact_id: changes_by_contact[contact_id]
+                for contact_id in contact_ids[i : i + CONTACT_CHUNK_SIZE]
+            }
+        )
+
+
+def _update_contact_interaction_counts(changes_by_contact):
+    counts, days, weeks = Counter(), Counter(), Counter()
+    dates_added, dates_removed = defaultdict(list), defaultdict(list)
+    for contact_id, changes in changes_by_contact.items():
+        for _, was_at, source, count in changes:
+            counts[contact_id] += count
+            days[contact_id, was_at.astimezone(timezone.utc).date()] += count
+            weeks[contact_id, get_week(was_at), source] += count
+            dates = dates_added if count > 0 else dates_removed
+            dates[contact_id].append(was_at)
+
+    # contacts might be gone already
+    user_ids = dict(
+        Contact.objects.filter(id__in=list(changes_by_contact)).values_list(
+            "id", "user_id"
+        )
+    )
+    has_removals = any(count < 0 for count in [*days.values(), *weeks.values()])
+
+    with transaction.atomic():
+        stats_old = ContactInteractionStats.objects.filter(contact_id__in=user_ids)
+        stats_old = {stats.contact_id: stats for stats in stats_old}
+        stats_new = []
+        for contact_id, user_id in user_ids.items():
+            stats = stats_old.get(contact_id)
+            if stats is None:
+                if counts[contact_id] > 0:
+                    stats_new.append(
+                        ContactInteractionStats(
+                            contact_id=contact_id,
+                            user_id=user_id,
+                            interaction_count=counts[contact_id],
+                            first_interaction_at=min(dates_added[contact_id]),
+                            last_interaction_at=max(dates_added[contact_id]),
+                        )
+                    )
+                continue
+
+            first, last = stats.first_interaction_at, stats.last_interaction_at
+            if any(d <= first or d >= last for d in dates_removed[contact_id]):
+                # a boundary might be gone
+                first, last = _get_contact_interaction_boundaries(contact_id)
+                if first is None:
+                    stats.delete()
+                    continue
+            else:
+                first = min([first, *dates_added[contact_id]])
+                last = max([last, *dates_added[contact_id]])
+
+            ContactInteractionStats.objects.filter(contact_id=contact_id).update(
+                interaction_count=Greatest(
+                    F("interaction_count") + counts[contact_id], 0
+                ),
+                first_interaction_at=first,
+                last_interaction_at=last,
+            )
+        ContactInteractionStats.objects.bulk_create(stats_new)
+
+        add_interaction_counts(
+            ContactInteractionDay, ["contact_id", "day"], days, user_ids
+        )
+        add_interaction_counts(
+            ContactInteractionWeek, ["contact_id", "week", "source"], weeks, user_ids
+        )
+        if has_removals:
+            for model in [
+                ContactInteractionStats,
+                ContactInteractionDay,
+                ContactInteractionWeek,
+            ]:
+                model.objects.filter(
+                    contact_id__in=user_ids, interaction_count=0
+                ).delete()
+
+
+def _get_contact_interaction_boundaries(contact_id):
+    boundaries = Interaction.objects.filter(contacts=contact_id).aggregate(
+        first=Min("was_at"), last=Max("was_at")
+    )
+    return boundaries["first"], boundaries["last"]
+
+
+def add_interaction_counts(model, fields, counts, user_ids=None):
+    """
+    Adjust the interaction counts of rollup rows in place and create missing rows,
+    one query per row as they are few. Rows are not counted below zero.
+    :param model: rollup model, e.g. ContactInteractionWeek
+    :param fields: fields identifying a row, in the order of the keys of counts
+    :param counts: changes of the interaction count by key
+    :param user_ids: user ids by contact id for rows of contacts, rows of other
+        contacts are skipped as they might be gone
+    """
+    rows_new = []
+    for key, count in counts.items():
+        values = dict(zip(fields, key))
+        if not count:
+            continue
+        if user_ids is not None:
+            if values["contact_id"] not in user_ids:
+                continue
+            values_new = {"user_id": user_ids[values["contact_id"]], **values}
+        else:
+            values_new = values
+
+        rows = model.objects.filter(**values)
+        updated = rows.update(
+            interaction_count=Greatest(F("interaction_count") + count, 0)
+        )
+        # nothing to remove from if the row is missing, e.g. before a rebuild
+        if not updated and count > 0:
+            rows_new.append(model(interaction_count=count, **values_new))
+    model.objects.bulk_create(rows_new, batch_size=500)
+
+
+def rebuild_contact_interaction_stats(user):
+    """
+    Re-compute the interaction stats and days of all contacts of a user,
+    e.g. after interactions were inserted in bulk.
+    :param user: user
+    """
+    contact_ids = list(Contact.objects.filter(user=user).values_list("id", flat=True))
+    for i in range(0, len(contact_ids), CONTACT_CHUNK_SIZE):
+        update_contact_interaction_stats(contact_ids[i : i + CONTACT_CHUNK_SIZE])
+
+
+def mark_google_items_changed(contact_ids):
+    """
+    Mark google items of the given contacts to have their interactions updated,
+    e.g. because the mapping of emails to contacts has changed.
+    :param contact_ids: ids of changed contacts
+    """
+    for model in [GoogleEmail, GoogleCalendarEvent]:
+        model.objects.filter(interaction__contacts__in=contact_ids).update(
+            interaction_synced_at=None
+        )
 
 
 def get_or_create_contact_email(email: str, user) -> EmailAddress:
@@ -247,6 +884,63 @@ def get_or_create_contact_email(email: str, user) -> EmailAddress:
     return ea
 
 
+class ContactEmailResolver:
+    """
+    Resolves emails to contacts of a user, creating missing ones in bulk.
+    All email addresses of the user are loaded once, so lookups are done in memory.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+        # first email address wins, like in get_or_create_contact_email
+        self._contact_ids = {}
+        email_addresses = (
+            EmailAddress.objects.filter(contact__user=user)
+            .order_by("id")
+            .values_list("email", "contact_id")
+        )
+        for email, contact_id in email_addresses:
+            self._contact_ids.setdefault(email, contact_id)
+
+    def resolve(self, emails) -> typing.Dict[str, int]:
+        """
+        Get or create the contacts of the given emails.
+        :param emails: raw emails
+        :return: contact ids by cleaned email
+        """
+        emails_clean = {clean_email(email) for email in emails}
+        emails_missing = emails_clean - self._contact_ids.keys()
+        if emails_missing:
+            self._create_contacts(sorted(emails_missing))
+        return {email: self._contact_ids[email] for email in emails_clean}
+
+    def _create_contacts(self, emails):
+        contacts = [
+            Contact(
+                user=self.user, name=email, frequency_in_days=CONTACT_FREQUENCY_DEFAULT
+            )
+            for email in emails
+        ]
+        with transaction.atomic():
+            if connection.features.can_return_rows_from_bulk_insert:
+                Contact.objects.bulk_create(contacts)
+            else:
+                # ids are needed for the email addresses
+                for contact in contacts:
+                    contact.save()
+
+            EmailAddress.objects.bulk_create(
+                [
+                    EmailAddress(email=email, contact=contact)
+                    for email, contact in zip(emails, contacts)
+                ]
+            )
+
+        for email, contact in zip(emails, contacts):
+            self._contact_ids[email] = contact.id
+
+
 def clean_email(email: str):
     """
     Clean an email address.
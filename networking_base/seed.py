@@ -0,0 +1,470 @@
+import json
+import random
+import typing
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from allauth.socialaccount.models import SocialAccount
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from networking_base.dashboard import invalidate_dashboard
+from networking_base.models import (
+    Contact,
+    ContactInteractionDay,
+    ContactInteractionStats,
+    ContactInteractionWeek,
+    EmailAddress,
+    GoogleCalendarEvent,
+    GoogleEmail,
+    Interaction,
+    InteractionSource,
+    InteractionWeek,
+    get_week,
+)
+
+SEED_BATCH_SIZE = 10000
+SEED_TIMESPAN_DAYS = 2 * 365
+SEED_TITLE = "Interaction"
+SEED_DESCRIPTIONS = {
+    InteractionSource.MANUAL: "Talked",
+    InteractionSource.GMAIL: "Talked",
+    # see update_calendar_interaction
+    InteractionSource.CALENDAR: "Google Calendar Event",
+}
+# page cache of sqlite while inserting, indexes of large tables don't fit the default
+SEED_SQLITE_CACHE_KB = 256 * 1024
+
+# plain strings, comparing and hashing enum members is slow in the insert loop
+SOURCE_MANUAL = InteractionSource.MANUAL.value
+SOURCE_GMAIL = InteractionSource.GMAIL.value
+SOURCE_CALENDAR = InteractionSource.CALENDAR.value
+
+FIRST_NAMES = (
+    "Anna Barbara Christian Daniel Elena Ferdinand Greta Hannah Ingrid Jonas Karl "
+    "Klaus Lena Lukas Maria Max Nina Otto Paul Peter Sophie Stefan Tobias Ulrike "
+    "Valentin Wilhelm"
+).split()
+LAST_NAMES = (
+    "Bauer Becker Duck Fischer Gamma Hoffmann Koch Krüger Lange Merkel Meyer Müller "
+    "Neumann Richter Schäfer Schmidt Schneider Schulz Wagner Weber Wolf Zimmermann"
+).split()
+
+
+def insert_seed_data(
+    user,
+    contacts=100,
+    interactions=10000,
+    duplicates=0.05,
+    google=0.0,
+    seed=0,
+    batch_size=SEED_BATCH_SIZE,
+) -> typing.Dict[str, int]:
+    """
+    Insert random but reproducible contacts and interactions for a user in bulk,
+    e.g. for load testing. Everything is inserted in one transaction.
+    Rows are inserted as plain tuples and signals are skipped. Dates, stats and
+    rollups are computed from the generated data instead, duplicates are left to
+    compute_duplicates.
+    :param user: user
+    :param contacts: number of contacts
+    :param interactions: number of interactions
+    :param duplicates: share of contacts named like another contact, with typos
+    :param google: share of interactions with a gmail message or calendar event
+    :param seed: seed, same seed and user result in the same data
+    :param batch_size: number of interactions inserted at once
+    :return: number of inserted rows by name
+    """
+    rng = random.Random(f"{seed}:{user.id}")
+
+    with transaction.atomic():
+        social_account = None
+        if google:
+            social_account = SocialAccount.objects.filter(
+                user=user, provider="google"
+            ).first() or SocialAccount.objects.create(
+                user=user, provider="google", uid=f"seed-{user.id}"
+            )
+
+        inserter = _SeedInserter(user, social_account, rng)
+        with _sqlite_cache_size(SEED_SQLITE_CACHE_KB):
+            inserter.insert_contacts(contacts, duplicates)
+            for start in range(0, interactions, batch_size):
+                inserter.insert_interactions(
+                    min(batch_size, interactions - start), google
+                )
+            inserter.insert_denormalized()
+
+        # explicit ids don't advance sequences, e.g. on postgres
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [Contact, Interaction]
+            ):
+                cursor.execute(sql)
+        invalidate_dashboard([user.id])
+
+    return inserter.counts
+
+
+def get_seed_name(rng: random.Random) -> str:
+    """
+    Get a random contact name.
+    :param rng: random number generator
+    :return: name
+    """
+    last_name = rng.choice(LAST_NAMES)
+    if rng.random() < 0.2:
+        last_name += "-" + rng.choice(LAST_NAMES)
+    return f"{rng.choice(FIRST_NAMES)} {last_name}"
+
+
+def get_seed_name_variant(name: str, rng: random.Random) -> str:
+    """
+    Get a variant of a name, like a typo or another way of writing it.
+    :param name: name
+    :param rng: random number generator
+    :return: variant
+    """
+    variant = rng.randrange(4)
+    i = rng.randrange(1, len(name) - 1)
+    if variant == 0:
+        # missing character
+        return name[:i] + name[i + 1 :]
+    if variant == 1:
+        # swapped characters
+        return name[: i - 1] + name[i] + name[i - 1] + name[i + 1 :]
+    if variant == 2:
+        return name.lower()
+    # last name first
+    first_name, _, last_name = name.partition(" ")
+    return f"{last_name}, {first_name}"
+
+
+class _SeedInserter:
+    """
+    Inserts generated rows and keeps track of the rows denormalized from them,
+    see update_contact_interaction_counts.
+    """
+
+    def __init__(self, user, social_account, rng):
+        self.user = user
+        self.social_account = social_account
+        self.rng = rng
+        self.now = timezone.now()
+        # ids of deleted interactions might be used again, see insert_interactions
+        self.run_id = f"{self.now:%Y%m%d%H%M%S%f}"
+        # whole seconds, like the dates of gmail messages
+        self.now = self.now.replace(microsecond=0)
+        self.user_email = user.email or f"{user.username}@example.org"
+        self.counts = dict.fromkeys(
+            [
+                "contacts",
+                "email_addresses",
+                "interactions",
+                "interaction_contacts",
+                "google_emails",
+                "google_calendar_events",
+            ],
+            0,
+        )
+
+        # ids are assigned here, no one else inserts during the transaction
+        self.contact_id_next = _get_id_next(Contact)
+        self.interaction_id_next = _get_id_next(Interaction)
+
+        self.contacts = []
+        self.contact_emails = {}
+        self.stats = {}
+        self.days = Counter()
+        self.contact_weeks = Counter()
+        self.weeks = Counter()
+        self._weeks_by_day = {}
+
+    def insert_contacts(self, count, duplicates):
+        rng = self.rng
+        for _ in range(count):
+            if self.contacts and rng.random() < duplicates:
+                name = get_seed_name_variant(rng.choice(self.contacts)[1], rng)
+            else:
+                name = get_seed_name(rng)
+            self.contacts.append((self.contact_id_next, name, rng.randrange(7, 60)))
+            self.contact_id_next += 1
+
+        email_addresses = []
+        for contact_id, name, _ in self.contacts:
+            local_part = "".join(c for c in name.lower() if c.isascii() and c.isalnum())
+            self.contact_emails[contact_id] = [
+                f"{local_part}.{contact_id}.{i}@example.org"
+                for i in range(1 if rng.random() < 0.8 else 2)
+            ]
+            email_addresses.extend(
+                (contact_id, email) for email in self.contact_emails[contact_id]
+            )
+
+        self.counts["contacts"] += _insert_rows(
+            Contact,
+            ["id", "user", "name", "frequency_in_days"],
+            [(c_id, self.user.id, name, f) for c_id, name, f in self.contacts],
+        )
+        self.counts["email_addresses"] += _insert_rows(
+            EmailAddress, ["contact", "email"], email_addresses
+        )
+
+    def insert_interactions(self, count, google):
+        rng = self.rng
+        contact_ids = list(self.contact_emails)
+        adapt_datetime = connection.ops.adapt_datetimefield_value
+        now = adapt_datetime(self.now)
+
+        interactions, interaction_contacts = [], []
+        google_emails, google_calendar_events = [], []
+        for _ in range(count):
+            interaction_id = self.interaction_id_next
+            self.interaction_id_next += 1
+
+            # some contacts are interacted with a lot more than others
+            contact_count = 1 if rng.random() < 0.8 else rng.randrange(2, 5)
+            ids = (
+                {
+                    contact_ids[int(len(contact_ids) * rng.random() ** 2)]
+                    for _ in range(contact_count)
+                }
+                if contact_ids
+                else set()
+            )
+
+            source = SOURCE_MANUAL
+            if rng.random() < google:
+                source = rng.choice([SOURCE_GMAIL, SOURCE_CALENDAR])
+            was_at = self.now - timedelta(
+                seconds=rng.randrange(SEED_TIMESPAN_DAYS * 86400)
+            )
+
+            interactions.append(
+                (
+                    interaction_id,
+                    self.user.id,
+                    SEED_TITLE,
+                    SEED_DESCRIPTIONS[source],
+                    adapt_datetime(was_at),
+                    source,
+                )
+            )
+            interaction_contacts.extend((interaction_id, c_id) for c_id in ids)
+            self._add_interaction(ids, was_at, source)
+
+            if source == SOURCE_MANUAL:
+                continue
+            emails = [self.contact_emails[contact_id][0] for contact_id in ids]
+            item_id = f"seed-{self.run_id}-{interaction_id}"
+            if source == SOURCE_GMAIL:
+                data = _get_gmail_message(item_id, was_at, self.user_email, emails)
+                items = google_emails
+            else:
+                data = _get_calendar_event(item_id, was_at, self.user_email, emails)
+                items = google_calendar_events
+            items.append(
+                (
+                    self.social_account.id,
+                    interaction_id,
+                    item_id,
+                    json.dumps(data),
+                    now,
+                    now,
+                )
+            )
+
+        self.counts["interactions"] += _insert_rows(
+            Interaction,
+            ["id", "user", "title", "description", "was_at", "source"],
+            interactions,
+        )
+        self.counts["interaction_contacts"] += _insert_rows(
+            Interaction.contacts.through,
+            ["interaction", "contact"],
+            interaction_contacts,
+        )
+        item_fields = ["data", "updated_at", "interaction_synced_at"]
+        self.counts["google_emails"] += _insert_rows(
+            GoogleEmail,
+            ["social_account", "interaction", "gmail_message_id", *item_fields],
+            google_emails,
+        )
+        self.counts["google_calendar_events"] += _insert_rows(
+            GoogleCalendarEvent,
+            ["social_account", "interaction", "google_calendar_id", *item_fields],
+            google_calendar_events,
+        )
+
+    def insert_denormalized(self):
+        """
+        Insert what signals would have maintained, see networking_base.signals.
+        """
+        adapt_datetime = connection.ops.adapt_datetimefield_value
+        adapt_date = connection.ops.adapt_datefield_value
+        user_id = self.user.id
+
+        contact_dates = []
+        for contact_id, _, frequency_in_days in self.contacts:
+            stats = self.stats.get(contact_id)
+            contact = Contact(
+                frequency_in_days=frequency_in_days,
+                last_interaction_at=stats[2] if stats else None,
+            )
+            contact_dates.append(
+                (
+                    adapt_datetime(contact.last_interaction_at),
+                    adapt_datetime(contact.get_due_date()),
+                    contact_id,
+                )
+            )
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {qn(Contact._meta.db_table)} "
+                f"SET {qn('last_interaction_at')} = %s, {qn('due_at')} = %s "
+                f"WHERE {qn('id')} = %s",
+                contact_dates,
+            )
+
+        _insert_rows(
+            ContactInteractionStats,
+            [
+                "contact",
+                "user",
+                "interaction_count",
+                "first_interaction_at",
+                "last_interaction_at",
+            ],
+            [
+                (
+                    contact_id,
+                    user_id,
+                    count,
+                    adapt_datetime(first),
+                    adapt_datetime(last),
+                )
+                for contact_id, (count, first, last) in sorted(self.stats.items())
+            ],
+        )
+        _insert_rows(
+            ContactInteractionDay,
+            ["contact", "user", "day", "interaction_count"],
+            [
+                (contact_id, user_id, adapt_date(day), count)
+                for (contact_id, day), count in sorted(self.days.items())
+            ],
+        )
+        _insert_rows(
+            ContactInteractionWeek,
+            ["contact", "user", "week", "source", "interaction_count"],
+            [
+                (contact_id, user_id, adapt_date(week), source, count)
+                for (contact_id, week, source), count in sorted(
+                    self.contact_weeks.items()
+                )
+            ],
+        )
+
+        # the user might have interactions already
+        weeks_existing = InteractionWeek.objects.filter(user_id=user_id)
+        for week, source, count in weeks_existing.values_list(
+            "week", "source", "interaction_count"
+        ):
+            self.weeks[week, source] += count
+        weeks_existing.delete()
+        _insert_rows(
+            InteractionWeek,
+            ["user", "week", "source", "interaction_count"],
+            [
+                (user_id, adapt_date(week), source, count)
+                for (week, source), count in self.weeks.items()
+            ],
+        )
+
+    def _add_interaction(self, contact_ids, was_at, source):
+        # dates are in UTC already, see timezone.now
+        day = was_at.date()
+        week = self._weeks_by_day.get(day)
+        if week is None:
+            week = self._weeks_by_day[day] = get_week(was_at)
+        self.weeks[week, source] += 1
+        for contact_id in contact_ids:
+            stats = self.stats.get(contact_id)
+            if stats is None:
+                self.stats[contact_id] = [1, was_at, was_at]
+            else:
+                stats[0] += 1
+                stats[1] = min(stats[1], was_at)
+                stats[2] = max(stats[2], was_at)
+            self.days[contact_id, day] += 1
+            self.contact_weeks[contact_id, week, source] += 1
+
+
+def _get_gmail_message(message_id, was_at, user_email, emails) -> dict:
+    # see networking_base.management.commands.sync_google.GmailEmailAdapter
+    return {
+        "id": message_id,
+        "threadId": message_id,
+        "snippet": SEED_DESCRIPTIONS[InteractionSource.GMAIL],
+        "internalDate": str(int(was_at.timestamp() * 1000)),
+        "payload": {
+            "headers": [
+                {"name": "From", "value": user_email},
+                {"name": "To", "value": ", ".join(emails)},
+                {"name": "Subject", "value": SEED_TITLE},
+            ]
+        },
+    }
+
+
+def _get_calendar_event(event_id, was_at, user_email, emails) -> dict:
+    # see networking_base.management.commands.sync_google.GoogleCalendarEventAdapter
+    start = was_at - timedelta(hours=1)
+    return {
+        "kind": "calendar#event",
+        "id": event_id,
+        "status": "confirmed",
+        "htmlLink": f"https://calendar.google.com/{event_id}",
+        "summary": SEED_TITLE,
+        "start": {"dateTime": start.isoformat()},
+        "end": {"dateTime": was_at.isoformat()},
+        "attendees": [{"email": email} for email in [user_email, *emails]],
+    }
+
+
+def _get_id_next(model) -> int:
+    return (model.objects.aggregate(id_max=Max("id"))["id_max"] or 0) + 1
+
+
+def _insert_rows(model, fields, rows) -> int:
+    # plain tuples skip building and compiling a model instance per row
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(model._meta.get_field(field).column) for field in fields)
+    placeholders = ", ".join(["%s"] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {qn(model._meta.db_table)} ({columns}) "
+            f"VALUES ({placeholders})",
+            rows,
+        )
+    return len(rows)
+
+
+@contextmanager
+def _sqlite_cache_size(size_kb):
+    if connection.vendor != "sqlite":
+        yield
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA cache_size")
+        (cache_size,) = cursor.fetchone()
+        cursor.execute(f"PRAGMA cache_size = -{int(size_kb)}")
+        try:
+            yield
+        finally:
+            cursor.execute(f"PRAGMA cache_size = {int(cache_size)}")
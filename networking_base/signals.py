@@ -0,0 +1,233 @@
+import threading
+import typing
+from contextlib import contextmanager
+
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from networking_base.analytics import update_interaction_weeks
+from networking_base.dashboard import (
+    invalidate_dashboard,
+    invalidate_dashboard_of_contacts,
+)
+from networking_base.models import (
+    CONTACT_CHUNK_SIZE,
+    Contact,
+    EmailAddress,
+    Interaction,
+    get_week,
+    mark_google_items_changed,
+    update_contact_interaction_counts,
+    update_contact_interaction_dates,
+)
+
+_deferred = threading.local()
+
+
+@contextmanager
+def defer_contact_updates():
+    """
+    Collect changes of contacts and weeks caused by interaction changes and apply
+    them once on exit. Useful for bulk operations like syncing, where a contact
+    would otherwise be updated once per interaction.
+    """
+    if getattr(_deferred, "changes", None) is not None:
+        # already deferring, outermost context flushes
+        yield
+        return
+
+    _deferred.changes = []
+    _deferred.weeks = []
+    try:
+        yield
+    finally:
+        changes, weeks = _deferred.changes, _deferred.weeks
+        _deferred.changes = _deferred.weeks = None
+        if weeks:
+            update_interaction_weeks(weeks)
+        if changes:
+            _update_contacts(changes)
+
+
+def contact_interactions_changed(changes):
+    """
+    Mark interactions of contacts as changed, i.e. added or removed.
+    :param changes: tuples of contact id, date and source of an interaction
+        and 1 (added) or -1 (removed), see update_contact_interaction_counts
+    """
+    changes = list(changes)
+    if not changes:
+        return
+
+    deferred_changes = getattr(_deferred, "changes", None)
+    if deferred_changes is not None:
+        deferred_changes.extend(changes)
+    else:
+        _update_contacts(changes)
+
+
+def user_interactions_changed(changes):
+    """
+    Mark interactions of users as changed, i.e. added or removed.
+    :param changes: tuples of user id, date and source of an interaction
+        and 1 (added) or -1 (removed), see update_interaction_weeks
+    """
+    deferred_weeks = getattr(_deferred, "weeks", None)
+    if deferred_weeks is not None:
+        deferred_weeks.extend(changes)
+    else:
+        update_interaction_weeks(changes)
+
+
+def _update_contacts(changes):
+    update_contact_interaction_counts(changes)
+    contact_ids = list({contact_id for contact_id, *_ in changes})
+    for i in range(0, len(contact_ids), CONTACT_CHUNK_SIZE):
+        update_contact_interaction_dates(
+            contact_ids[i : i + CONTACT_CHUNK_SIZE], use_stats=True
+        )
+    # dates are updated in bulk, i.e. without contact signals
+    invalidate_dashboard_of_contacts(contact_ids)
+
+
+def _get_contact_interactions(instance, reverse, pk_set=None) -> typing.List[tuple]:
+    # contact id, date and source of the interactions related to the instance
+    if reverse:
+        # instance is a contact, e.g. contact.interactions.add(...)
+        rows = Interaction.contacts.through.objects.filter(contact_id=instance.pk)
+        if pk_set is not None:
+            rows = rows.filter(interaction_id__in=pk_set)
+    else:
+        rows = Interaction.contacts.through.objects.filter(interaction_id=instance.pk)
+        if pk_set is not None:
+            rows = rows.filter(contact_id__in=pk_set)
+    return list(
+        rows.values_list("contact_id", "interaction__was_at", "interaction__source")
+    )
+
+
+def _get_week_key(interaction) -> tuple:
+    # week of user id, date and source
+    user_id, was_at, source = interaction
+    return user_id, get_week(was_at), source
+
+
+def _get_changes(contact_interactions, count) -> typing.List[tuple]:
+    return [
+        (*contact_interaction, count) for contact_interaction in contact_interactions
+    ]
+
+
+@receiver(pre_save, sender=Interaction)
+def interaction_saving(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+
+    # interaction might move to another week or change its source
+    instance._interaction_old = (
+        Interaction.objects.filter(pk=instance.pk)
+        .values_list("user_id", "was_at", "source")
+        .first()
+    )
+
+
+@receiver(post_save, sender=Interaction)
+def interaction_saved(sender, instance, created, **kwargs):
+    old = getattr(instance, "_interaction_old", None)
+    new = (instance.user_id, instance.was_at, instance.source)
+    if not old:
+        user_interactions_changed([(*new, 1)])
+    elif _get_week_key(old) != _get_week_key(new):
+        user_interactions_changed([(*old, -1), (*new, 1)])
+
+    if created or not old or old[1:] == (instance.was_at, instance.source):
+        # new interactions have no contacts yet, handled by m2m_changed
+        return
+    contact_ids = instance.contacts.values_list("id", flat=True)
+    contact_interactions_changed(
+        change
+        for contact_id in contact_ids
+        for change in [
+            (contact_id, old[1], old[2], -1),
+            (contact_id, instance.was_at, instance.source, 1),
+        ]
+    )
+
+
+@receiver(pre_delete, sender=Interaction)
+def interaction_deleting(sender, instance, **kwargs):
+    # remember contacts as relations are gone after deletion
+    instance._contact_interactions_deleted = _get_contact_interactions(
+        instance, reverse=False
+    )
+
+
+@receiver(post_delete, sender=Interaction)
+def interaction_deleted(sender, instance, **kwargs):
+    user_interactions_changed(
+        [(instance.user_id, instance.was_at, instance.source, -1)]
+    )
+    contact_interactions_changed(
+        _get_changes(getattr(instance, "_contact_interactions_deleted", []), -1)
+    )
+
+
+@receiver(m2m_changed, sender=Interaction.contacts.through)
+def interaction_contacts_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "post_add":
+        # pk_set only contains the new relations
+        contact_interactions = _get_contact_interactions(instance, reverse, pk_set)
+        contact_interactions_changed(_get_changes(contact_interactions, 1))
+    elif action in ("pre_remove", "pre_clear"):
+        # relations are gone afterwards, pk_set might contain unrelated objects
+        pk_set = pk_set if action == "pre_remove" else None
+        instance._contact_interactions_removed = _get_contact_interactions(
+            instance, reverse, pk_set
+        )
+    elif action in ("post_remove", "post_clear"):
+        contact_interactions = getattr(instance, "_contact_interactions_removed", [])
+        contact_interactions_changed(_get_changes(contact_interactions, -1))
+
+
+@receiver(pre_save, sender=EmailAddress)
+def email_address_saving(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+
+    # email moved to another contact or changed
+    old = EmailAddress.objects.filter(pk=instance.pk).first()
+    if old and (old.contact_id, old.email) != (instance.contact_id, instance.email):
+        mark_google_items_changed([old.contact_id])
+
+
+@receiver(post_save, sender=EmailAddress)
+def email_address_saved(sender, instance, **kwargs):
+    # items of all contacts with this email might need to be mapped differently
+    contact_ids = EmailAddress.objects.filter(
+        email=instance.email, contact__user_id=instance.contact.user_id
+    ).values_list("contact_id", flat=True)
+    mark_google_items_changed(list(contact_ids))
+    invalidate_dashboard([instance.contact.user_id])
+
+
+@receiver(pre_delete, sender=EmailAddress)
+def email_address_deleting(sender, instance, **kwargs):
+    mark_google_items_changed([instance.contact_id])
+    invalidate_dashboard_of_contacts([instance.contact_id])
+
+
+@receiver(post_save, sender=Contact)
+def contact_saved(sender, instance, **kwargs):
+    invalidate_dashboard([instance.user_id])
+
+
+@receiver(pre_delete, sender=Contact)
+def contact_deleting(sender, instance, **kwargs):
+    mark_google_items_changed([instance.pk])
+    invalidate_dashboard([instance.user_id])
@@ -1 +1,2115 @@
-# Create your tests here.
+import itertools
+import json
+import random
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from email.feedparser import FeedParser
+from http.client import responses
+from io import StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+import httplib2
+import numpy as np
+from allauth.socialaccount.models import SocialAccount, SocialApp, SocialToken
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from networking_base.analytics import (
+    get_interaction_analytics,
+    get_week,
+    rebuild_interaction_weeks,
+)
+from networking_base.benchmarks import get_regressions, measure, run_benchmarks
+from networking_base.dashboard import (
+    get_dashboard_cache_stats,
+    get_dashboard_contacts,
+    invalidate_dashboard,
+)
+from networking_base.duplicates import (
+    DUPLICATES_PER_CONTACT,
+    compute_duplicates,
+    compute_duplicates_shard,
+    cpdist,
+    get_blocking_keys,
+    get_candidate_pairs,
+    get_most_similar,
+    get_name_similarity,
+    get_scorer,
+    rebuild_duplicates,
+    rebuild_duplicates_parallel,
+    update_duplicates,
+)
+from networking_base.management.commands.sync_google import (
+    GMAIL_BATCH_SIZE,
+    GoogleSyncException,
+    GoogleUserSync,
+    store_google_calendar_events,
+    store_google_emails,
+    update_calendar_interaction,
+    update_email_interaction,
+)
+from networking_base.models import (
+    LAST_INTERACTION_DEFAULT,
+    Contact,
+    ContactBlockingKey,
+    ContactDuplicate,
+    ContactEmailResolver,
+    ContactInteractionDay,
+    ContactInteractionStats,
+    ContactInteractionWeek,
+    ContactStatus,
+    EmailAddress,
+    GoogleCalendarEvent,
+    GoogleEmail,
+    GoogleSyncState,
+    Interaction,
+    InteractionSource,
+    InteractionWeek,
+    get_contact_status_filter,
+    get_due_contacts,
+    get_frequent_contacts,
+    get_or_create_contact_email,
+    get_recent_contacts,
+    rebuild_contact_interaction_stats,
+    update_contact_interaction_dates,
+)
+from networking_base.seed import insert_seed_data
+from networking_base.signals import defer_contact_updates
+
+
+def days_ago(days):
+    return datetime.now().astimezone() - timedelta(days=days)
+
+
+class ContactInteractionDatesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("peter", "peter@gmail.com", "secret")
+        self.contact = Contact.objects.create(
+            name="Barbara", frequency_in_days=7, user=self.user
+        )
+
+    def create_interaction(self, was_at, contacts):
+        interaction = Interaction.objects.create(
+            user=self.user, title="Coffee", description="", was_at=was_at
+        )
+        interaction.contacts.set(contacts)
+        return interaction
+
+    def test_without_interaction(self):
+        self.assertIsNone(self.contact.last_interaction_at)
+        self.assertEqual(
+            self.contact.due_at, LAST_INTERACTION_DEFAULT + timedelta(days=7)
+        )
+        self.assertEqual(self.contact.get_status(), ContactStatus.OUT_OF_TOUCH)
+
+        # the stored due date agrees with the status
+        self.contact.frequency_in_days = 400
+        self.contact.save()
+        self.assertEqual(self.contact.get_status(), ContactStatus.OUT_OF_TOUCH)
+        self.assertTrue(
+            Contact.objects.filter(
+                get_contact_status_filter(ContactStatus.OUT_OF_TOUCH)
+            ).exists()
+        )
+
+    def test_save_stale(self):
+        contact = Contact.objects.get(pk=self.contact.pk)
+        was_at = days_ago(2)
+        self.create_interaction(was_at, [self.contact])
+
+        # e.g. the edit form, loaded before the interaction was added
+        contact.name = "Barbara Smith"
+        contact.save()
+
+        contact.refresh_from_db()
+        self.assertEqual(contact.last_interaction_at, was_at)
+        self.assertEqual(contact.due_at, was_at + timedelta(days=7))
+
+    def test_interaction_added(self):
+        was_at = days_ago(2)
+        self.create_interaction(was_at, [self.contact])
+
+        self.contact.refresh_from_db()
+        self.assertEqual(self.contact.last_interaction_at, was_at)
+        self.assertEqual(self.contact.due_at, was_at + timedelta(days=7))
+        self.assertEqual(self.contact.get_status(), ContactStatus.IN_TOUCH)
+
+    def test_interaction_changed(self):
+        interaction = self.create_interaction(days_ago(2), [self.contact])
+        interaction.was_at = days_ago(10)
+        interaction.save()
+
+        self.contact.refresh_from_db()
+        self.assertEqual(self.contact.last_interaction_at, interaction.was_at)
+        self.assertEqual(self.contact.get_status(), ContactStatus.OUT_OF_TOUCH)
+
+    def test_interaction_deleted(self):
+        was_at_old = days_ago(20)
+        self.create_interaction(was_at_old, [self.contact])
+        interaction = self.create_interaction(days_ago(2), [self.contact])
+        interaction.delete()
+
+        self.contact.refresh_from_db()
+        self.assertEqual(self.contact.last_interaction_at, was_at_old)
+
+    def test_contact_removed(self):
+        interaction = self.create_interaction(days_ago(2), [self.contact])
+        interaction.contacts.clear()
+
+        self.contact.refresh_from_db()
+        self.assertIsNone(self.contact.last_interaction_at)
+
+    def test_frequency_changed(self):
+        was_at = days_ago(2)
+        self.create_interaction(was_at, [self.contact])
+        self.contact.refresh_from_db()
+
+        self.contact.frequency_in_days = None
+        self.contact.save()
+        self.assertIsNone(self.contact.due_at)
+        self.assertEqual(self.contact.get_status(), ContactStatus.HIDDEN)
+
+        self.contact.frequency_in_days = 1
+        self.contact.save(update_fields=["frequency_in_days"])
+        self.contact.refresh_from_db()
+        self.assertEqual(self.contact.due_at, was_at + timedelta(days=1))
+
+    def test_status_without_queries(self):
+        self.create_interaction(days_ago(2), [self.contact])
+        self.contact.refresh_from_db()
+
+        with self.assertNumQueries(0):
+            self.contact.get_status()
+            self.contact.get_urgency()
+            self.contact.get_due_date()
+
+    def test_deferred_updates(self):
+        with defer_contact_updates():
+            for days in range(1, 5):
+                self.create_interaction(days_ago(days), [self.contact])
+
+            self.contact.refresh_from_db()
+            self.assertIsNone(self.contact.last_interaction_at)
+
+        self.contact.refresh_from_db()
+        self.assertEqual(self.contact.last_interaction_at.date(), days_ago(1).date())
+
+    def test_backfill(self):
+        was_at = days_ago(3)
+        self.create_interaction(was_at, [self.contact])
+        Contact.objects.update(last_interaction_at=None, due_at=None)
+
+        call_command("update_last_interactions", stdout=StringIO(), stderr=StringIO())
+
+        self.contact.refresh_from_db()
+        self.assertEqual(self.contact.last_interaction_at, was_at)
+        self.assertEqual(self.contact.due_at, was_at + timedelta(days=7))
+
+
+class DueContactsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("peter", "peter@gmail.com", "secret")
+
+    def create_contacts(self, count):
+        for i in range(count):
+            contact = Contact.objects.create(
+                name=f"Contact {i}", frequency_in_days=7, user=self.user
+            )
+            interaction = Interaction.objects.create(
+                user=self.user, title="Coffee", description="", was_at=days_ago(i)
+            )
+            interaction.contacts.add(contact)
+
+    def test_due_contacts(self):
+        self.create_contacts(20)
+        Contact.objects.create(name="Hidden", user=self.user)
+
+        due_contacts = get_due_contacts(self.user)
+
+        self.assertEqual(
+            [c.name for c in due_contacts], [f"Contact {i}" for i in range(19, 7, -1)]
+        )
+        self.assertTrue(all(c.get_urgency() > 0 for c in due_contacts))
+
+    def test_due_contacts_paginated(self):
+        self.create_contacts(20)
+
+        due_contacts = get_due_contacts(self.user, limit=5, offset=5)
+
+        self.assertEqual(
+            [c.name for c in due_contacts], [f"Contact {i}" for i in range(14, 9, -1)]
+        )
+
+    def test_due_contacts_queries(self):
+        self.create_contacts(5)
+        with self.assertNumQueries(1):
+            get_due_contacts(self.user)
+
+        self.create_contacts(50)
+        with self.assertNumQueries(1):
+            get_due_contacts(self.user)
+
+
+class ContactInteractionStatsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("peter", "peter@gmail.com", "secret")
+        self.contacts = [
+            Contact.objects.create(
+                name=f"Contact {i}", frequency_in_days=7, user=self.user
+            )
+            for i in range(4)
+        ]
+
+    def create_interaction(self, contacts, days):
+        interaction = Interaction.objects.create(
+            user=self.user, title="Coffee", description="", was_at=days_ago(days)
+        )
+        interaction.contacts.set(contacts)
+        return interaction
+
+    def get_stats(self):
+        return {
+            stats.contact_id: stats.interaction_count
+            for stats in ContactInteractionStats.objects.all()
+        }
+
+    def test_incremental(self):
+        interaction = self.create_interaction(self.contacts[:2], 1)
+        self.create_interaction(self.contacts[:1], 30)
+        contact_0, contact_1 = self.contacts[:2]
+        self.assertEqual(self.get_stats(), {contact_0.id: 2, contact_1.id: 1})
+
+        stats = ContactInteractionStats.objects.get(contact=contact_0)
+        self.assertEqual(stats.first_interaction_at.date(), days_ago(30).date())
+        self.assertEqual(stats.last_interaction_at.date(), days_ago(1).date())
+        self.assertEqual(
+            ContactInteractionDay.objects.filter(contact=contact_0).count(), 2
+        )
+
+        interaction.contacts.remove(contact_1)
+        self.assertEqual(self.get_stats(), {contact_0.id: 2})
+
+        interaction.delete()
+        self.assertEqual(self.get_stats(), {contact_0.id: 1})
+
+    def test_constant_cost(self):
+        contact_0, contact_1 = self.contacts[:2]
+        self.create_interaction([contact_1], 40)
+        for days in range(50):
+            self.create_interaction([contact_0], 40 + days)
+        # the week of the user exists for both
+        self.create_interaction([], 1)
+
+        queries = []
+        for contact in [contact_1, contact_0]:
+            with CaptureQueriesContext(connection) as context:
+                self.create_interaction([contact], 1)
+            queries.append([q["sql"] for q in context.captured_queries])
+
+        # only the affected rows are touched, no matter the history
+        self.assertEqual(len(queries[0]), len(queries[1]))
+        self.assertFalse([sql for sql in queries[1] if sql.startswith("DELETE")])
+        # nothing is re-counted from the interactions
+        self.assertFalse([sql for sql in queries[1] if "GROUP BY" in sql])
+        self.assertEqual(self.get_stats(), {contact_0.id: 51, contact_1.id: 2})
+
+    def test_boundaries(self):
+        contact = self.contacts[0]
+        interactions = [self.create_interaction([contact], days) for days in [1, 2, 3]]
+
+        interactions[0].delete()
+        interactions[2].contacts.remove(contact)
+
+        stats = ContactInteractionStats.objects.get(contact=contact)
+        self.assertEqual(stats.interaction_count, 1)
+        self.assertEqual(stats.first_interaction_at, interactions[1].was_at)
+        self.assertEqual(stats.last_interaction_at, interactions[1].was_at)
+        contact.refresh_from_db()
+        self.assertEqual(contact.last_interaction_at, interactions[1].was_at)
+
+        interactions[1].was_at = days_ago(5)
+        interactions[1].save()
+        stats.refresh_from_db()
+        self.assertEqual(stats.last_interaction_at, interactions[1].was_at)
+        self.assertEqual(
+            list(ContactInteractionDay.objects.values_list("day", flat=True)),
+            [days_ago(5).astimezone(timezone.utc).date()],
+        )
+
+    def test_remove_unrelated(self):
+        interaction = self.create_interaction(self.contacts[:1], 1)
+
+        interaction.contacts.remove(self.contacts[1])
+        self.contacts[2].interactions.remove(interaction)
+
+        self.assertEqual(self.get_stats(), {self.contacts[0].id: 1})
+
+    def test_remove_missing(self):
+        contact = self.contacts[0]
+        interaction = self.create_interaction([contact], 1)
+        self.create_interaction([contact], 2)
+        for model in [ContactInteractionDay, ContactInteractionWeek]:
+            model.objects.all().delete()
+        ContactInteractionStats.objects.update(interaction_count=0)
+
+        # rows out of sync, e.g. before a rebuild, are not counted below zero
+        interaction.contacts.remove(contact)
+
+        self.assertEqual(self.get_stats(), {})
+        self.assertFalse(ContactInteractionDay.objects.exists())
+        self.assertFalse(ContactInteractionWeek.objects.exists())
+
+    def test_incremental_matches_rebuild(self):
+        rng = random.Random(0)
+        interactions = []
+        for _ in range(40):
+            action = rng.randrange(6)
+            contact = rng.choice(self.contacts)
+            if action <= 1 or not interactions:
+                contacts = rng.sample(self.contacts, rng.randint(1, 3))
+                interactions.append(
+                    self.create_interaction(contacts, rng.randrange(30))
+                )
+                continue
+
+            interaction = rng.choice(interactions)
+            if action == 2:
+                interaction.was_at = days_ago(rng.randrange(30))
+                interaction.save()
+            elif action == 3:
+                interaction.contacts.remove(contact)
+            elif action == 4:
+                contact.interactions.add(interaction)
+            else:
+                interactions.remove(interaction)
+                interaction.delete()
+
+        models = [
+            ContactInteractionStats,
+            ContactInteractionDay,
+            ContactInteractionWeek,
+            InteractionWeek,
+        ]
+        fields = [
+            [
+                "contact_id",
+                "interaction_count",
+                "first_interaction_at",
+                "last_interaction_at",
+            ],
+            ["contact_id", "day", "interaction_count"],
+            ["contact_id", "week", "source", "interaction_count"],
+            ["user_id", "week", "source", "interaction_count"],
+        ]
+
+        def get_rows():
+            return [
+                set(model.objects.values_list(*model_fields))
+                for model, model_fields in zip(models, fields)
+            ]
+
+        rows = get_rows()
+        rebuild_contact_interaction_stats(self.user)
+        rebuild_interaction_weeks(self.user)
+        self.assertEqual(rows, get_rows())
+
+    def test_deferred(self):
+        with defer_contact_updates():
+            for i in range(5):
+                self.create_interaction(self.contacts, i)
+            self.assertEqual(self.get_stats(), {})
+
+        self.assertEqual(self.get_stats(), {c.id: 5 for c in self.contacts})
+
+    def test_rebuild(self):
+        interaction = Interaction.objects.create(
+            user=self.user, title="Coffee", description="", was_at=days_ago(1)
+        )
+        Interaction.contacts.through.objects.bulk_create(
+            [
+                Interaction.contacts.through(interaction=interaction, contact=contact)
+                for contact in self.contacts
+            ]
+        )
+        self.assertEqual(self.get_stats(), {})
+
+        rebuild_contact_interaction_stats(self.user)
+
+        self.assertEqual(self.get_stats(), {c.id: 1 for c in self.contacts})
+
+    def test_frequent_contacts(self):
+        for i, contact in enumerate(self.contacts[:3]):
+            for days in range(i + 1):
+                self.create_interaction([contact], 100 + days)
+
+        frequent = get_frequent_contacts(self.user, limit=2)
+
+        self.assertEqual([c.name for c in frequent], ["Contact 2", "Contact 1"])
+        self.assertEqual([c.count for c in frequent], [3, 2])
+
+    def test_recent_contacts(self):
+        # many old interactions don't make a contact recent
+        for days in range(5):
+            self.create_interaction(self.contacts[:1], 30 + days)
+        self.create_interaction(self.contacts[1:3], 1)
+        self.create_interaction(self.contacts[2:3], 2)
+
+        recent = get_recent_contacts(self.user)
+
+        self.assertEqual([c.name for c in recent], ["Contact 2", "Contact 1"])
+        self.assertEqual([c.count for c in recent], [2, 1])
+
+    def test_other_user(self):
+        other = User.objects.create_user("paul", "paul@gmail.com", "secret")
+        contact = Contact.objects.create(name="Other", user=other)
+        self.create_interaction([contact], 1)
+
+        self.assertEqual(get_frequent_contacts(self.user), [])
+        self.assertEqual(get_recent_contacts(self.user), [])
+
+
+class DashboardCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("peter", "peter@gmail.com", "secret")
+        self.contacts = [
+            Contact.objects.create(
+                name=f"Contact {i}", frequency_in_days=7, user=self.user
+            )
+            for i in range(3)
+        ]
+        for i, contact in enumerate(self.contacts):
+            interaction = Interaction.objects.create(
+                user=self.user, title="Coffee", description="", was_at=days_ago(10 + i)
+            )
+            interaction.contacts.add(contact)
+
+    def get_due_names(self):
+        return [c.name for c in get_dashboard_contacts(self.user)["contacts"]]
+
+    def test_hit(self):
+        dashboard = get_dashboard_contacts(self.user)
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(get_dashboard_contacts(self.user), dashboard)
+        # only the cache is read
+        self.assertFalse(
+            [q for q in context.captured_queries if "networking_base_" in q["sql"]]
+        )
+        self.assertEqual(get_dashboard_cache_stats(), {"hits": 1, "misses": 1})
+
+    def test_local_cache(self):
+        locmem = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        }
+        with override_settings(CACHES=locmem):
+            self.get_due_names()
+            # e.g. changed by another process, which could not invalidate the cache
+            Contact.objects.filter(id=self.contacts[0].id).update(name="Renamed")
+
+            self.assertIn("Renamed", self.get_due_names())
+            self.assertEqual(get_dashboard_cache_stats(), {"hits": 0, "misses": 0})
+
+    def test_pages(self):
+        page_1 = get_dashboard_contacts(self.user, page=1, per_page=2)
+        page_2 = get_dashboard_contacts(self.user, page=2, per_page=2)
+
+        self.assertTrue(page_1["has_next_page"])
+        self.assertEqual(len(page_2["contacts"]), 1)
+        self.assertEqual(get_dashboard_cache_stats(), {"hits": 0, "misses": 2})
+
+    def test_interaction_changed(self):
+        self.assertIn("Contact 0", self.get_due_names())
+
+        interaction = Interaction.objects.create(
+            user=self.user, title="Call", description="", was_at=days_ago(0)
+        )
+        interaction.contacts.add(self.contacts[0])
+        self.assertNotIn("Contact 0", self.get_due_names())
+
+        interaction.delete()
+        self.assertIn("Contact 0", self.get_due_names())
+
+    def test_interaction_changed_deferred(self):
+        self.get_due_names()
+
+        with defer_contact_updates():
+            interaction = Interaction.objects.create(
+                user=self.user, title="Call", description="", was_at=days_ago(0)
+            )
+            interaction.contacts.add(self.contacts[0])
+            self.get_due_names()
+
+        self.assertNotIn("Contact 0", self.get_due_names())
+
+    def test_contact_changed(self):
+        self.get_due_names()
+
+        contact = Contact.objects.get(id=self.contacts[0].id)
+        contact.name = "Renamed"
+        contact.save()
+        self.contacts[1].delete()
+
+        self.assertEqual(self.get_due_names(), ["Contact 2", "Renamed"])
+
+    def test_email_changed(self):
+        self.get_due_names()
+
+        email = EmailAddress.objects.create(
+            contact=self.contacts[0], email="paul@gmail.com"
+        )
+        self.assertEqual(get_dashboard_cache_stats()["hits"], 0)
+        self.get_due_names()
+
+        email.delete()
+        self.get_due_names()
+        self.assertEqual(get_dashboard_cache_stats(), {"hits": 0, "misses": 3})
+
+    def test_other_user(self):
+        other = User.objects.create_user("paul", "paul@gmail.com", "secret")
+        get_dashboard_contacts(other)
+        self.get_due_names()
+
+        Contact.objects.create(name="Other", frequency_in_days=7, user=other)
+
+        self.get_due_names()
+        self.assertEqual(get_dashboard_cache_stats(), {"hits": 1, "misses": 2})
+
+    def test_daily_expiry(self):
+        self.get_due_names()
+
+        tomorrow = datetime.now() + timedelta(days=1)
+        with mock.patch("networking_base.dashboard.datetime") as datetime_mock:
+            datetime_mock.now.return_value = tomorrow
+            self.get_due_names()
+
+        self.assertEqual(get_dashboard_cache_stats(), {"hits": 0, "misses": 2})
+
+
+#
+# Google
+#
+
+
+def make_gmail_message(message_id, from_="paul@gmail.com", to="peter@gmail.com"):
+    return {
+        "id": message_id,
+        "threadId": message_id,
+        "snippet": f"Snippet of {message_id}",
+        "internalDate": "1629000000000",
+        "payload": {
+            "headers": [
+                {"name": "From", "value": from_},
+                {"name": "To", "value": to},
+                {"name": "Subject", "value": f"Subject of {message_id}"},
+            ]
+        },
+    }
+
+
+class FakeGoogleHttp:
+    """
+    Fake transport for the google api client, serving gmail and calendar from memory.
+    """
+
+    timeout = None
+
+    def __init__(self):
+        self.messages = {}
+
+        # calendar events as id -> (version, event)
+        self.calendar_events = {}
+        self.calendar_version = 0
+        self.calendar_version_min = 0
+
+        # gmail history as (history id, added message id)
+        self.history = []
+        self.history_id = 100
+        self.history_id_min = 100
+
+        # statuses to respond with before serving a message, e.g. [429]
+        self.message_errors = {}
+
+        # http round trips, a batch is a single one
+        self.round_trips = 0
+
+        self.requests = []
+
+    def add_message(self, message):
+        self.history_id += 1
+        self.history.append((self.history_id, message["id"]))
+        self.messages[message["id"]] = message
+
+    def set_calendar_event(self, event):
+        self.calendar_version += 1
+        self.calendar_events[event["id"]] = (self.calendar_version, event)
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self.round_trips += 1
+
+        url = urlparse(uri)
+        if url.path.startswith("/batch"):
+            self.requests.append((method, url.path))
+            return self.request_batch(body, headers)
+
+        status, content = self.request_single(method, uri)
+        response = httplib2.Response(
+            {"status": status, "content-type": "application/json"}
+        )
+        return response, json.dumps(content).encode()
+
+    def request_single(self, method, uri):
+        url = urlparse(uri)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.requests.append((method, url.path))
+        return self.route(url.path, query)
+
+    def request_batch(self, body, headers):
+        parser = FeedParser()
+        parser.feed(f"content-type: {headers['content-type']}\r\n\r\n{body}")
+        message = parser.close()
+
+        boundary = "batch_boundary"
+        parts = []
+        for part in message.get_payload():
+            request_line = part.get_payload().split("\n", 1)[0]
+            method, uri, _ = request_line.split(" ")
+            status, content = self.request_single(method, uri)
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{part['Content-ID'][1:]}\r\n\r\n"
+                f"HTTP/1.1 {status} {responses[status]}\r\n"
+                "Content-Type: application/json\r\n\r\n"
+                f"{json.dumps(content)}\r\n"
+            )
+        content = "".join(parts) + f"--{boundary}--"
+
+        response = httplib2.Response(
+            {
+                "status": 200,
+                "content-type": f"multipart/mixed; boundary={boundary}",
+            }
+        )
+        return response, content.encode()
+
+    def route(self, path, query):
+        if path == "/gmail/v1/users/me/profile":
+            return 200, {"historyId": str(self.history_id)}
+
+        if path == "/gmail/v1/users/me/messages":
+            messages = [{"id": m_id} for m_id in self.messages]
+            return 200, self.paginate("messages", messages, query)
+
+        if path.startswith("/gmail/v1/users/me/messages/"):
+            message_id = path.rsplit("/", 1)[1]
+            if self.message_errors.get(message_id):
+                status = self.message_errors[message_id].pop(0)
+                return status, {"error": {"code": status, "message": "Error"}}
+
+            message = self.messages.get(message_id)
+            if not message:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            return 200, message
+
+        if path == "/gmail/v1/users/me/history":
+            start_history_id = int(query["startHistoryId"])
+            if start_history_id < self.history_id_min:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            history = [
+                {"id": str(h_id), "messagesAdded": [{"message": {"id": m_id}}]}
+                for h_id, m_id in self.history
+                if h_id > start_history_id
+            ]
+            response = self.paginate("history", history, query)
+            response["historyId"] = str(self.history_id)
+            return 200, response
+
+        if path == "/calendar/v3/calendars/primary/events":
+            sync_token = int(query.get("syncToken", 0))
+            if sync_token and sync_token < self.calendar_version_min:
+                return 410, {"error": {"code": 410, "message": "Gone"}}
+            events = [
+                event
+                for version, event in self.calendar_events.values()
+                if version > sync_token
+            ]
+            response = self.paginate("items", events, query)
+            if "nextPageToken" not in response:
+                response["nextSyncToken"] = str(self.calendar_version)
+            return 200, response
+
+        return 404, {"error": {"code": 404, "message": f"unknown path: {path}"}}
+
+    def paginate(self, key, items, query):
+        offset = int(query.get("pageToken", 0))
+        limit = int(query.get("maxResults", 100))
+        response = {key: items[offset : offset + limit]}
+        if offset + limit < len(items):
+            response["nextPageToken"] = str(offset + limit)
+        return response
+
+    def count_requests(self, path_prefix):
+        return len([r for r in self.requests if r[1].startswith(path_prefix)])
+
+
+def make_calendar_event(event_id, status="confirmed", summary="Meeting"):
+    return {
+        "kind": "calendar#event",
+        "id": event_id,
+        "status": status,
+        "htmlLink": f"https://calendar.google.com/{event_id}",
+        "summary": summary,
+        "start": {"dateTime": "2021-08-15T10:00:00+02:00"},
+        "end": {"dateTime": "2021-08-15T11:00:00+02:00"},
+        "attendees": [{"email": "peter@gmail.com"}, {"email": "paul@gmail.com"}],
+    }
+
+
+class GoogleSyncMixin:
+    """
+    A user with a google account and a fake google api.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("peter", "peter@gmail.com", "secret")
+        social_app = SocialApp.objects.create(
+            provider="google", name="google", client_id="id", secret="secret"
+        )
+        self.social_account = SocialAccount.objects.create(
+            user=self.user, provider="google", uid="1"
+        )
+        SocialToken.objects.create(
+            app=social_app,
+            account=self.social_account,
+            token="token",
+            token_secret="refresh",
+        )
+
+        self.http = FakeGoogleHttp()
+
+    def sync(self):
+        gus = GoogleUserSync(self.user, http=self.http)
+        gus.sync()
+        return gus
+
+
+class GoogleSyncTestCase(GoogleSyncMixin, TestCase):
+    pass
+
+
+class GmailSyncTest(GoogleSyncTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            self.http.add_message(make_gmail_message(f"m{i}"))
+
+    def test_full_sync(self):
+        self.sync()
+
+        self.assertEqual(GoogleEmail.objects.count(), 5)
+        self.assertEqual(
+            self.social_account.google_sync_state.gmail_history_id,
+            str(self.http.history_id),
+        )
+        self.assertEqual(Interaction.objects.filter(user=self.user).count(), 5)
+
+    def test_incremental_sync(self):
+        self.sync()
+        self.http.add_message(make_gmail_message("m5"))
+        self.http.requests = []
+
+        self.sync()
+
+        self.assertEqual(GoogleEmail.objects.count(), 6)
+        self.assertEqual(self.http.count_requests("/gmail/v1/users/me/history"), 1)
+        self.assertEqual(self.http.count_requests("/gmail/v1/users/me/messages"), 1)
+        self.assertEqual(
+            GoogleSyncState.objects.get().gmail_history_id, str(self.http.history_id)
+        )
+
+    def test_no_changes(self):
+        self.sync()
+        self.http.requests = []
+
+        self.sync()
+
+        self.assertEqual(self.http.count_requests("/gmail/v1/users/me/messages"), 0)
+
+    def test_expired_history_id(self):
+        self.sync()
+        self.http.add_message(make_gmail_message("m5"))
+        self.http.history_id_min = self.http.history_id + 1
+        self.http.requests = []
+
+        self.sync()
+
+        # full sync only fetches the missing message
+        self.assertEqual(GoogleEmail.objects.count(), 6)
+        self.assertEqual(self.http.count_requests("/gmail/v1/users/me/profile"), 1)
+        self.assertEqual(self.http.count_requests("/gmail/v1/users/me/messages/"), 1)
+
+
+@mock.patch("networking_base.management.commands.sync_google.time.sleep")
+class GmailBatchTest(GoogleSyncTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(120):
+            self.http.add_message(make_gmail_message(f"m{i}"))
+
+    def test_batched(self, sleep):
+        self.sync()
+
+        self.assertEqual(GoogleEmail.objects.count(), 120)
+        self.assertEqual(self.http.count_requests("/batch"), 3)
+        self.assertEqual(self.http.count_requests("/gmail/v1/users/me/messages/"), 120)
+
+    def test_retry(self, sleep):
+        self.http.message_errors = {"m1": [429, 503], "m2": [500]}
+
+        self.sync()
+
+        self.assertEqual(GoogleEmail.objects.count(), 120)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(
+            self.http.count_requests("/batch"),
+            120 // GMAIL_BATCH_SIZE + 1 + 2,
+        )
+
+    def test_retry_exhausted(self, sleep):
+        self.http.message_errors = {"m1": [503] * 10}
+
+        with self.assertRaises(GoogleSyncException):
+            self.sync()
+
+        # history id is not stored, so the next run retries
+        self.assertIsNone(GoogleSyncState.objects.get().gmail_history_id)
+
+    def test_deleted_message(self, sleep):
+        self.http.message_errors = {"m1": [404]}
+
+        self.sync()
+
+        self.assertEqual(GoogleEmail.objects.count(), 119)
+
+
+class GmailRoundTripTest(GoogleSyncTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(GMAIL_BATCH_SIZE):
+            self.http.add_message(make_gmail_message(f"m{i}"))
+
+    def count_round_trips(self):
+        GoogleEmail.objects.all().delete()
+        GoogleSyncState.objects.all().delete()
+        gus = GoogleUserSync(self.user, http=self.http)
+        gus.connect()
+        self.http.round_trips = 0
+        gus.sync_gmail()
+        return self.http.round_trips
+
+    def test_round_trips(self):
+        # batching saves round trips, which dominate the sync time with real latency
+        with mock.patch(
+            "networking_base.management.commands.sync_google.GMAIL_BATCH_SIZE", 1
+        ):
+            round_trips_unbatched = self.count_round_trips()
+        round_trips_batched = self.count_round_trips()
+
+        # all messages are fetched in a single round trip instead of one each
+        self.assertEqual(
+            round_trips_unbatched - round_trips_batched, GMAIL_BATCH_SIZE - 1
+        )
+        self.assertEqual(GoogleEmail.objects.count(), GMAIL_BATCH_SIZE)
+
+
+class CalendarSyncTest(GoogleSyncTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            self.http.set_calendar_event(make_calendar_event(f"e{i}"))
+
+    def test_full_sync(self):
+        self.sync()
+
+        self.assertEqual(GoogleCalendarEvent.objects.count(), 3)
+        self.assertEqual(
+            GoogleSyncState.objects.get().calendar_sync_token,
+            str(self.http.calendar_version),
+        )
+        self.assertEqual(Interaction.objects.filter(user=self.user).count(), 3)
+
+    def test_incremental_sync(self):
+        self.sync()
+        self.http.set_calendar_event(make_calendar_event("e1", summary="Lunch"))
+        self.http.set_calendar_event(make_calendar_event("e2", status="cancelled"))
+        self.http.set_calendar_event(make_calendar_event("e3", status="cancelled"))
+
+        gus = GoogleUserSync(self.user, http=self.http)
+        gus.connect()
+        with CaptureQueriesContext(connection) as context:
+            gus.sync_calendar()
+
+        # changed events are written at once, unseen cancelled ones are skipped
+        writes = [
+            q["sql"]
+            for q in context.captured_queries
+            if "googlecalendarevent" in q["sql"]
+            and q["sql"].startswith(("INSERT", "UPDATE"))
+        ]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(GoogleCalendarEvent.objects.count(), 3)
+
+    def test_changed_and_cancelled_events(self):
+        self.sync()
+        self.http.set_calendar_event(make_calendar_event("e1", summary="Lunch"))
+        self.http.set_calendar_event(make_calendar_event("e2", status="cancelled"))
+
+        self.sync()
+
+        titles = Interaction.objects.values_list("title", flat=True)
+        self.assertEqual(sorted(titles), ["Lunch", "Meeting"])
+
+    def test_expired_sync_token(self):
+        self.sync()
+        self.http.set_calendar_event(make_calendar_event("e3"))
+        self.http.calendar_version_min = self.http.calendar_version + 1
+
+        self.sync()
+
+        self.assertEqual(GoogleCalendarEvent.objects.count(), 4)
+        self.assertEqual(
+            GoogleSyncState.objects.get().calendar_sync_token,
+            str(self.http.calendar_version),
+        )
+
+    def test_expired_sync_token_deleted_events(self):
+        self.sync()
+        # deleted while the sync token was expired, so not listed as cancelled
+        del self.http.calendar_events["e1"]
+        self.http.calendar_version_min = self.http.calendar_version + 1
+
+        self.sync()
+
+        self.assertEqual(
+            set(
+                GoogleCalendarEvent.objects.values_list("google_calendar_id", flat=True)
+            ),
+            {"e0", "e2"},
+        )
+        self.assertEqual(Interaction.objects.filter(user=self.user).count(), 2)
+
+
+class UpdateInteractionsTest(GoogleSyncTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            self.http.add_message(make_gmail_message(f"m{i}"))
+            self.http.set_calendar_event(make_calendar_event(f"e{i}"))
+        self.sync()
+
+    def update_interactions(self, full=False):
+        gus = GoogleUserSync(self.user, http=self.http, full=full)
+        gus.connect()
+        return gus.update_interactions()
+
+    def test_unchanged(self):
+        self.assertEqual(self.update_interactions(), 0)
+
+    def test_full(self):
+        self.assertEqual(self.update_interactions(full=True), 6)
+
+    def test_new_and_changed(self):
+        self.http.add_message(make_gmail_message("m3"))
+        self.http.set_calendar_event(make_calendar_event("e0", summary="Lunch"))
+
+        gus = self.sync()
+
+        self.assertEqual(gus.update_interactions(), 0)
+        self.assertEqual(Interaction.objects.filter(title="Lunch").count(), 1)
+        self.assertEqual(GoogleEmail.objects.filter(interaction=None).count(), 0)
+
+    def test_email_address_removed(self):
+        contact = Contact.objects.get(name="paul@gmail.com")
+        contact.email_addresses.all().delete()
+
+        self.assertEqual(self.update_interactions(), 6)
+
+        # email is mapped to a new contact
+        contact_new = Contact.objects.get(email_addresses__email="paul@gmail.com")
+        self.assertNotEqual(contact.id, contact_new.id)
+        self.assertEqual(contact_new.interactions.count(), 6)
+
+    def test_email_address_added(self):
+        contact = Contact.objects.create(name="Paul", user=self.user)
+        contact.email_addresses.create(email="paul@gmail.com")
+
+        self.assertEqual(self.update_interactions(), 6)
+
+
+class ContactEmailResolverTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("peter", "peter@gmail.com", "secret")
+        self.contact = Contact.objects.create(name="Paul", user=self.user)
+        self.contact.email_addresses.create(email="paul@gmail.com")
+
+    def test_resolve_existing(self):
+        resolver = ContactEmailResolver(self.user)
+
+        with self.assertNumQueries(0):
+            contact_ids = resolver.resolve(["Paul@gmail.com"])
+
+        self.assertEqual(contact_ids, {"paul@gmail.com": self.contact.id})
+
+    def test_resolve_missing(self):
+        resolver = ContactEmailResolver(self.user)
+        emails = [f"contact{i}@gmail.com" for i in range(10)]
+
+        contact_ids = resolver.resolve(emails + ["paul@gmail.com"])
+
+        self.assertEqual(len(set(contact_ids.values())), 11)
+        self.assertEqual(
+            EmailAddress.objects.get(email="contact3@gmail.com").contact_id,
+            contact_ids["contact3@gmail.com"],
+        )
+        self.assertEqual(
+            Contact.objects.get(id=contact_ids["contact3@gmail.com"]).name,
+            "contact3@gmail.com",
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.resolve(emails), resolver.resolve(emails))
+
+    def test_sync_lookups(self):
+        http = FakeGoogleHttp()
+        for i in range(50):
+            http.add_message(make_gmail_message(f"m{i}", from_=f"c{i % 10}@gmail.com"))
+        social_app = SocialApp.objects.create(provider="google", name="google")
+        social_account = SocialAccount.objects.create(
+            user=self.user, provider="google", uid="1"
+        )
+        SocialToken.objects.create(app=social_app, account=social_account, token="t")
+
+        with CaptureQueriesContext(connection) as context:
+            GoogleUserSync(self.user, http=http).sync()
+
+        email_lookups = [
+            q
+            for q in context.captured_queries
+            if 'FROM "networking_base_emailaddress"' in q["sql"]
+        ]
+        self.assertEqual(len(email_lookups), 1)
+
+        # paul, ten senders, and the recipient (not a verified user email here)
+        self.assertEqual(Contact.objects.filter(user=self.user).count(), 12)
+
+
+class SyncCommandTest(GoogleSyncMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            self.http.add_message(make_gmail_message(f"m{i}"))
+        User.objects.create_user("paul", "paul@gmail.com", "secret")
+
+    def call_sync(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        with mock.patch(
+            "networking_base.management.commands.sync_google.build_http",
+            return_value=self.http,
+        ):
+            call_command("sync_google", *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_workers(self):
+        stdout, stderr = self.call_sync("--workers", "2")
+
+        self.assertIn("paul: skipped, no google account", stdout)
+        self.assertRegex(stdout, r"peter: 3 emails, 0 events, 3 interactions updated")
+        self.assertEqual(GoogleEmail.objects.count(), 3)
+
+    def test_failing_user(self):
+        self.http.message_errors = {"m1": [400]}
+
+        with self.assertLogs(level="ERROR"):
+            stdout, stderr = self.call_sync("--workers", "2")
+
+        self.assertIn("peter: failed", stderr)
+        self.assertIn("paul: skipped", stdout)
+
+    def test_filter_logged_in_since(self):
+        User.objects.filter(username="paul").update(last_login=days_ago(0))
+
+        stdout, stderr = self.call_sync(
+            "--logged-in-since", days_ago(1).date().isoformat()
+        )
+
+        self.assertIn("paul: skipped", stdout)
+        self.assertNotIn("peter", stdout)
+
+    def test_filter_users(self):
+        stdout, stderr = self.call_sync("--users", "paul")
+
+        self.assertNotIn("peter", stdout)
+        self.assertEqual(GoogleEmail.objects.count(), 0)
+
+
+class GoogleIngestionTest(GoogleSyncTestCase):
+    def get_statements(self, context):
+        return [
+            q["sql"].split(" ", 1)[0]
+            for q in context.captured_queries
+            if not q["sql"].startswith(("SAVEPOINT", "RELEASE SAVEPOINT"))
+        ]
+
+    def test_store_emails(self):
+        messages = [make_gmail_message(f"m{i}") for i in range(100)]
+        store_google_emails(self.social_account, messages[:10])
+
+        with CaptureQueriesContext(connection) as context:
+            store_google_emails(self.social_account, messages)
+
+        self.assertEqual(self.get_statements(context), ["INSERT"])
+        self.assertEqual(GoogleEmail.objects.count(), 100)
+
+    def test_store_calendar_events(self):
+        events = [make_calendar_event(f"e{i}") for i in range(100)]
+        store_google_calendar_events(self.social_account, events[:50])
+        for event in events[:10]:
+            event["summary"] = "Lunch"
+
+        with CaptureQueriesContext(connection) as context:
+            store_google_calendar_events(self.social_account, events)
+
+        self.assertEqual(self.get_statements(context), ["SELECT", "INSERT", "UPDATE"])
+        self.assertEqual(GoogleCalendarEvent.objects.count(), 100)
+        self.assertEqual(
+            GoogleCalendarEvent.objects.filter(data__summary="Lunch").count(), 10
+        )
+
+
+FIRST_NAMES = ["Peter", "Barbara", "Klaus", "Karl", "Ferdinand", "Otto", "Anna"]
+FIRST_NAMES += ["Maria", "Johannes", "Sophie", "Lukas", "Julia", "Thomas", "Laura"]
+FIRST_NAMES += ["Michael", "Sarah", "Daniel", "Lisa", "Stefan", "Nina", "Tobias"]
+LAST_NAMES = ["Müller", "Meyer", "Merkel", "Duck", "Gamma", "Schmidt", "Fischer"]
+LAST_NAMES += ["Weber", "Wagner", "Becker", "Schulz", "Hoffmann", "Koch", "Klein"]
+LAST_NAMES += ["Wolf", "Neumann", "Schwarz", "Braun", "Krüger", "Lange", "Krause"]
+
+
+def make_contact_names(count, seed=1):
+    """
+    Generate contact names with typos and email variants like in real address books.
+    """
+    rng = random.Random(seed)
+    names = []
+    for _ in range(count):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        variant = rng.random()
+        if variant < 0.5:
+            names.append(f"{first_name} {last_name}")
+        elif variant < 0.8:
+            domain = rng.choice(["gmail.com", "web.de", "example.org"])
+            names.append(f"{first_name.lower()}.{last_name.lower()}@{domain}")
+        else:
+            name = f"{first_name} {last_name}"
+            i = rng.randrange(len(name))
+            names.append(name[:i] + rng.choice("aeinrst") + name[i + 1 :])
+    return list(enumerate(names, start=1))
+
+
+class DuplicateCandidatesTest(TestCase):
+    def test_recall(self):
+        contacts = make_contact_names(200)
+        names = dict(contacts)
+        pairs_all = set(itertools.combinations(names.keys(), 2))
+        pairs_similar = {
+            (id1, id2)
+            for id1, id2 in pairs_all
+            if get_name_similarity(names[id1], names[id2]) >= 0.8
+        }
+
+        pairs_candidate = get_candidate_pairs(contacts)
+
+        recall = len(pairs_similar & pairs_candidate) / len(pairs_similar)
+        self.assertGreaterEqual(recall, 0.95)
+        self.assertLess(len(pairs_candidate), len(pairs_all) * 0.1)
+
+    def test_most_similar(self):
+        contacts = make_contact_names(200)
+        names = dict(contacts)
+        most_similar_all = get_most_similar(
+            (id1, id2, get_name_similarity(names[id1], names[id2]))
+            for id1, id2 in itertools.combinations(names, 2)
+        )
+
+        most_similar = get_most_similar(
+            compute_duplicates(contacts, scorer=get_scorer("difflib"))
+        )
+
+        # likely duplicates are suggested like with the exhaustive comparison
+        for contact_id, similarities in most_similar_all.items():
+            for similarity, other_contact_id in similarities:
+                if similarity >= 0.8:
+                    self.assertIn(
+                        (similarity, other_contact_id), most_similar[contact_id]
+                    )
+        most_similar_first = [
+            contact_id
+            for contact_id, similarities in most_similar_all.items()
+            if most_similar.get(contact_id, [(0, None)])[0][0] == similarities[0][0]
+        ]
+        self.assertGreaterEqual(len(most_similar_first) / len(most_similar_all), 0.9)
+        # only unlikely ones, i.e. with a low similarity, are missed
+        overlaps = [
+            len(set(similarities) & set(most_similar.get(contact_id, [])))
+            / len(similarities)
+            for contact_id, similarities in most_similar_all.items()
+        ]
+        self.assertGreaterEqual(sum(overlaps) / len(overlaps), 0.75)
+
+    def test_typos_and_emails(self):
+        contacts = [
+            (1, "Peter Müller"),
+            (2, "Peter Mueller"),
+            (3, "peter.mueller@gmail.com"),
+            (4, "Petr Müller"),
+            (5, "Barbara Gamma"),
+        ]
+
+        pairs = get_candidate_pairs(contacts)
+
+        self.assertTrue({(1, 2), (1, 4), (2, 3)} <= pairs)
+        self.assertFalse({(1, 5), (3, 5)} & pairs)
+
+    def test_compute_duplicates(self):
+        duplicates = compute_duplicates([(2, "Peter Müller"), (1, "Peter Mueller")])
+
+        self.assertEqual([(c1, c2) for c1, c2, _ in duplicates], [(1, 2)])
+        self.assertGreater(duplicates[0][2], 0.8)
+
+    def test_command(self):
+        user = User.objects.create_user("peter")
+        for _, name in make_contact_names(30):
+            Contact.objects.create(user=user, name=name)
+
+        out = StringIO()
+        call_command("compute_duplicates", stdout=out)
+
+        duplicates = ContactDuplicate.objects.all()
+        self.assertGreater(len(duplicates), 0)
+        self.assertIn(f"{user}: {len(duplicates)} duplicates", out.getvalue())
+        self.assertTrue(all(d.contact_id != d.other_contact_id for d in duplicates))
+
+
+class DuplicateScorerTest(TestCase):
+    def setUp(self):
+        contacts = make_contact_names(300)
+        self.names = [name for _, name in contacts]
+        self.pairs = np.array(sorted(get_candidate_pairs(contacts))) - 1
+
+    def test_ngram(self):
+        similarities_difflib = get_scorer("difflib")(self.names, self.pairs)
+        similarities = get_scorer("ngram")(self.names, self.pairs)
+
+        self.assertLess(np.abs(similarities - similarities_difflib).mean(), 0.1)
+        self.assertGreater(np.corrcoef(similarities, similarities_difflib)[0, 1], 0.9)
+
+    def test_ngram_ranks(self):
+        contacts = make_contact_names(300)
+
+        def get_most_similar(scorer):
+            most_similar = defaultdict(dict)
+            for id1, id2, similarity in compute_duplicates(contacts, scorer=scorer):
+                most_similar[id1][id2] = most_similar[id2][id1] = similarity
+            return {
+                contact_id: set(
+                    sorted(others, key=lambda o: (-others[o], o))[
+                        :DUPLICATES_PER_CONTACT
+                    ]
+                )
+                for contact_id, others in most_similar.items()
+            }
+
+        most_similar_difflib = get_most_similar(get_scorer("difflib"))
+        most_similar = get_most_similar(get_scorer("ngram"))
+
+        # suggestions mostly agree with the exhaustive scorer
+        overlaps = [
+            len(others & most_similar.get(contact_id, set())) / len(others)
+            for contact_id, others in most_similar_difflib.items()
+        ]
+        self.assertGreater(sum(overlaps) / len(overlaps), 0.8)
+
+    def test_ngram_semantics(self):
+        names = ["Peter Müller", "peter.mueller@gmail.com", "peter.mueller@web.de"]
+        pairs = np.array([(0, 0), (1, 2), (0, 1)])
+
+        similarities = get_scorer("ngram")(names, pairs)
+
+        self.assertEqual(similarities[0], 1)
+        # same local part
+        self.assertEqual(similarities[1], 1)
+        self.assertGreater(similarities[2], 0.5)
+
+    @mock.patch("networking_base.duplicates.cpdist", None)
+    def test_rapidfuzz_missing(self):
+        with self.assertRaises(ImportError):
+            get_scorer("rapidfuzz")(self.names, self.pairs)
+
+    def test_rapidfuzz(self):
+        if cpdist is None:
+            self.skipTest("rapidfuzz is not installed")
+
+        similarities_difflib = get_scorer("difflib")(self.names, self.pairs)
+        similarities = get_scorer("rapidfuzz")(self.names, self.pairs)
+
+        self.assertLess(np.abs(similarities - similarities_difflib).mean(), 0.05)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            get_scorer("unknown")
+
+    def test_compute_duplicates(self):
+        contacts = make_contact_names(100)
+        duplicates = compute_duplicates(contacts, scorer=get_scorer("difflib"))
+
+        names = dict(contacts)
+        for contact_id, other_contact_id, similarity in duplicates[:50]:
+            # difflib is not symmetric, pairs are scored with the lower id first
+            id1, id2 = sorted([contact_id, other_contact_id])
+            self.assertEqual(similarity, get_name_similarity(names[id1], names[id2]))
+
+    def test_benchmark_command(self):
+        user = User.objects.create_user("peter")
+        for _, name in make_contact_names(50):
+            Contact.objects.create(user=user, name=name)
+
+        out = StringIO()
+        call_command(
+            "benchmark_similarity", "--scorers", "difflib", "ngram", stdout=out
+        )
+
+        self.assertIn("difflib:", out.getvalue())
+        self.assertIn("ngram:", out.getvalue())
+        self.assertIn("pairs/s", out.getvalue())
+
+
+class IncrementalDuplicatesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("peter")
+        Contact.objects.bulk_create(
+            Contact(user=self.user, name=name) for _, name in make_contact_names(200)
+        )
+        rebuild_duplicates(self.user)
+
+    def get_duplicates(self, contact_ids=None):
+        # most similar of each contact, ties broken by id like the heaps do
+        similarities = defaultdict(list)
+        for d in ContactDuplicate.objects.filter(contact__user=self.user):
+            similarity = round(d.similarity, 6)
+            similarities[d.contact_id].append((similarity, d.other_contact_id))
+            similarities[d.other_contact_id].append((similarity, d.contact_id))
+        return {
+            contact_id: sorted(contact_similarities, reverse=True)[:10]
+            for contact_id, contact_similarities in similarities.items()
+            if contact_ids is None or contact_id in contact_ids
+        }
+
+    def count_scored_pairs(self):
+        scorer = get_scorer()
+        scored = []
+
+        def scorer_counting(names, pairs):
+            scored.append(len(pairs))
+            return scorer(names, pairs)
+
+        update_duplicates(self.user, scorer_counting)
+        return sum(scored)
+
+    def test_unchanged(self):
+        self.assertEqual(update_duplicates(self.user), 0)
+
+    def test_created(self):
+        Contact.objects.create(user=self.user, name="Peter Müller")
+        Contact.objects.create(user=self.user, name="peter.mueller@gmail.com")
+
+        scored_pairs = self.count_scored_pairs()
+
+        duplicates = self.get_duplicates()
+        rebuild_duplicates(self.user)
+        self.assertEqual(duplicates, self.get_duplicates())
+        self.assertLess(scored_pairs, 200)
+
+    def test_renamed(self):
+        contact = Contact.objects.filter(user=self.user).first()
+        contact.name = "Barbara Gamma"
+        contact.save()
+
+        self.assertGreater(self.count_scored_pairs(), 0)
+
+        duplicates = self.get_duplicates([contact.id])
+        rebuild_duplicates(self.user)
+        self.assertEqual(duplicates, self.get_duplicates([contact.id]))
+
+    def test_blocking_keys(self):
+        contact = Contact.objects.create(user=self.user, name="Peter Müller")
+        update_duplicates(self.user)
+
+        keys = set(contact.blocking_keys.values_list("key", flat=True))
+        self.assertIn("t:peter", keys)
+        self.assertIn("t:müller", keys)
+
+        contact.name = "Barbara Gamma"
+        contact.save()
+        update_duplicates(self.user)
+
+        keys = set(contact.blocking_keys.values_list("key", flat=True))
+        self.assertNotIn("t:peter", keys)
+        self.assertIn("t:gamma", keys)
+
+    def test_command(self):
+        Contact.objects.create(user=self.user, name="Peter Müller")
+
+        out = StringIO()
+        call_command("compute_duplicates", "--incremental", stdout=out)
+
+        self.assertIn(f"{self.user}: 1 contacts changed", out.getvalue())
+
+
+class StreamingDuplicatesTest(TestCase):
+    def test_batches(self):
+        contacts = make_contact_names(200)
+        batch_sizes = []
+        scorer = get_scorer()
+
+        def scorer_recording(names, pairs):
+            batch_sizes.append(len(pairs))
+            return scorer(names, pairs)
+
+        duplicates = compute_duplicates(contacts)
+        with mock.patch("networking_base.duplicates.PAIRS_BATCH_SIZE", 100):
+            duplicates_batched = compute_duplicates(
+                iter(contacts), scorer=scorer_recording
+            )
+
+        self.assertEqual(sorted(duplicates), sorted(duplicates_batched))
+        self.assertGreater(len(batch_sizes), 10)
+        # a batch is flushed once a contact's pairs push it over the limit
+        self.assertLess(max(batch_sizes), 100 + len(contacts))
+        self.assertEqual(sum(batch_sizes), len(get_candidate_pairs(contacts)))
+
+    def test_most_similar(self):
+        contacts = [(i, f"Peter Müller {i}") for i in range(1, 20)]
+
+        duplicates = compute_duplicates(contacts)
+
+        # each pair once, lower id first
+        pairs = [(id1, id2) for id1, id2, _ in duplicates]
+        self.assertEqual(len(pairs), len(set(pairs)))
+        self.assertTrue(all(id1 < id2 for id1, id2 in pairs))
+        # every contact has its ten most similar, on either side of a pair
+        for contact_id, _ in contacts:
+            self.assertGreaterEqual(sum(contact_id in pair for pair in pairs), 10)
+
+    def test_progress(self):
+        progress = mock.Mock()
+
+        compute_duplicates(make_contact_names(50), progress=progress)
+
+        progress.assert_called_with(50, mock.ANY)
+
+    def test_rebuild_writes(self):
+        user = User.objects.create_user("peter")
+        Contact.objects.bulk_create(
+            Contact(user=user, name=name) for _, name in make_contact_names(100)
+        )
+
+        with mock.patch("networking_base.duplicates.WRITE_BATCH_SIZE", 200):
+            with CaptureQueriesContext(connection) as context:
+                count = rebuild_duplicates(user)
+
+        self.assertEqual(ContactDuplicate.objects.count(), count)
+        inserts = [
+            q["sql"]
+            for q in context.captured_queries
+            if q["sql"].startswith('INSERT INTO "networking_base_contactduplicate"')
+        ]
+        self.assertEqual(len(inserts), -(-count // 200))
+        self.assertEqual(
+            Contact.objects.filter(duplicates_indexed_name__isnull=True).count(), 0
+        )
+
+    def test_rebuild_writes_after_scoring(self):
+        user = User.objects.create_user("peter")
+        Contact.objects.bulk_create(
+            Contact(user=user, name=name) for _, name in make_contact_names(100)
+        )
+        scorer = get_scorer()
+        writes_while_scoring = []
+
+        with CaptureQueriesContext(connection) as context:
+
+            def scorer_recording(names, pairs):
+                writes_while_scoring.extend(
+                    q["sql"]
+                    for q in context.captured_queries
+                    if not q["sql"].startswith("SELECT")
+                )
+                return scorer(names, pairs)
+
+            rebuild_duplicates(user, scorer_recording)
+
+        # the write lock is only taken once all pairs are scored
+        self.assertEqual(writes_while_scoring, [])
+        self.assertTrue(ContactBlockingKey.objects.filter(user=user).exists())
+
+    def test_command_progress(self):
+        user = User.objects.create_user("peter")
+        for _, name in make_contact_names(30):
+            Contact.objects.create(user=user, name=name)
+
+        out = StringIO()
+        call_command("compute_duplicates", verbosity=2, stdout=out)
+
+        self.assertIn(f"{user}: 30 contacts", out.getvalue())
+        self.assertIn("pairs/s", out.getvalue())
+
+
+class ParallelDuplicatesTest(TestCase):
+    def get_duplicates(self):
+        return set(
+            ContactDuplicate.objects.values_list(
+                "contact_id", "other_contact_id", "similarity"
+            )
+        )
+
+    def test_shards(self):
+        contacts = make_contact_names(200)
+        duplicates = compute_duplicates(contacts)
+        names = dict(contacts)
+        pairs = np.array(sorted(get_candidate_pairs(contacts)))
+
+        results = [
+            compute_duplicates_shard(
+                {c: names[c] for c in np.unique(shard_pairs).tolist()},
+                shard_pairs,
+                "difflib",
+            )
+            for shard_pairs in np.array_split(pairs, 3)
+        ]
+
+        self.assertEqual(sum(pairs for _, pairs in results), len(pairs))
+        self.assertTrue(set(duplicates) <= {d for shard, _ in results for d in shard})
+
+    @mock.patch("networking_base.duplicates.SHARD_CONTACTS_MIN", 50)
+    def test_blocking_once(self):
+        user = User.objects.create_user("peter")
+        Contact.objects.bulk_create(
+            Contact(user=user, name=name) for _, name in make_contact_names(200)
+        )
+
+        with mock.patch(
+            "networking_base.duplicates.get_blocking_keys", wraps=get_blocking_keys
+        ) as get_blocking_keys_mock:
+            list(rebuild_duplicates_parallel([user], 2))
+
+        # by this process for all shards, workers only score
+        self.assertEqual(get_blocking_keys_mock.call_count, 200)
+
+    @mock.patch("networking_base.duplicates.SHARD_CONTACTS_MIN", 50)
+    def test_parallel(self):
+        users = [User.objects.create_user(name) for name in ("peter", "barbara")]
+        for user, count in zip(users, (200, 20)):
+            Contact.objects.bulk_create(
+                Contact(user=user, name=name) for _, name in make_contact_names(count)
+            )
+        for user in users:
+            rebuild_duplicates(user)
+        duplicates = self.get_duplicates()
+        ContactDuplicate.objects.all().delete()
+
+        results = list(rebuild_duplicates_parallel(users, 2))
+
+        self.assertEqual(duplicates, self.get_duplicates())
+        self.assertEqual([user for user, _, _ in results], users)
+        self.assertEqual(sum(count for _, count, _ in results), len(duplicates))
+        self.assertEqual(
+            ContactBlockingKey.objects.filter(user=users[0])
+            .values("contact")
+            .distinct()
+            .count(),
+            200,
+        )
+
+    def test_command(self):
+        user = User.objects.create_user("peter")
+        Contact.objects.bulk_create(
+            Contact(user=user, name=name) for _, name in make_contact_names(30)
+        )
+
+        out = StringIO()
+        call_command("compute_duplicates", "--processes", "2", stdout=out)
+
+        self.assertIn(
+            f"{user}: {ContactDuplicate.objects.count()} duplicates", out.getvalue()
+        )
+
+
+class QueryPlanTest(GoogleSyncTestCase):
+    """
+    Hot queries must use indexes. Without statistics, sqlite plans as if tables
+    were large, so a small seed shows the plans of a large database.
+    """
+
+    TABLES_LARGE = [
+        "networking_base_contact",
+        "networking_base_emailaddress",
+        "networking_base_interaction",
+        "networking_base_interaction_contacts",
+        "networking_base_googleemail",
+        "networking_base_googlecalendarevent",
+        "networking_base_contactinteractionstats",
+        "networking_base_contactinteractionday",
+    ]
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor != "sqlite":
+            self.skipTest("query plans are specific to sqlite")
+
+        Contact.objects.bulk_create(
+            Contact(user=self.user, name=name, frequency_in_days=7, due_at=days_ago(i))
+            for i, (_, name) in enumerate(make_contact_names(100))
+        )
+        self.contacts = list(Contact.objects.all())
+        EmailAddress.objects.bulk_create(
+            EmailAddress(contact=contact, email=f"{contact.id}@example.org")
+            for contact in self.contacts
+        )
+        Interaction.objects.bulk_create(
+            Interaction(
+                user=self.user, title="Meeting", description="", was_at=days_ago(i)
+            )
+            for i in range(300)
+        )
+        Interaction.contacts.through.objects.bulk_create(
+            Interaction.contacts.through(
+                interaction_id=interaction_id,
+                contact_id=self.contacts[i % len(self.contacts)].id,
+            )
+            for i, interaction_id in enumerate(
+                Interaction.objects.values_list("id", flat=True)
+            )
+        )
+        store_google_emails(
+            self.social_account, [make_gmail_message(f"m{i}") for i in range(100)]
+        )
+        # bulk inserts skip signals
+        rebuild_contact_interaction_stats(self.user)
+        invalidate_dashboard([self.user.id])
+
+    def get_query_plans(self, function):
+        with CaptureQueriesContext(connection) as context:
+            function()
+
+        plans = []
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                if query["sql"].startswith("SELECT"):
+                    cursor.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                    plans.append("\n".join(row[-1] for row in cursor.fetchall()))
+        return "\n".join(plans)
+
+    def assertNoFullScan(self, plan):
+        for line in plan.splitlines():
+            table = line.split(" ")[1] if line.startswith("SCAN ") else None
+            if table in self.TABLES_LARGE:
+                self.assertIn("USING", line, f"full scan of {table}")
+
+    def test_dashboard(self):
+        self.client.login(username="peter", password="secret")
+
+        plan = self.get_query_plans(lambda: self.client.get("/app/"))
+
+        self.assertIn("contact_user_due_at", plan)
+        self.assertIn("contact_stats_user_count", plan)
+        self.assertIn("contact_day_user_day", plan)
+        self.assertNoFullScan(plan)
+
+    def test_contact_detail(self):
+        self.client.login(username="peter", password="secret")
+        contact = self.contacts[0]
+
+        plan = self.get_query_plans(
+            lambda: self.client.get(f"/app/contacts/{contact.id}")
+        )
+
+        self.assertIn("interaction_contacts_contact", plan)
+        self.assertNoFullScan(plan)
+
+    def test_sync_existence_checks(self):
+        gus = GoogleUserSync(self.user, http=self.http)
+        gus.connect()
+        service = gus._build_service("gmail", "v1")
+        events = [make_calendar_event(f"e{i}") for i in range(10)]
+
+        plan = self.get_query_plans(
+            lambda: gus._fetch_gmail_messages(service, [f"m{i}" for i in range(100)])
+        )
+        plan += self.get_query_plans(
+            lambda: store_google_calendar_events(self.social_account, events)
+        )
+
+        # unique constraints are inline in sqlite, i.e. unnamed autoindexes
+        self.assertIn("(social_account_id=? AND gmail_message_id=?)", plan)
+        self.assertIn("(social_account_id=? AND google_calendar_id=?)", plan)
+        self.assertNoFullScan(plan)
+
+    def test_email_lookup(self):
+        plan = self.get_query_plans(
+            lambda: get_or_create_contact_email("1@example.org", self.user)
+        )
+
+        self.assertIn("email_address_email", plan)
+        self.assertNoFullScan(plan)
+
+
+class InteractionWeeksTest(GoogleSyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.contact = Contact.objects.create(name="Paul", user=self.user)
+
+    def get_weeks(self):
+        return {
+            (w.week, w.source): w.interaction_count
+            for w in InteractionWeek.objects.filter(user=self.user)
+        }
+
+    def get_contact_weeks(self):
+        return {
+            (w.contact_id, w.week, w.source): w.interaction_count
+            for w in ContactInteractionWeek.objects.filter(user=self.user)
+        }
+
+    def create_interaction(self, was_at):
+        interaction = Interaction.objects.create(
+            user=self.user, title="Coffee", description="", was_at=was_at
+        )
+        interaction.contacts.add(self.contact)
+        return interaction
+
+    def test_get_week(self):
+        self.assertEqual(
+            get_week(datetime(2021, 8, 15, 23, tzinfo=timezone.utc)), date(2021, 8, 9)
+        )
+        self.assertEqual(
+            get_week(datetime(2021, 8, 16, 1, tzinfo=timezone.utc)), date(2021, 8, 16)
+        )
+
+    def test_incremental(self):
+        interaction = self.create_interaction(days_ago(0))
+        self.create_interaction(days_ago(0))
+        week = get_week(days_ago(0))
+        self.assertEqual(self.get_weeks(), {(week, "manual"): 2})
+        self.assertEqual(
+            self.get_contact_weeks(), {(self.contact.id, week, "manual"): 2}
+        )
+
+        interaction.was_at = days_ago(14)
+        with CaptureQueriesContext(connection) as context:
+            interaction.save()
+        week_old = get_week(days_ago(14))
+        # weeks are adjusted, not re-counted from the interactions
+        counts = [
+            q["sql"]
+            for q in context.captured_queries
+            if "COUNT(" in q["sql"] and '"networking_base_interaction"' in q["sql"]
+        ]
+        self.assertFalse(counts)
+        self.assertEqual(
+            self.get_weeks(), {(week, "manual"): 1, (week_old, "manual"): 1}
+        )
+        self.assertEqual(
+            self.get_contact_weeks(),
+            {
+                (self.contact.id, week, "manual"): 1,
+                (self.contact.id, week_old, "manual"): 1,
+            },
+        )
+
+        interaction.delete()
+        self.assertEqual(self.get_weeks(), {(week, "manual"): 1})
+        self.assertEqual(
+            self.get_contact_weeks(), {(self.contact.id, week, "manual"): 1}
+        )
+
+    def test_source_changed(self):
+        interaction = self.create_interaction(days_ago(0))
+        self.create_interaction(days_ago(0))
+        week = get_week(days_ago(0))
+
+        interaction.source = InteractionSource.GMAIL
+        with CaptureQueriesContext(connection) as context:
+            interaction.save()
+
+        self.assertEqual(
+            self.get_contact_weeks(),
+            {
+                (self.contact.id, week, "manual"): 1,
+                (self.contact.id, week, "gmail"): 1,
+            },
+        )
+        # only the two affected buckets are adjusted
+        updates = [
+            q["sql"]
+            for q in context.captured_queries
+            if q["sql"].startswith('UPDATE "networking_base_contactinteractionweek"')
+        ]
+        self.assertEqual(len(updates), 2)
+
+    def test_sync_sources(self):
+        for i in range(3):
+            self.http.add_message(make_gmail_message(f"m{i}"))
+            self.http.set_calendar_event(make_calendar_event(f"e{i}"))
+        self.create_interaction(days_ago(0))
+
+        self.sync()
+
+        self.assertEqual(
+            set(Interaction.objects.values_list("source", flat=True)),
+            set(InteractionSource.values),
+        )
+        week = date(2021, 8, 9)
+        self.assertEqual(self.get_weeks()[week, "gmail"], 3)
+        self.assertEqual(self.get_weeks()[week, "calendar"], 3)
+
+        # incremental and deferred updates match a rebuild
+        weeks, contact_weeks = self.get_weeks(), self.get_contact_weeks()
+        rebuild_interaction_weeks(self.user)
+        self.assertEqual(self.get_weeks(), weeks)
+        self.assertEqual(self.get_contact_weeks(), contact_weeks)
+
+    def test_analytics(self):
+        self.create_interaction(days_ago(0))
+        self.create_interaction(days_ago(7))
+        self.create_interaction(days_ago(100))
+        Interaction.objects.create(
+            user=self.user, title="Alone", description="", was_at=days_ago(0)
+        )
+
+        with self.assertNumQueries(3):
+            analytics = get_interaction_analytics(self.user, weeks=4)
+
+        self.assertEqual(len(analytics["weeks"]), 4)
+        self.assertEqual(
+            analytics["weeks"][-1]["week"], get_week(days_ago(0)).isoformat()
+        )
+        self.assertEqual(analytics["weeks"][-1]["total"], 2)
+        self.assertEqual(analytics["weeks"][-2]["sources"]["manual"], 1)
+        self.assertEqual(sum(w["total"] for w in analytics["weeks"]), 3)
+        self.assertEqual(
+            analytics["contacts"],
+            [
+                {
+                    "id": self.contact.id,
+                    "name": "Paul",
+                    "total": 2,
+                    "sources": {"manual": 2, "gmail": 0, "calendar": 0},
+                }
+            ],
+        )
+
+
+class SeedDataTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("peter", "peter@gmail.com", "secret")
+
+    def insert(self, user=None, **kwargs):
+        kwargs = {"contacts": 50, "interactions": 500, "google": 0.5, **kwargs}
+        return insert_seed_data(user or self.user, batch_size=200, **kwargs)
+
+    def get_data(self, user):
+        contacts = Contact.objects.filter(user=user).order_by("id")
+        interactions = Interaction.objects.filter(user=user).order_by("id")
+        return (
+            list(contacts.values_list("name", "frequency_in_days")),
+            list(interactions.values_list("source", flat=True)),
+            Interaction.contacts.through.objects.filter(contact__user=user).count(),
+        )
+
+    def test_counts(self):
+        counts = self.insert()
+
+        self.assertEqual(counts["contacts"], Contact.objects.count())
+        self.assertEqual(counts["email_addresses"], EmailAddress.objects.count())
+        self.assertEqual(counts["interactions"], 500)
+        self.assertEqual(
+            counts["interaction_contacts"], Interaction.contacts.through.objects.count()
+        )
+        self.assertEqual(counts["google_emails"], GoogleEmail.objects.count())
+        self.assertEqual(
+            counts["google_calendar_events"], GoogleCalendarEvent.objects.count()
+        )
+        self.assertGreater(counts["google_emails"], 0)
+        self.assertGreater(counts["google_calendar_events"], 0)
+
+    def test_deterministic(self):
+        self.insert(seed=1)
+        data = self.get_data(self.user)
+        Contact.objects.all().delete()
+        Interaction.objects.all().delete()
+
+        self.insert(seed=1)
+        self.assertEqual(self.get_data(self.user), data)
+
+        other = User.objects.create_user("paul")
+        self.insert(user=other, seed=1)
+        self.assertNotEqual(self.get_data(other), data)
+
+    def test_duplicates(self):
+        self.insert(contacts=200, duplicates=0.5)
+
+        names = list(Contact.objects.values_list("name", flat=True))
+        names_reordered = [n for n in names if ", " in n]
+        self.assertGreater(len(names_reordered), 0)
+        self.assertLess(len(names_reordered), 100)
+
+    def get_denormalized(self):
+        return (
+            set(Contact.objects.values_list("id", "last_interaction_at", "due_at")),
+            set(
+                ContactInteractionStats.objects.values_list(
+                    "contact_id",
+                    "user_id",
+                    "interaction_count",
+                    "first_interaction_at",
+                    "last_interaction_at",
+                )
+            ),
+            set(
+                ContactInteractionDay.objects.values_list(
+                    "contact_id", "user_id", "day", "interaction_count"
+                )
+            ),
+            set(
+                ContactInteractionWeek.objects.values_list(
+                    "contact_id", "user_id", "week", "source", "interaction_count"
+                )
+            ),
+            set(
+                InteractionWeek.objects.values_list(
+                    "user_id", "week", "source", "interaction_count"
+                )
+            ),
+        )
+
+    def test_denormalized(self):
+        # the second time, there is data already
+        self.insert()
+        self.insert(seed=1)
+
+        self.assertFalse(Contact.objects.filter(due_at__isnull=True).exists())
+        weeks = InteractionWeek.objects.values_list("interaction_count", flat=True)
+        self.assertEqual(sum(weeks), 1000)
+        denormalized = self.get_denormalized()
+
+        for contact_ids in itertools.zip_longest(
+            *[iter(Contact.objects.values_list("id", flat=True))] * 100
+        ):
+            update_contact_interaction_dates([c for c in contact_ids if c])
+        rebuild_contact_interaction_stats(self.user)
+        rebuild_interaction_weeks(self.user)
+        self.assertEqual(self.get_denormalized(), denormalized)
+
+    def test_ids(self):
+        self.insert()
+        Contact.objects.create(user=self.user, name="Paul")
+
+        # ids continue after the seeded rows
+        counts = self.insert(seed=1)
+
+        self.assertEqual(Contact.objects.count(), 2 * counts["contacts"] + 1)
+        self.assertEqual(Interaction.objects.count(), 2 * counts["interactions"])
+        self.assertEqual(
+            Interaction.contacts.through.objects.filter(
+                interaction__user=self.user
+            ).count(),
+            Interaction.contacts.through.objects.count(),
+        )
+
+    def test_google_payloads(self):
+        self.insert()
+
+        # syncing the payloads again results in the same interactions
+        for google_email in GoogleEmail.objects.all()[:20]:
+            interaction = google_email.interaction
+            contact_ids = set(interaction.contacts.values_list("id", flat=True))
+            was_at = interaction.was_at
+
+            update_email_interaction(google_email, ignore_emails=[self.user.email])
+
+            interaction.refresh_from_db()
+            self.assertEqual(interaction.was_at, was_at)
+            self.assertEqual(
+                set(interaction.contacts.values_list("id", flat=True)), contact_ids
+            )
+
+        for event in GoogleCalendarEvent.objects.all()[:20]:
+            interaction = event.interaction
+            contact_ids = set(interaction.contacts.values_list("id", flat=True))
+
+            update_calendar_interaction(event, ignore_emails=[self.user.email])
+
+            self.assertEqual(
+                set(interaction.contacts.values_list("id", flat=True)), contact_ids
+            )
+
+    def test_command(self):
+        out = StringIO()
+        call_command(
+            "insert_seed_data",
+            "--contacts=10",
+            "--interactions=20",
+            stdout=out,
+            stderr=StringIO(),
+        )
+
+        self.assertEqual(Interaction.objects.count(), 20)
+        self.assertIn("peter: 10 contacts", out.getvalue())
+
+
+class BenchmarkTest(TestCase):
+    def test_run(self):
+        results = run_benchmarks(contacts=20, interactions=100, repeat=1)
+
+        self.assertIn("dashboard", results)
+        self.assertIn("contacts_out_of_touch", results)
+        self.assertIn("update_interactions", results)
+        self.assertIn("compute_duplicates", results)
+        for metrics in results.values():
+            self.assertEqual(set(metrics), {"seconds", "queries", "peak_memory_mb"})
+        self.assertGreater(results["update_interactions"]["queries"], 0)
+
+    def test_measure(self):
+        metrics = measure(lambda: list(User.objects.all()), repeat=2)
+
+        self.assertEqual(metrics["queries"], 1)
+        self.assertGreater(metrics["seconds"], 0)
+
+    def test_regressions(self):
+        baseline = {
+            "dashboard": {"seconds": 0.1, "queries": 10, "peak_memory_mb": 1.0},
+            "removed": {"seconds": 0.1, "queries": 10, "peak_memory_mb": 1.0},
+        }
+        results = {
+            "dashboard": {"seconds": 0.11, "queries": 20, "peak_memory_mb": 1.0},
+            "added": {"seconds": 1.0, "queries": 100, "peak_memory_mb": 10.0},
+        }
+
+        regressions = get_regressions(results, baseline, threshold=0.2)
+
+        self.assertEqual(regressions, ["dashboard: queries 20 exceeds baseline 10"])
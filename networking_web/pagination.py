@@ -0,0 +1,171 @@
+import base64
+import json
+import typing
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+CURSOR_PARAMETER = "cursor"
+
+
+class KeysetPage:
+    """
+    A page of a keyset paginated queryset.
+    Pages are addressed by cursors pointing right after or before a row,
+    so every page costs the same, no matter how deep it is.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Paginates a queryset by the values of its ordering instead of an offset.
+    The ordering must be unique, e.g. end with the primary key, and should be
+    backed by an index with the same fields.
+    """
+
+    def __init__(self, queryset, ordering: typing.Sequence[str], per_page: int):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = per_page
+
+    def get_page(self, cursor: typing.Optional[str] = None) -> KeysetPage:
+        """
+        Get the page a cursor points to.
+        :param cursor: cursor of a previous page, first page if None
+        :return: page
+        """
+        values, backwards = self.decode_cursor(cursor) if cursor else (None, False)
+        rows = list(self.get_queryset(values, backwards))
+
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage(rows)
+
+        has_next = has_more if not backwards else True
+        has_previous = has_more if backwards else values is not None
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1]) if has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], True) if has_previous else None,
+        )
+
+    def get_queryset(self, values=None, backwards=False):
+        """
+        Get the rows of a page plus one to know whether there are more.
+        :param values: values of the ordering fields to start after, see decode_cursor
+        :param backwards: whether to get the rows before the values
+        :return: queryset in page order, reversed when going backwards
+        """
+        ordering = self.ordering
+        if backwards:
+            ordering = [_reverse_ordering(field) for field in ordering]
+
+        rows = self.queryset.order_by(*ordering)
+        if values is not None:
+            try:
+                rows = rows.filter(_get_keyset_filter(ordering, values))
+            except (ValueError, TypeError, ValidationError):
+                raise Http404(f"invalid cursor values: {values}")
+        return rows[: self.per_page + 1]
+
+    def encode_cursor(self, row, backwards=False) -> str:
+        """
+        Encode an opaque cursor pointing after (or before) a row.
+        :param row: row of a page
+        :param backwards: whether the cursor points to the rows before
+        :return: cursor
+        """
+        values = [
+            self._get_field(field).value_to_string(row) for field in self.ordering
+        ]
+        data = json.dumps([values, backwards], separators=(",", ":"))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor: str) -> typing.Tuple[list, bool]:
+        """
+        Decode a cursor, see encode_cursor.
+        :param cursor: cursor
+        :return: values of the ordering fields, whether to go backwards
+        """
+        try:
+            data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            payload = json.loads(data)
+            if not isinstance(payload, list) or len(payload) != 2:
+                raise ValueError("cursor is not a list of values and direction")
+
+            values_raw, backwards = payload
+            if not isinstance(values_raw, list) or len(values_raw) != len(
+                self.ordering
+            ):
+                raise ValueError("cursor does not match the ordering")
+
+            values = [
+                self._get_field(field).to_python(value)
+                for field, value in zip(self.ordering, values_raw)
+            ]
+            if any(value is None for value in values):
+                raise ValueError("cursor contains null values")
+        except (ValueError, TypeError, AttributeError, ValidationError):
+            raise Http404(f"invalid cursor: {cursor}")
+
+        return values, bool(backwards)
+
+    def _get_field(self, field):
+        return self.queryset.model._meta.get_field(field.lstrip("-"))
+
+
+class KeysetPaginationMixin:
+    """
+    Keyset pagination for list views, ordered by keyset_ordering.
+    Use with the molecules/pagination.html template.
+    """
+
+    keyset_ordering: typing.Sequence[str] = ("id",)
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, self.keyset_ordering, page_size)
+        page = paginator.get_page(self.request.GET.get(CURSOR_PARAMETER))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+def _get_keyset_filter(ordering: typing.Sequence[str], values) -> Q:
+    # rows after the given values, e.g. (a > x) or (a = x and b > y)
+    keyset_filter = Q()
+    for i, field in reversed(list(enumerate(ordering))):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        after = Q(**{f"{name}__{lookup}": values[i]})
+        if i == len(ordering) - 1:
+            keyset_filter = after
+        else:
+            keyset_filter = after | (Q(**{name: values[i]}) & keyset_filter)
+    return keyset_filter
+
+
+def _reverse_ordering(field: str) -> str:
+    return field[1:] if field.startswith("-") else f"-{field}"
@@ -8,20 +8,39 @@ register = template.Library()
 
 @register.simple_tag
 def profile_picture_url(contact, size=50):
-    # defaults: http://en.gravatar.com/site/implement/images/
+    # memoized per contact and size, e.g. if a contact is rendered twice
+    urls = contact.__dict__.setdefault("_profile_picture_urls", {})
+    if size not in urls:
+        urls[size] = get_gravatar_url(get_profile_picture_key(contact), size)
+    return urls[size]
+
 
+def get_profile_picture_key(contact) -> str:
+    """
+    Get the key to hash for the profile picture of a contact.
+    :param contact: contact, ideally with primary_email, see with_primary_email
+    :return: primary email or contact id
+    """
     # todo chose primary email or email with image tag
-    email_o = contact.email_addresses.first()
-    if email_o:
-        email = email_o.email
+    if hasattr(contact, "primary_email"):
+        email = contact.primary_email
     else:
-        # use contact id instead of email for hashing
-        # -> results in consistent hashes and thus images
-        email = str(contact.id)
+        email_o = contact.email_addresses.first()
+        email = email_o.email if email_o else None
+
+    if email:
+        return email
 
+    # use contact id instead of email for hashing
+    # -> results in consistent hashes and thus images
+    return str(contact.id)
+
+
+def get_gravatar_url(key: str, size) -> str:
+    # defaults: http://en.gravatar.com/site/implement/images/
     gravatar_url = (
         "https://www.gravatar.com/avatar/"
-        + hashlib.md5(email.lower().encode()).hexdigest()
+        + hashlib.md5(key.lower().encode()).hexdigest()
         + "?"
     )
     gravatar_url += urlencode({"d": "robohash", "s": str(size)})
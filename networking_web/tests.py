@@ -1,7 +1,25 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.http import Http404
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-from networking_base.models import Contact
+from networking_base.models import (
+    Contact,
+    ContactDuplicate,
+    EmailAddress,
+    Interaction,
+    get_contact_duplicates,
+    get_interactions_of_selected_contacts,
+    with_primary_email,
+)
+from networking_web.pagination import KeysetPaginator
+from networking_web.templatetags.profile import profile_picture_url
 
 USER_PASSWORD = "secret"
 
@@ -34,6 +52,419 @@ class PageTest(TestCase):
             resp = self.client.get(f"/app/contacts/{contact.id}")
             self.assertEqual(resp.status_code, 200)
 
+    def test_add_touchpoint(self):
+        contact = self.contacts[0]
+        resp = self.client.get(
+            f"/app/contacts/{contact.id}/add-touchpoint", HTTP_REFERER="/app/"
+        )
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(contact.interactions.get().user, self.user)
+
     def test_interactions(self):
         resp = self.client.get("/app/interactions")
         self.assertEqual(resp.status_code, 200)
+
+    def test_dashboard_cache_stats(self):
+        cache.clear()
+        self.client.get("/app/")
+        self.client.get("/app/")
+
+        resp = self.client.get("/app/dashboard/cache-stats")
+        # staff only
+        self.assertEqual(resp.status_code, 302)
+
+        self.user.is_staff = True
+        self.user.save()
+        resp = self.client.get("/app/dashboard/cache-stats")
+        self.assertEqual(resp.json(), {"hits": 1, "misses": 1, "shared": True})
+
+
+class ContactListTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(USER_USERNAME, USER_EMAIL, USER_PASSWORD)
+        self.client.login(username=USER_USERNAME, password=USER_PASSWORD)
+
+        # one in touch, two out of touch, three hidden
+        contact = Contact.objects.create(name="A", frequency_in_days=7, user=self.user)
+        interaction = Interaction.objects.create(
+            user=self.user,
+            title="Coffee",
+            description="",
+            was_at=datetime.now().astimezone() - timedelta(days=1),
+        )
+        interaction.contacts.add(contact)
+        for name in ["B", "C"]:
+            Contact.objects.create(name=name, frequency_in_days=7, user=self.user)
+        for name in ["D", "E", "F"]:
+            Contact.objects.create(name=name, user=self.user)
+
+        # other users' contacts must not show up
+        other_user = User.objects.create_user("paul", "paul@gmail.com", "secret")
+        Contact.objects.create(name="G", frequency_in_days=7, user=other_user)
+
+    def get_names(self, url):
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return [c.name for c in resp.context["contact_list"]]
+
+    def test_counts(self):
+        resp = self.client.get("/app/contacts")
+        self.assertEqual(resp.context["selected_count"], 3)
+        self.assertEqual(resp.context["out_of_touch_count"], 2)
+        self.assertEqual(resp.context["in_touch_count"], 1)
+        self.assertEqual(resp.context["hidden_count"], 3)
+
+    def test_status_filter(self):
+        self.assertEqual(self.get_names("/app/contacts"), ["A", "B", "C"])
+        self.assertEqual(self.get_names("/app/contacts?status=2"), ["B", "C"])
+        self.assertEqual(self.get_names("/app/contacts?status=1"), ["A"])
+        self.assertEqual(self.get_names("/app/contacts?status=-1"), ["D", "E", "F"])
+
+    def test_unknown_status(self):
+        resp = self.client.get("/app/contacts?status=3")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_pagination(self):
+        for i in range(60):
+            Contact.objects.create(name=f"X{i:02}", frequency_in_days=7, user=self.user)
+
+        resp = self.client.get("/app/contacts")
+        self.assertEqual(len(resp.context["contact_list"]), 50)
+        cursor = resp.context["page_obj"].next_cursor
+        names = self.get_names(f"/app/contacts?cursor={cursor}")
+        self.assertEqual(names, ["X47"] + [f"X{i}" for i in range(48, 60)])
+
+    def test_pagination_status(self):
+        for i in range(60):
+            Contact.objects.create(name=f"X{i:02}", frequency_in_days=7, user=self.user)
+
+        resp = self.client.get("/app/contacts?status=2")
+        cursor = resp.context["page_obj"].next_cursor
+        self.assertContains(resp, f"?status=2&amp;cursor={cursor}")
+        self.assertEqual(
+            len(self.get_names(f"/app/contacts?status=2&cursor={cursor}")), 12
+        )
+
+    def test_invalid_cursor(self):
+        resp = self.client.get("/app/contacts?cursor=invalid")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_tampered_cursor(self):
+        for payload in [[["a", "x"], False], [[None, "1"], False], [["a"], False]]:
+            cursor = encode_cursor_payload(payload)
+            resp = self.client.get(f"/app/contacts?cursor={cursor}")
+            self.assertEqual(resp.status_code, 404, payload)
+
+
+class ContactDuplicatesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(USER_USERNAME, USER_EMAIL, USER_PASSWORD)
+        self.client.login(username=USER_USERNAME, password=USER_PASSWORD)
+
+        self.contacts = [
+            Contact.objects.create(name=name, user=self.user)
+            for name in ["Peter Müller", "Peter Mueller", "Petra Müller", "P. Müller"]
+        ]
+        c1, c2, c3, c4 = self.contacts
+        ContactDuplicate.objects.create(contact=c1, other_contact=c2, similarity=0.9)
+        ContactDuplicate.objects.create(contact=c2, other_contact=c3, similarity=0.8)
+        ContactDuplicate.objects.create(contact=c2, other_contact=c4, similarity=0.7)
+
+    def test_both_sides(self):
+        with self.assertNumQueries(1):
+            duplicates = get_contact_duplicates(self.contacts[1])
+            names = [contact.name for contact in duplicates]
+
+        self.assertEqual(names, ["Peter Müller", "Petra Müller", "P. Müller"])
+        self.assertEqual([d.similarity for d in duplicates], [0.9, 0.8, 0.7])
+        self.assertEqual(len(get_contact_duplicates(self.contacts[1], limit=2)), 2)
+
+    def test_pair_stored_once(self):
+        c1, c2 = self.contacts[:2]
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ContactDuplicate.objects.create(contact=c2, other_contact=c1, similarity=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ContactDuplicate.objects.create(contact=c1, other_contact=c2, similarity=1)
+
+    def test_detail(self):
+        contact = self.contacts[1]
+
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(f"/app/contacts/{contact.id}")
+
+        self.assertContains(resp, self.contacts[0].get_absolute_url())
+        self.assertContains(resp, self.contacts[3].get_absolute_url())
+        queries_duplicates = [
+            q for q in context.captured_queries if "contactduplicate" in q["sql"]
+        ]
+        self.assertEqual(len(queries_duplicates), 1)
+
+
+class InteractionListTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(USER_USERNAME, USER_EMAIL, USER_PASSWORD)
+        self.client.login(username=USER_USERNAME, password=USER_PASSWORD)
+
+        self.contacts = [
+            Contact.objects.create(name=f"C{i}", frequency_in_days=7, user=self.user)
+            for i in range(5)
+        ]
+        self.contact_hidden = Contact.objects.create(name="Hidden", user=self.user)
+
+    def create_interactions(self, count, contacts):
+        for i in range(count):
+            interaction = Interaction.objects.create(
+                user=self.user,
+                title=f"Interaction {i}",
+                description="",
+                was_at=datetime.now().astimezone() - timedelta(days=i + 1),
+            )
+            interaction.contacts.set(contacts)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_constant_queries(self):
+        self.create_interactions(2, self.contacts)
+        queries = self.count_queries("/app/interactions")
+
+        self.create_interactions(18, self.contacts)
+        self.assertEqual(self.count_queries("/app/interactions"), queries)
+
+    def test_no_duplicates(self):
+        self.create_interactions(1, self.contacts)
+        self.create_interactions(1, [self.contact_hidden])
+
+        resp = self.client.get("/app/interactions")
+
+        self.assertEqual(len(resp.context["interaction_list"]), 1)
+        self.assertContains(resp, "and 2 others...")
+
+    def test_pagination(self):
+        self.create_interactions(25, self.contacts[:1])
+
+        resp = self.client.get("/app/interactions")
+        self.assertEqual(len(resp.context["interaction_list"]), 20)
+        self.assertFalse(resp.context["page_obj"].has_previous())
+        cursor = resp.context["page_obj"].next_cursor
+        resp = self.client.get(f"/app/interactions?cursor={cursor}")
+        self.assertEqual(len(resp.context["interaction_list"]), 5)
+        self.assertFalse(resp.context["page_obj"].has_next())
+
+    def test_tampered_cursor(self):
+        for payload in [[["garbage", "1"], False], [[None, "1"], False]]:
+            cursor = encode_cursor_payload(payload)
+            resp = self.client.get(f"/app/interactions?cursor={cursor}")
+            self.assertEqual(resp.status_code, 404, payload)
+
+    def test_contact_detail(self):
+        self.create_interactions(1, self.contacts[:2])
+        queries = self.count_queries(f"/app/contacts/{self.contacts[0].id}")
+
+        self.create_interactions(4, self.contacts[:2])
+        self.assertEqual(
+            self.count_queries(f"/app/contacts/{self.contacts[0].id}"), queries
+        )
+
+
+class ProfilePictureTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(USER_USERNAME, USER_EMAIL, USER_PASSWORD)
+        self.client.login(username=USER_USERNAME, password=USER_PASSWORD)
+
+    def create_contacts(self, count):
+        for i in range(count):
+            contact = Contact.objects.create(
+                name=f"C{i}",
+                frequency_in_days=7,
+                last_interaction_at=datetime.now().astimezone() - timedelta(days=30),
+                user=self.user,
+            )
+            Interaction.objects.create(
+                user=self.user,
+                title="Meeting",
+                description="",
+                was_at=datetime.now().astimezone() - timedelta(days=30),
+            ).contacts.set([contact])
+            EmailAddress.objects.create(contact=contact, email=f"c{i}@example.org")
+            EmailAddress.objects.create(contact=contact, email=f"c{i}@example.com")
+
+    def get_email_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith('SELECT "networking_base_emailaddress"')
+        ]
+
+    def test_no_email_queries(self):
+        self.create_contacts(10)
+
+        self.assertEqual(self.get_email_queries("/app/"), [])
+        self.assertEqual(self.get_email_queries("/app/contacts"), [])
+
+    def test_primary_email(self):
+        self.create_contacts(1)
+        contact_plain = Contact.objects.get()
+        contact = with_primary_email(Contact.objects.all()).get()
+
+        with self.assertNumQueries(0):
+            url = profile_picture_url(contact)
+        self.assertEqual(url, profile_picture_url(contact_plain))
+
+    def test_without_email(self):
+        contact = Contact.objects.create(name="No email", user=self.user)
+        contact = with_primary_email(Contact.objects.all()).get()
+
+        self.assertIsNone(contact.primary_email)
+        self.assertEqual(
+            profile_picture_url(contact),
+            profile_picture_url(Contact.objects.get(id=contact.id)),
+        )
+
+    def test_memoized(self):
+        self.create_contacts(1)
+        contact = Contact.objects.get()
+
+        with self.assertNumQueries(1):
+            url = profile_picture_url(contact, size=200)
+            self.assertEqual(profile_picture_url(contact, size=200), url)
+        self.assertNotEqual(profile_picture_url(contact), url)
+
+
+class InteractionAnalyticsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(USER_USERNAME, USER_EMAIL, USER_PASSWORD)
+        self.client.login(username=USER_USERNAME, password=USER_PASSWORD)
+
+        contact = Contact.objects.create(name="Paul", user=self.user)
+        for i in range(5):
+            interaction = Interaction.objects.create(
+                user=self.user,
+                title=f"Interaction {i}",
+                description="",
+                was_at=datetime.now().astimezone() - timedelta(days=i),
+            )
+            interaction.contacts.set([contact])
+
+    def test_analytics(self):
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get("/app/interactions/analytics?weeks=8")
+
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(len(data["weeks"]), 8)
+        self.assertEqual(sum(week["total"] for week in data["weeks"]), 5)
+        self.assertEqual(data["contacts"][0]["name"], "Paul")
+        self.assertEqual(data["contacts"][0]["sources"]["manual"], 5)
+
+        # served from rollups
+        queries_interactions = [
+            query
+            for query in context.captured_queries
+            if '"networking_base_interaction"' in query["sql"]
+            or '"networking_base_interaction_contacts"' in query["sql"]
+        ]
+        self.assertEqual(queries_interactions, [])
+
+    def test_invalid_weeks(self):
+        resp = self.client.get("/app/interactions/analytics?weeks=0")
+        self.assertEqual(resp.status_code, 404)
+
+
+class KeysetPaginatorTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(USER_USERNAME, USER_EMAIL, USER_PASSWORD)
+        contact = Contact.objects.create(name="A", frequency_in_days=7, user=self.user)
+
+        # several interactions at the same time, ties are broken by id
+        now = datetime.now().astimezone()
+        for i in range(23):
+            interaction = Interaction.objects.create(
+                user=self.user,
+                title=f"Interaction {i}",
+                description="",
+                was_at=now - timedelta(days=i // 3),
+            )
+            interaction.contacts.add(contact)
+        self.paginator = KeysetPaginator(
+            Interaction.objects.all(), ("-was_at", "-id"), per_page=5
+        )
+        self.ids = list(
+            Interaction.objects.order_by("-was_at", "-id").values_list("id", flat=True)
+        )
+
+    def test_forward_and_back(self):
+        pages = [self.paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(self.paginator.get_page(pages[-1].next_cursor))
+
+        self.assertEqual([i.id for page in pages for i in page], self.ids)
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+
+        page = pages[-1]
+        ids_back = []
+        while page.has_previous():
+            page = self.paginator.get_page(page.previous_cursor)
+            ids_back = [i.id for i in page] + ids_back
+        self.assertEqual(ids_back, self.ids[:20])
+
+    def test_no_offset(self):
+        page = self.paginator.get_page()
+        for _ in range(3):
+            page = self.paginator.get_page(page.next_cursor)
+
+        with CaptureQueriesContext(connection) as context:
+            self.paginator.get_page(page.next_cursor)
+
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotIn("OFFSET", context.captured_queries[0]["sql"])
+
+    def test_index(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("query plan is specific to sqlite")
+
+        interactions = get_interactions_of_selected_contacts(self.user)
+        paginator = KeysetPaginator(interactions, ("-was_at", "-id"), per_page=5)
+        values, _ = paginator.decode_cursor(paginator.get_page().next_cursor)
+
+        plan = paginator.get_queryset(values).explain()
+
+        self.assertIn("interaction_user_was_at", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_invalid_cursor(self):
+        for cursor in ["invalid", "W1tdLGZhbHNlXQ", "WyJhIl0"]:
+            with self.assertRaises(Http404):
+                self.paginator.get_page(cursor)
+
+    def test_tampered_cursor(self):
+        payloads = [
+            [["garbage", "1"], False],
+            [[None, "1"], False],
+            [["2021-01-01T00:00:00+00:00", None], False],
+            [["2021-01-01T00:00:00+00:00", "1"], False, "extra"],
+            [["2021-01-01T00:00:00+00:00", "1", "2"], False],
+            {"values": [], "backwards": False},
+            "string",
+            None,
+        ]
+        for payload in payloads:
+            with self.subTest(payload=payload), self.assertRaises(Http404):
+                self.paginator.get_page(encode_cursor_payload(payload))
+
+    def test_invalid_values(self):
+        with self.assertRaises(Http404):
+            self.paginator.get_queryset([None, 1])
+
+
+def encode_cursor_payload(payload) -> str:
+    # like KeysetPaginator.encode_cursor, but with any payload
+    data = json.dumps(payload).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
@@ -6,6 +6,11 @@ app_name = "networking_web"
 
 urlpatterns = [
     path("", views.index, name="index"),
+    path(
+        "dashboard/cache-stats",
+        views.dashboard_cache_stats,
+        name="dashboard-cache-stats",
+    ),
     # interactions
     path(
         "interactions",
@@ -17,6 +22,11 @@ urlpatterns = [
         views.InteractionCreateView.as_view(),
         name="interaction-create",
     ),
+    path(
+        "interactions/analytics",
+        views.interaction_analytics,
+        name="interaction-analytics",
+    ),
     # contacts
     path("contacts", views.ContactListView.as_view(), name="contact-overview"),
     path("contacts/create", views.ContactCreateView.as_view(), name="contact-create"),
@@ -1,9 +1,10 @@
-from collections import defaultdict
+import typing
 from datetime import datetime
 
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render
 from django.urls import reverse
 from django.views.generic import (
@@ -15,17 +16,27 @@ from django.views.generic import (
 )
 from pytz import UTC
 
+from networking_base.analytics import ANALYTICS_WEEKS_DEFAULT, get_interaction_analytics
+from networking_base.dashboard import (
+    get_dashboard_cache_stats,
+    get_dashboard_contacts,
+    is_dashboard_cache_shared,
+)
+from networking_base.duplicates import DUPLICATES_PER_CONTACT
 from networking_base.models import (
     Contact,
-    ContactDuplicate,
     ContactStatus,
     EmailAddress,
     Interaction,
-    get_due_contacts,
-    get_frequent_contacts,
-    get_recent_contacts,
+    get_contact_duplicates,
+    get_contact_status_counts,
+    get_contact_status_filter,
+    get_interactions_of_selected_contacts,
+    with_interaction_contacts,
+    with_primary_email,
 )
 from networking_web.forms import InteractionForm
+from networking_web.pagination import KeysetPaginationMixin
 
 CONTACT_FIELDS_DEFAULT = [
     "name",
@@ -35,43 +46,49 @@ CONTACT_FIELDS_DEFAULT = [
     "twitter_url",
 ]
 
+DUE_CONTACTS_PER_PAGE = 20
+
+ANALYTICS_WEEKS_MAX = 520
+
 
-class ContactListView(LoginRequiredMixin, ListView):
+class ContactListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Contact
     template_name = "web/_atomic/pages/contacts-overview.html"
-    ordering = "name"
+    keyset_ordering = ("name", "id")
+    paginate_by = 50
+
+    def get_status(self) -> typing.Optional[ContactStatus]:
+        status_raw = self.request.GET.get("status")
+        if not status_raw:
+            return None
+
+        try:
+            return ContactStatus(int(status_raw))
+        except ValueError:
+            raise Http404(f"unknown status: {status_raw}")
+
+    def get_queryset(self):
+        contacts = with_primary_email(
+            super().get_queryset().filter(user=self.request.user)
+        )
+
+        status = self.get_status()
+        if status:
+            return contacts.filter(get_contact_status_filter(status))
+
+        # only show selected
+        return contacts.filter(due_at__isnull=False)
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
 
-        contacts = context["contact_list"]
-        contacts_by_status = defaultdict(list)
-        for contact in contacts:
-            contacts_by_status[contact.get_status()].append(contact)
-
         # add counts
-        contact_counts = {
-            "selected": len([c for c in contacts if c.frequency_in_days]),
-            "out_of_touch": len(contacts_by_status.get(ContactStatus.OUT_OF_TOUCH, [])),
-            "in_touch": len(contacts_by_status.get(ContactStatus.IN_TOUCH, [])),
-            "hidden": len(contacts_by_status.get(ContactStatus.HIDDEN, [])),
-        }
+        contact_counts = get_contact_status_counts(self.request.user)
         context.update({k + "_count": v for k, v in contact_counts.items()})
 
-        # filter status
-        status = None
-        status_raw = self.request.GET.get("status", None)
-        if status_raw:
-            # get status enum
-            status = ContactStatus(int(self.request.GET.get("status")))
-
-            # re-filter contacts
-            context["contact_list"] = list(
-                filter(lambda c: c.get_status() == status, contacts)
-            )
-        else:
-            # only show selected
-            context["contact_list"] = [c for c in contacts if c.frequency_in_days]
+        # keep status when paginating
+        status = self.get_status()
+        context["pagination_query"] = f"status={status.value}&" if status else ""
 
         return context
 
@@ -82,10 +99,12 @@ class ContactDetailView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["interactions"] = context["object"].interactions.order_by("-was_at")
-        context["duplicates"] = ContactDuplicate.objects.filter(
-            contact=context["object"]
-        ).order_by("-similarity")
+        context["interactions"] = with_interaction_contacts(
+            context["object"].interactions.order_by("-was_at")
+        )
+        context["duplicates"] = get_contact_duplicates(
+            context["object"], limit=DUPLICATES_PER_CONTACT
+        )
         return context
 
 
@@ -152,19 +171,14 @@ class EmailListView(LoginRequiredMixin, ListView):
         return context
 
 
-class InteractionListView(LoginRequiredMixin, ListView):
+class InteractionListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Interaction
     template_name = "web/_atomic/pages/interactions-overview.html"
+    keyset_ordering = ("-was_at", "-id")
+    paginate_by = 20
 
     def get_queryset(self):
-        return Interaction.objects.filter(
-            # owned by user
-            user=self.request.user,
-            # past interactions only
-            was_at__lt=datetime.now().astimezone(),
-            # of contacts that are selected
-            contacts__frequency_in_days__isnull=False,
-        ).order_by("-was_at")
+        return get_interactions_of_selected_contacts(self.request.user)
 
 
 class InteractionCreateView(LoginRequiredMixin, CreateView):
@@ -192,18 +206,33 @@ class InteractionCreateView(LoginRequiredMixin, CreateView):
 @login_required
 def index(request):
     user = request.user
-    contacts = get_due_contacts(user)
-    contacts_frequent = get_frequent_contacts(user)
-    contacts_recent = get_recent_contacts(user)
+
+    page_raw = request.GET.get("page", "")
+    page = max(int(page_raw), 1) if page_raw.isdigit() else 1
+    dashboard = get_dashboard_contacts(user, page, per_page=DUE_CONTACTS_PER_PAGE)
 
     return render(
         request,
         "web/_atomic/pages/dashboard.html",
-        {
-            "contacts": contacts,
-            "contacts_frequent": contacts_frequent,
-            "contacts_recent": contacts_recent,
-        },
+        {"page": page, **dashboard},
+    )
+
+
+@login_required
+def interaction_analytics(request):
+    weeks_raw = request.GET.get("weeks", "")
+    weeks = int(weeks_raw) if weeks_raw.isdigit() else ANALYTICS_WEEKS_DEFAULT
+    if not 1 <= weeks <= ANALYTICS_WEEKS_MAX:
+        raise Http404(f"weeks must be between 1 and {ANALYTICS_WEEKS_MAX}")
+
+    return JsonResponse(get_interaction_analytics(request.user, weeks=weeks))
+
+
+@staff_member_required
+def dashboard_cache_stats(request):
+    # counted by the processes sharing the cache, see CACHES
+    return JsonResponse(
+        {**get_dashboard_cache_stats(), "shared": is_dashboard_cache_shared()}
     )
 
 
@@ -211,12 +240,13 @@ def index(request):
 def add_touchpoint(request, contact_id):
     contact = Contact.objects.get(pk=contact_id)
     assert contact.user == request.user
-    Interaction.objects.create(
+    interaction = Interaction.objects.create(
+        user=request.user,
         was_at=datetime.now(tz=UTC),
-        contact=contact,
         title="Interaction",
         description="...",
     )
+    interaction.contacts.add(contact)
     return redirect_back(request)
 
 